@@ -0,0 +1,3 @@
+"""
+Benchmarks de rendimiento del sistema RAG (arranque, extracción de documentos).
+"""
@@ -0,0 +1,164 @@
+"""
+Benchmark de extracción de texto de Word y PowerPoint.
+
+Compara la lectura directa del zip (``rag.ooxml``) con python-docx y
+python-pptx. Genera documentos sintéticos con párrafos, tablas, formas
+agrupadas y notas del orador, procesa cada uno en un proceso nuevo (para
+que el pico de memoria de un método no se mezcle con el de otro) y mide el
+rendimiento y el pico de memoria residente.
+
+Uso:
+    python -m benchmarks.extraction [--paragraphs 20000] [--slides 500] [--repeat 3]
+
+Requiere python-docx y python-pptx para generar los documentos.
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Any, Dict
+
+from benchmarks.procesos import ejecutar_trabajador, medir_en_proceso, rss_mb
+
+TIPOS = {
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+
+TEXTO = ("El trabajo práctico se entrega en el aula virtual antes de la fecha indicada "
+         "en el cronograma de la materia. ")
+
+
+def generar_docx(ruta: str, parrafos: int):
+    """
+    Genera un documento Word con párrafos y una tabla cada 100 párrafos.
+
+    Args:
+        ruta: Archivo de destino
+        parrafos: Cantidad de párrafos
+    """
+    import docx
+
+    documento = docx.Document()
+    for i in range(parrafos):
+        documento.add_paragraph(f"{i}. {TEXTO * 3}")
+        if i % 100 == 99:
+            tabla = documento.add_table(rows=5, cols=3)
+            for fila in tabla.rows:
+                for celda in fila.cells:
+                    celda.text = f"Celda {i}"
+    documento.save(ruta)
+
+
+def generar_pptx(ruta: str, diapositivas: int):
+    """
+    Genera una presentación con título, cuerpo, un grupo de formas, una tabla y notas.
+
+    Args:
+        ruta: Archivo de destino
+        diapositivas: Cantidad de diapositivas
+    """
+    import pptx
+    from pptx.util import Inches
+
+    presentacion = pptx.Presentation()
+    for i in range(diapositivas):
+        diapositiva = presentacion.slides.add_slide(presentacion.slide_layouts[1])
+        diapositiva.shapes.title.text = f"Unidad {i}"
+        diapositiva.placeholders[1].text = TEXTO * 2
+        grupo = diapositiva.shapes.add_group_shape()
+        for j in range(3):
+            caja = grupo.shapes.add_textbox(Inches(j), Inches(5), Inches(1), Inches(1))
+            caja.text_frame.text = f"Nota al margen {i}.{j}"
+        tabla = diapositiva.shapes.add_table(4, 3, Inches(1), Inches(3), Inches(6), Inches(1)).table
+        for fila in tabla.rows:
+            for celda in fila.cells:
+                celda.text = f"Dato {i}"
+        diapositiva.notes_slide.notes_text_frame.text = f"Notas del orador {i}: {TEXTO}"
+    presentacion.save(ruta)
+
+
+def trabajador(tipo: str, ruta: str, rapido: bool, repeticiones: int) -> Dict[str, Any]:
+    """
+    Extrae el texto de un documento varias veces y mide tiempo y memoria.
+
+    Args:
+        tipo: 'docx' o 'pptx'
+        ruta: Documento a procesar
+        rapido: Usar la lectura directa del zip
+        repeticiones: Veces que se procesa el documento (se informa la mejor)
+
+    Returns:
+        Diccionario con 'seconds', 'chars', 'rss_mb' y 'rss_extra_mb'
+    """
+    from rag.document_processor import DocumentProcessor, _modulo
+
+    procesador = DocumentProcessor(fast_ooxml=rapido)
+    if not rapido:
+        # La importación de la biblioteca no cuenta como memoria de la extracción
+        _modulo('docx' if tipo == 'docx' else 'pptx')
+    base = rss_mb()
+    mejor = float('inf')
+    caracteres = 0
+    for _ in range(repeticiones):
+        with open(ruta, 'rb') as archivo:
+            inicio = time.perf_counter()
+            texto, _ = procesador.process_document(archivo, TIPOS[tipo], os.path.basename(ruta))
+            mejor = min(mejor, time.perf_counter() - inicio)
+        caracteres = len(texto)
+        del texto
+    pico = rss_mb()
+    return {'seconds': mejor, 'chars': caracteres, 'rss_mb': pico, 'rss_extra_mb': pico - base}
+
+
+def medir(tipo: str, ruta: str, rapido: bool, repeticiones: int) -> Dict[str, Any]:
+    """
+    Ejecuta ``trabajador`` en un proceso nuevo.
+
+    Args:
+        tipo: 'docx' o 'pptx'
+        ruta: Documento a procesar
+        rapido: Usar la lectura directa del zip
+        repeticiones: Veces que se procesa el documento
+
+    Returns:
+        Resultado de ``trabajador``
+    """
+    return medir_en_proceso('benchmarks.extraction', tipo, ruta, '1' if rapido else '0', str(repeticiones))
+
+
+def main():
+    """Ejecuta el benchmark e informa el resultado."""
+    if ejecutar_trabajador(lambda tipo, ruta, rapido, repeticiones:
+                           trabajador(tipo, ruta, rapido == '1', int(repeticiones))):
+        return
+
+    parser = argparse.ArgumentParser(description="Extracción de Word y PowerPoint: zip directo frente a python-docx/python-pptx")
+    parser.add_argument('--paragraphs', type=int, default=20000,
+                        help='Párrafos del documento Word sintético')
+    parser.add_argument('--slides', type=int, default=500,
+                        help='Diapositivas de la presentación sintética')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Repeticiones por método (se informa la mejor)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        documentos = {'docx': os.path.join(directorio, 'documento.docx'),
+                      'pptx': os.path.join(directorio, 'presentacion.pptx')}
+        print("Generando documentos sintéticos...")
+        generar_docx(documentos['docx'], args.paragraphs)
+        generar_pptx(documentos['pptx'], args.slides)
+
+        print(f"{'Documento':<20}{'Método':<14}{'MB/s':>8}{'Segundos':>10}{'Caracteres':>12}"
+              f"{'RSS pico':>11}{'RSS extra':>11}")
+        for tipo, ruta in documentos.items():
+            mb = os.path.getsize(ruta) / 1024 / 1024
+            for rapido, metodo in ((True, 'ooxml'), (False, f'python-{tipo}')):
+                r = medir(tipo, ruta, rapido, args.repeat)
+                print(f"{f'{tipo} ({mb:.1f} MB)':<20}{metodo:<14}{mb / r['seconds']:>8.1f}"
+                      f"{r['seconds']:>10.2f}{r['chars']:>12}"
+                      f"{r['rss_mb']:>8.0f} MB{r['rss_extra_mb']:>8.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
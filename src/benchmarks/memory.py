@@ -0,0 +1,339 @@
+"""
+Benchmark del pico de memoria de la indexación según el tamaño del documento.
+
+Indexa documentos Word, de texto y PDF (con capa de texto y escaneados,
+que pasan por OCR) sintéticos de tamaño creciente con el camino por partes (``CourseIndexer.index_file``: ``iter_document`` →
+``iter_chunks`` → embeddings → upserts por lotes) y con el camino que arma
+el texto completo (``process_document`` + ``index_document``). Cada
+medición corre en un proceso nuevo. El ``VectorStore`` es el real, pero
+se crea con un cliente de Qdrant que descarta los puntos y con un
+adaptador HTTP que responde los embeddings de Ollama sin red, para medir
+solo la memoria del recorrido entre el extractor y el upsert. Sin el
+ejecutable de tesseract el reconocimiento de cada página falla, pero se
+mide el resto del recorrido de OCR (lectura de imágenes, claves de la
+caché, rasterizado si hay pdf2image).
+
+Uso:
+    python -m benchmarks.memory [--paragraphs 2500 10000 40000] [--text-mb 2 8 32]
+        [--pdf-pages 200 800 3200] [--scanned-pages 20 80 320] [--tolerance-mb 16]
+
+Sale con código 1 si el pico de memoria del camino por partes crece con el
+tamaño del documento más que la tolerancia.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+from types import SimpleNamespace
+from typing import Any, Dict, List
+from xml.sax.saxutils import escape
+
+from benchmarks.extraction import TEXTO
+from benchmarks.procesos import ejecutar_trabajador, medir_en_proceso, rss_mb
+
+TIPOS = {
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'txt': 'text/plain',
+    'pdf': 'application/pdf',
+    'pdf-ocr': 'application/pdf',
+}
+
+_DOCX_TIPOS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.'
+    'wordprocessingml.document.main+xml"/></Types>'
+)
+_DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+    'officeDocument" Target="word/document.xml"/></Relationships>'
+)
+
+
+def generar_docx(ruta: str, parrafos: int):
+    """
+    Genera un documento Word mínimo escribiendo el XML directamente.
+
+    python-docx tarda demasiado en armar documentos de decenas de miles de
+    párrafos; para este benchmark alcanza con ``word/document.xml``.
+
+    Args:
+        ruta: Archivo de destino
+        parrafos: Cantidad de párrafos
+    """
+    with zipfile.ZipFile(ruta, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _DOCX_TIPOS)
+        zf.writestr('_rels/.rels', _DOCX_RELS)
+        with zf.open('word/document.xml', 'w') as parte:
+            parte.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<w:document xmlns:w="http://schemas.openxmlformats.org/'
+                        b'wordprocessingml/2006/main"><w:body>')
+            for i in range(parrafos):
+                parte.write(f'<w:p><w:r><w:t>{i}. {escape(TEXTO * 3)}</w:t></w:r></w:p>'.encode('utf-8'))
+            parte.write(b'</w:body></w:document>')
+
+
+def generar_texto(ruta: str, megabytes: float):
+    """
+    Genera un archivo de texto plano.
+
+    Args:
+        ruta: Archivo de destino
+        megabytes: Tamaño aproximado
+    """
+    linea = (TEXTO * 4 + '\n').encode('utf-8')
+    with open(ruta, 'wb') as archivo:
+        for _ in range(int(megabytes * 1024 * 1024 / len(linea))):
+            archivo.write(linea)
+
+
+class QdrantSumidero:
+    """
+    Cliente de Qdrant sin servidor que solo cuenta los puntos recibidos
+    """
+    def __init__(self):
+        self.puntos = 0
+
+    def get_collections(self):
+        return SimpleNamespace(collections=[])
+
+    def create_collection(self, **kwargs):
+        pass
+
+    def create_payload_index(self, **kwargs):
+        pass
+
+    def count(self, **kwargs):
+        return SimpleNamespace(count=0)
+
+    def upsert(self, collection_name, points, **kwargs):
+        self.puntos += len(points)
+
+    def set_payload(self, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+
+class EmbeddingsSinRed:
+    """
+    Sustituto del archivo de grabación (``FixtureArchive``) que responde los
+    embeddings de Ollama sin red, con un vector constante
+    """
+    def __init__(self, dimension: int = 768):
+        self.cuerpo = json.dumps({'embedding': [0.5] * dimension}).encode()
+
+    def requests_adapter(self, **kwargs):
+        """Crea el adaptador de ``requests`` que monta ``VectorStore``."""
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        cuerpo = self.cuerpo
+
+        class Adaptador(HTTPAdapter):
+            def send(self, request, **kwargs):
+                respuesta = requests.Response()
+                respuesta.status_code = 200
+                respuesta.headers['Content-Type'] = 'application/json'
+                respuesta._content = cuerpo
+                respuesta.request = request
+                respuesta.url = request.url
+                return respuesta
+
+        return Adaptador(**kwargs)
+
+
+def generar_pdf(ruta: str, paginas: int, escaneado: bool = False):
+    """
+    Genera un PDF escribiendo los objetos directamente, página por página.
+
+    Las páginas de texto tienen 40 líneas; las escaneadas solo una imagen
+    en escala de grises (distinta en cada página) y ninguna capa de texto,
+    así que pasan por OCR.
+
+    Args:
+        ruta: Archivo de destino
+        paginas: Cantidad de páginas
+        escaneado: Generar páginas con una imagen en lugar de texto
+    """
+    desplazamientos: Dict[int, int] = {}
+
+    with open(ruta, 'wb') as archivo:
+        def objeto(numero: int, cuerpo: bytes, flujo: bytes = b''):
+            desplazamientos[numero] = archivo.tell()
+            archivo.write(f'{numero} 0 obj\n'.encode() + cuerpo)
+            if flujo:
+                archivo.write(b'\nstream\n' + flujo + b'\nendstream')
+            archivo.write(b'\nendobj\n')
+
+        archivo.write(b'%PDF-1.4\n')
+        # 1: catálogo, 2: árbol de páginas, 3: fuente; cada página usa 3 objetos desde el 4
+        kids = ' '.join(f'{4 + 3 * i} 0 R' for i in range(paginas))
+        objeto(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        objeto(2, f'<< /Type /Pages /Kids [{kids}] /Count {paginas} >>'.encode())
+        objeto(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+        for i in range(paginas):
+            pagina, contenido, recurso = 4 + 3 * i, 5 + 3 * i, 6 + 3 * i
+            if escaneado:
+                recursos = f'<< /XObject << /Im0 {recurso} 0 R >> >>'
+                flujo = b'q 612 0 0 792 0 0 cm /Im0 Do Q'
+                pixeles = zlib.compress(bytes((i + x) % 256 for x in range(200 * 100)))
+                objeto(recurso, f'<< /Type /XObject /Subtype /Image /Width 200 /Height 100 '
+                                f'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode '
+                                f'/Length {len(pixeles)} >>'.encode(), pixeles)
+            else:
+                recursos = '<< /Font << /F1 3 0 R >> >>'
+                lineas = ''.join(f'({i}.{j} {TEXTO}) Tj 0 -16 Td '.replace('á', 'a').replace('í', 'i')
+                                 for j in range(40))
+                flujo = f'BT /F1 9 Tf 40 760 Td {lineas}ET'.encode('latin-1')
+                objeto(recurso, b'null')
+            objeto(pagina, f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                           f'/Resources {recursos} /Contents {contenido} 0 R >>'.encode())
+            objeto(contenido, f'<< /Length {len(flujo)} >>'.encode(), flujo)
+
+        inicio_xref = archivo.tell()
+        archivo.write(f'xref\n0 {len(desplazamientos) + 1}\n0000000000 65535 f \n'.encode())
+        for numero in range(1, len(desplazamientos) + 1):
+            archivo.write(f'{desplazamientos[numero]:010d} 00000 n \n'.encode())
+        archivo.write(f'trailer\n<< /Size {len(desplazamientos) + 1} /Root 1 0 R >>\n'
+                      f'startxref\n{inicio_xref}\n%%EOF\n'.encode())
+
+
+def _almacen_sin_red():
+    """
+    Crea un VectorStore cuyos embeddings y upserts no salen del proceso.
+
+    Returns:
+        VectorStore con un sumidero en lugar de Qdrant y embeddings sin red
+    """
+    from rag.vector_store import VectorStore
+
+    return VectorStore('localhost', 6333, 'benchmark', ollama_url='http://ollama.invalid',
+                       fixtures=EmbeddingsSinRed(), client=QdrantSumidero())
+
+
+def trabajador(tipo: str, ruta: str, modo: str) -> Dict[str, Any]:
+    """
+    Indexa un documento y mide tiempo y memoria.
+
+    Args:
+        tipo: 'docx', 'txt', 'pdf' o 'pdf-ocr' (PDF escaneado, con OCR)
+        ruta: Documento a indexar
+        modo: 'stream' (por partes) o 'full' (texto completo)
+
+    Returns:
+        Diccionario con 'seconds', 'chunks', 'rss_mb' y 'rss_extra_mb'
+    """
+    from rag.document_processor import DocumentProcessor
+    from rag.indexer import CourseIndexer
+    from rag.ocr import PageOCR
+
+    procesador = DocumentProcessor(ocr=PageOCR(workers=2) if tipo == 'pdf-ocr' else None)
+    # Sin tesseract las páginas escaneadas no producen texto (solo los saltos entre páginas)
+    sin_ocr = tipo == 'pdf-ocr' and shutil.which('tesseract') is None
+    esperados = ('indexed', 'empty') if sin_ocr else ('indexed',)
+    almacen = _almacen_sin_red()
+    indexador = CourseIndexer(None, None, procesador, almacen)
+    nombre = os.path.basename(ruta)
+    base = rss_mb()
+    inicio = time.perf_counter()
+    with open(ruta, 'rb') as archivo:
+        if modo == 'stream':
+            resultado = indexador.index_file(archivo, TIPOS[tipo], {'filename': nombre})
+            if resultado not in esperados:
+                raise RuntimeError(f"La indexación de {nombre} terminó con '{resultado}'")
+        else:
+            texto, metadata = procesador.process_document(archivo, TIPOS[tipo], nombre)
+            almacen.index_document(texto, metadata)
+    segundos = time.perf_counter() - inicio
+    pico = rss_mb()
+    return {'seconds': segundos, 'chunks': almacen.client.puntos, 'rss_mb': pico, 'rss_extra_mb': pico - base}
+
+
+def medir(tipo: str, ruta: str, modo: str) -> Dict[str, Any]:
+    """
+    Ejecuta ``trabajador`` en un proceso nuevo.
+
+    Args:
+        tipo: 'docx', 'txt', 'pdf' o 'pdf-ocr'
+        ruta: Documento a indexar
+        modo: 'stream' o 'full'
+
+    Returns:
+        Resultado de ``trabajador``
+    """
+    return medir_en_proceso('benchmarks.memory', tipo, ruta, modo)
+
+
+def main():
+    """Ejecuta el benchmark e informa el resultado."""
+    if ejecutar_trabajador(trabajador):
+        return
+
+    parser = argparse.ArgumentParser(description="Pico de memoria de la indexación según el tamaño del documento")
+    parser.add_argument('--paragraphs', type=int, nargs='+', default=[2500, 10000, 40000],
+                        help='Párrafos de cada documento Word sintético')
+    parser.add_argument('--text-mb', type=float, nargs='+', default=[2, 8, 32],
+                        help='Tamaño en MB de cada archivo de texto sintético')
+    parser.add_argument('--pdf-pages', type=int, nargs='+', default=[200, 800, 3200],
+                        help='Páginas de cada PDF sintético con capa de texto')
+    parser.add_argument('--scanned-pages', type=int, nargs='+', default=[20, 80, 320],
+                        help='Páginas de cada PDF sintético escaneado (pasan por OCR)')
+    parser.add_argument('--tolerance-mb', type=float, default=16,
+                        help='Crecimiento máximo admitido del pico del camino por partes')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        documentos = []
+        print("Generando documentos sintéticos...")
+        for parrafos in args.paragraphs:
+            ruta = os.path.join(directorio, f'documento-{parrafos}.docx')
+            generar_docx(ruta, parrafos)
+            documentos.append(('docx', ruta))
+        for megabytes in args.text_mb:
+            ruta = os.path.join(directorio, f'texto-{megabytes:g}.txt')
+            generar_texto(ruta, megabytes)
+            documentos.append(('txt', ruta))
+        for paginas in args.pdf_pages:
+            ruta = os.path.join(directorio, f'apunte-{paginas}.pdf')
+            generar_pdf(ruta, paginas)
+            documentos.append(('pdf', ruta))
+        for paginas in args.scanned_pages:
+            ruta = os.path.join(directorio, f'escaneado-{paginas}.pdf')
+            generar_pdf(ruta, paginas, escaneado=True)
+            documentos.append(('pdf-ocr', ruta))
+        if shutil.which('tesseract') is None:
+            print("tesseract no está instalado: se mide el recorrido de OCR sin el reconocimiento")
+
+        print(f"{'Documento':<32}{'Camino':<9}{'Fragmentos':>11}{'Segundos':>10}{'RSS pico':>11}{'RSS extra':>11}")
+        extra: Dict[str, List[float]] = {tipo: [] for tipo in TIPOS}
+        for tipo, ruta in documentos:
+            mb = os.path.getsize(ruta) / 1024 / 1024
+            for modo in ('stream', 'full'):
+                r = medir(tipo, ruta, modo)
+                if modo == 'stream':
+                    extra[tipo].append(r['rss_extra_mb'])
+                print(f"{f'{os.path.basename(ruta)} ({mb:.2f} MB)':<32}{modo:<9}{r['chunks']:>11}"
+                      f"{r['seconds']:>10.2f}{r['rss_mb']:>8.0f} MB{r['rss_extra_mb']:>8.0f} MB")
+
+    correcto = True
+    for tipo, valores in extra.items():
+        if len(valores) > 1 and max(valores) - min(valores) > args.tolerance_mb:
+            correcto = False
+            print(f"El pico de memoria del camino por partes crece con el tamaño de los documentos {tipo}: "
+                  f"de {min(valores):.0f} MB a {max(valores):.0f} MB")
+    sys.exit(0 if correcto else 1)
+
+
+if __name__ == '__main__':
+    main()
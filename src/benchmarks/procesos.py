@@ -0,0 +1,63 @@
+"""
+Mediciones en un proceso nuevo, compartidas por los benchmarks.
+
+Cada medición de memoria corre en un intérprete propio: el pico de memoria
+residente de un proceso no baja, así que medir dos casos en el mismo
+proceso mezclaría sus picos. El benchmark se invoca a sí mismo con
+``--worker`` y los argumentos del caso, y el trabajador imprime su
+resultado como una línea JSON.
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+from typing import Any, Callable, Dict
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_mb() -> float:
+    """Pico de memoria residente del proceso en MB."""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB y macOS bytes
+    return pico / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def medir_en_proceso(modulo: str, *args: str) -> Dict[str, Any]:
+    """
+    Ejecuta el trabajador de un benchmark en un proceso nuevo.
+
+    Args:
+        modulo: Módulo del benchmark (por ejemplo 'benchmarks.memory')
+        *args: Argumentos del trabajador
+
+    Returns:
+        Resultado que imprimió el trabajador
+
+    Raises:
+        RuntimeError: Si el proceso termina con error
+    """
+    resultado = subprocess.run(
+        [sys.executable, '-m', modulo, '--worker', *args],
+        cwd=RAIZ, capture_output=True, text=True
+    )
+    if resultado.returncode != 0:
+        raise RuntimeError(f"Falló la medición {' '.join(args)}:\n{resultado.stderr}")
+    return json.loads(resultado.stdout.strip().splitlines()[-1])
+
+
+def ejecutar_trabajador(trabajador: Callable[..., Dict[str, Any]]) -> bool:
+    """
+    Atiende la invocación ``--worker`` de ``medir_en_proceso``.
+
+    Args:
+        trabajador: Función que recibe los argumentos (como texto) y devuelve el resultado
+
+    Returns:
+        True si el proceso era un trabajador (el resultado ya se imprimió)
+    """
+    if sys.argv[1:2] != ['--worker']:
+        return False
+    print(json.dumps(trabajador(*sys.argv[2:])))
+    return True
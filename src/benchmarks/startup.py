@@ -0,0 +1,111 @@
+"""
+Benchmark del tiempo de arranque de la línea de comandos.
+
+Importa ``main`` en un proceso nuevo con ``python -X importtime`` y verifica
+que el tiempo acumulado de importación no supere el presupuesto y que no se
+importe ningún subsistema pesado al cargar el módulo (se importan recién al
+elegir el modo correspondiente).
+
+Uso:
+    python -m benchmarks.startup [--budget-ms 300] [--top 10]
+
+Sale con código 1 si se supera el presupuesto o se importa un módulo prohibido.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Módulos que ``import main`` no debe cargar
+MODULOS_DIFERIDOS = [
+    'flask', 'starlette', 'uvicorn', 'qdrant_client', 'psycopg2', 'openai',
+    'PyPDF2', 'pptx', 'docx', 'pytesseract', 'PIL',
+    'chat.manager', 'rag.vector_store', 'rag.document_processor',
+    'moodle.client', 'web.app', 'fine_tuning.manager',
+]
+
+PRESUPUESTO_MS = 300
+
+_LINEA = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def medir_importacion(modulo: str = 'main') -> List[Tuple[str, int, int]]:
+    """
+    Importa un módulo en un proceso nuevo y devuelve los tiempos de importación.
+
+    Args:
+        modulo: Módulo a importar
+
+    Returns:
+        Lista de (módulo, microsegundos propios, microsegundos acumulados)
+    """
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    resultado = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        cwd=raiz, capture_output=True, text=True
+    )
+    if resultado.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {modulo}:\n{resultado.stderr}")
+    tiempos = []
+    for linea in resultado.stderr.splitlines():
+        coincidencia = _LINEA.match(linea)
+        if coincidencia:
+            propio, acumulado, _, nombre = coincidencia.groups()
+            tiempos.append((nombre, int(propio), int(acumulado)))
+    return tiempos
+
+
+def verificar(tiempos: List[Tuple[str, int, int]], presupuesto_ms: float,
+              modulo: str = 'main') -> Tuple[float, List[str], bool]:
+    """
+    Compara los tiempos medidos con el presupuesto y la lista de módulos diferidos.
+
+    Args:
+        tiempos: Resultado de ``medir_importacion``
+        presupuesto_ms: Tiempo máximo de importación en milisegundos
+        modulo: Módulo medido
+
+    Returns:
+        Tupla con (milisegundos acumulados del módulo, módulos diferidos
+        importados, True si se respeta el presupuesto)
+    """
+    acumulados: Dict[str, int] = {nombre: acumulado for nombre, _, acumulado in tiempos}
+    total_ms = acumulados.get(modulo, 0) / 1000
+    importados = [
+        m for m in MODULOS_DIFERIDOS
+        if any(nombre == m or nombre.startswith(m + '.') for nombre in acumulados)
+    ]
+    return total_ms, importados, total_ms <= presupuesto_ms
+
+
+def main():
+    """Ejecuta el benchmark e informa el resultado."""
+    parser = argparse.ArgumentParser(description="Presupuesto de tiempo de importación de main.py")
+    parser.add_argument('--budget-ms', type=float, default=PRESUPUESTO_MS,
+                        help='Tiempo máximo de importación en milisegundos')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Cantidad de módulos más lentos a mostrar')
+    args = parser.parse_args()
+
+    tiempos = medir_importacion('main')
+    total_ms, importados, en_presupuesto = verificar(tiempos, args.budget_ms)
+
+    print(f"import main: {total_ms:.1f} ms (presupuesto {args.budget_ms:.0f} ms)")
+    print("Módulos con mayor tiempo propio:")
+    for nombre, propio, _ in sorted(tiempos, key=lambda t: t[1], reverse=True)[:args.top]:
+        print(f"  {propio / 1000:8.1f} ms  {nombre}")
+
+    correcto = True
+    if importados:
+        correcto = False
+        print(f"Se importan al cargar main.py: {', '.join(importados)}")
+    if not en_presupuesto:
+        correcto = False
+        print("Presupuesto de importación superado")
+    sys.exit(0 if correcto else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+"""
+Control de admisión y contrapresión para los turnos de chat.
+
+Limita cuántos turnos se ejecutan a la vez (global y por sesión), mantiene
+una cola acotada para el resto y rechaza de inmediato las peticiones cuya
+espera estimada supera el plazo configurado, en lugar de dejarlas acumularse
+detrás de Ollama hasta que el cliente abandona.
+"""
+import asyncio
+import contextlib
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from core.errors import ErrorSobrecarga
+from core import metrics
+
+ADMISSION_ACTIVE = metrics.gauge(
+    'rag_admission_active', 'Turnos de chat ejecutándose')
+ADMISSION_LIMIT = metrics.gauge(
+    'rag_admission_max_concurrent', 'Máximo de turnos de chat simultáneos')
+ADMISSION_QUEUE = metrics.gauge(
+    'rag_admission_queue_depth', 'Turnos de chat esperando en cola')
+ADMISSION_ESTIMATED_WAIT = metrics.gauge(
+    'rag_admission_estimated_wait_seconds', 'Espera estimada para un turno que llegue ahora')
+ADMISSION_WAIT_SECONDS = metrics.histogram(
+    'rag_admission_wait_seconds', 'Tiempo de espera en cola antes de ser admitido')
+ADMISSION_REJECTED = metrics.counter(
+    'rag_admission_rejected_total', 'Turnos de chat rechazados por sobrecarga', ['reason'])
+
+
+class _Espera:
+    """
+    Petición en cola esperando un lugar libre
+    """
+    def __init__(self, session_id: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.session_id = session_id
+        self.encolada = time.monotonic()
+        self.concedida = False
+        self.loop = loop
+        if loop is None:
+            self.evento = threading.Event()
+        else:
+            self.futuro = loop.create_future()
+
+    def despertar(self):
+        """Avisa al que espera que ya tiene un lugar asignado."""
+        self.concedida = True
+        if self.loop is None:
+            self.evento.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolver)
+
+    def _resolver(self):
+        """Resuelve el futuro desde el hilo del event loop."""
+        if not self.futuro.done():
+            self.futuro.set_result(True)
+
+
+class AdmissionController:
+    """
+    Cola acotada con límites de concurrencia global y por sesión
+    """
+    def __init__(
+        self,
+        max_concurrent: int = 8,
+        max_queue: int = 64,
+        per_session: int = 1,
+        deadline_seconds: float = 30.0,
+        initial_service_seconds: float = 5.0
+    ):
+        """
+        Inicializa el control de admisión.
+
+        Args:
+            max_concurrent: Turnos ejecutándose a la vez en el proceso
+            max_queue: Turnos que pueden esperar en cola
+            per_session: Turnos en curso o en cola por sesión
+            deadline_seconds: Espera máxima aceptable antes de rechazar
+            initial_service_seconds: Duración estimada de un turno hasta tener mediciones
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.per_session = per_session
+        self.deadline_seconds = deadline_seconds
+        self._lock = threading.Lock()
+        self._cola: Deque[_Espera] = deque()
+        self._activos = 0
+        self._por_sesion: Dict[str, int] = {}
+        # Medias móviles exponenciales de duración del turno y de espera en cola
+        self._servicio_medio = initial_service_seconds
+        self._espera_media = 0.0
+        self.admitidos = 0
+        self.rechazados = 0
+        ADMISSION_ACTIVE.set_function(lambda: self._activos)
+        ADMISSION_LIMIT.set(max_concurrent)
+        ADMISSION_QUEUE.set_function(lambda: len(self._cola))
+        ADMISSION_ESTIMATED_WAIT.set_function(self.estimated_wait)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "AdmissionController":
+        """
+        Crea el control de admisión a partir de la sección ``admission`` de la configuración.
+
+        Args:
+            config: Configuración del sistema
+
+        Returns:
+            Instancia de AdmissionController
+        """
+        admission = config.get('admission') or {}
+        return cls(
+            max_concurrent=int(admission.get('max_concurrent', 8)),
+            max_queue=int(admission.get('max_queue', 64)),
+            per_session=int(admission.get('per_session', 1)),
+            deadline_seconds=float(admission.get('deadline_seconds', 30)),
+            initial_service_seconds=float(admission.get('initial_service_seconds', 5))
+        )
+
+    def estimated_wait(self) -> float:
+        """
+        Estima cuánto esperaría una petición que llegara ahora.
+
+        Returns:
+            Espera estimada en segundos
+        """
+        with self._lock:
+            return self._estimar_espera()
+
+    def _estimar_espera(self) -> float:
+        """Espera estimada; requiere tener el lock tomado."""
+        if self._activos < self.max_concurrent and not self._cola:
+            return 0.0
+        tandas = math.ceil((len(self._cola) + 1) / self.max_concurrent)
+        return tandas * self._servicio_medio
+
+    def _solicitar(self, session_id: str, loop=None) -> Optional[_Espera]:
+        """
+        Intenta admitir una petición.
+
+        Args:
+            session_id: ID de la sesión de chat
+            loop: Event loop del que espera (None para hilos)
+
+        Returns:
+            None si se admitió de inmediato, o la espera encolada
+
+        Raises:
+            ErrorSobrecarga: Si se supera algún límite o la espera estimada
+        """
+        with self._lock:
+            if self._por_sesion.get(session_id, 0) >= self.per_session:
+                self.rechazados += 1
+                ADMISSION_REJECTED.labels(reason='session').inc()
+                raise ErrorSobrecarga(
+                    "Ya hay una pregunta en curso para esta sesión",
+                    retry_after=self._servicio_medio
+                )
+            espera = self._estimar_espera()
+            if len(self._cola) >= self.max_queue or espera > self.deadline_seconds:
+                self.rechazados += 1
+                ADMISSION_REJECTED.labels(reason='queue').inc()
+                raise ErrorSobrecarga(
+                    "El asistente está saturado, intenta de nuevo en unos segundos",
+                    retry_after=espera
+                )
+            self._por_sesion[session_id] = self._por_sesion.get(session_id, 0) + 1
+            if self._activos < self.max_concurrent and not self._cola:
+                self._activos += 1
+                self.admitidos += 1
+                return None
+            pendiente = _Espera(session_id, loop)
+            self._cola.append(pendiente)
+            return pendiente
+
+    def _vencida(self, pendiente: _Espera) -> bool:
+        """
+        Resuelve una espera que superó el plazo.
+
+        Returns:
+            False si el lugar se concedió justo antes de vencer (la petición sigue)
+
+        Raises:
+            ErrorSobrecarga: Si la espera se quitó de la cola sin lugar asignado
+        """
+        with self._lock:
+            if pendiente.concedida:
+                return False
+            self._cola.remove(pendiente)
+            self._liberar_sesion(pendiente.session_id)
+            self.rechazados += 1
+            ADMISSION_REJECTED.labels(reason='deadline').inc()
+        raise ErrorSobrecarga(
+            "Tiempo de espera agotado en la cola del asistente",
+            retry_after=self._servicio_medio
+        )
+
+    def _registrar_admision(self, pendiente: _Espera):
+        """Actualiza la espera media tras conceder un lugar a una petición en cola."""
+        with self._lock:
+            self.admitidos += 1
+            espera = time.monotonic() - pendiente.encolada
+            self._espera_media = 0.8 * self._espera_media + 0.2 * espera
+        ADMISSION_WAIT_SECONDS.observe(espera)
+
+    def _liberar_sesion(self, session_id: str):
+        """Descuenta una petición de la sesión; requiere tener el lock tomado."""
+        restantes = self._por_sesion.get(session_id, 1) - 1
+        if restantes:
+            self._por_sesion[session_id] = restantes
+        else:
+            self._por_sesion.pop(session_id, None)
+
+    def _liberar(self, session_id: str, duracion: float):
+        """
+        Libera el lugar de un turno terminado y se lo cede al siguiente en cola.
+
+        Args:
+            session_id: ID de la sesión de chat
+            duracion: Duración del turno en segundos
+        """
+        with self._lock:
+            self._servicio_medio = 0.8 * self._servicio_medio + 0.2 * duracion
+            self._liberar_sesion(session_id)
+            self._ceder_lugar()
+
+    def _ceder_lugar(self):
+        """Pasa un lugar libre al siguiente en cola; requiere tener el lock tomado."""
+        if self._cola:
+            # El lugar pasa directamente al siguiente, sin decrementar activos
+            self._cola.popleft().despertar()
+        else:
+            self._activos -= 1
+
+    def _abandonar(self, pendiente: _Espera):
+        """
+        Retira una espera cancelada, devolviendo el lugar si ya se le había concedido.
+
+        Args:
+            pendiente: Espera cancelada
+        """
+        with self._lock:
+            if pendiente.concedida:
+                self._ceder_lugar()
+            else:
+                self._cola.remove(pendiente)
+            self._liberar_sesion(pendiente.session_id)
+
+    @contextlib.contextmanager
+    def admit(self, session_id: str):
+        """
+        Admite un turno desde un hilo, esperando en cola si hace falta.
+
+        Args:
+            session_id: ID de la sesión de chat
+
+        Raises:
+            ErrorSobrecarga: Si la petición se rechaza o vence su plazo en cola
+        """
+        pendiente = self._solicitar(session_id)
+        if pendiente is not None:
+            if not pendiente.evento.wait(self.deadline_seconds):
+                self._vencida(pendiente)
+            self._registrar_admision(pendiente)
+        inicio = time.monotonic()
+        try:
+            yield
+        finally:
+            self._liberar(session_id, time.monotonic() - inicio)
+
+    @contextlib.asynccontextmanager
+    async def aadmit(self, session_id: str):
+        """
+        Admite un turno desde una corrutina sin bloquear el event loop.
+
+        Args:
+            session_id: ID de la sesión de chat
+
+        Raises:
+            ErrorSobrecarga: Si la petición se rechaza o vence su plazo en cola
+        """
+        pendiente = self._solicitar(session_id, asyncio.get_running_loop())
+        if pendiente is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(pendiente.futuro), self.deadline_seconds)
+            except asyncio.TimeoutError:
+                self._vencida(pendiente)
+            except asyncio.CancelledError:
+                # El cliente se desconectó mientras esperaba en la cola
+                self._abandonar(pendiente)
+                raise
+            self._registrar_admision(pendiente)
+        inicio = time.monotonic()
+        try:
+            yield
+        finally:
+            self._liberar(session_id, time.monotonic() - inicio)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Estado actual de la cola para monitoreo.
+
+        Returns:
+            Diccionario con turnos activos, profundidad de la cola, esperas y contadores
+        """
+        with self._lock:
+            return {
+                'active': self._activos,
+                'max_concurrent': self.max_concurrent,
+                'queue_depth': len(self._cola),
+                'max_queue': self.max_queue,
+                'estimated_wait_seconds': round(self._estimar_espera(), 3),
+                'avg_wait_seconds': round(self._espera_media, 3),
+                'avg_service_seconds': round(self._servicio_medio, 3),
+                'admitted': self.admitidos,
+                'rejected': self.rechazados,
+            }
@@ -0,0 +1,171 @@
+"""
+Coalescencia de peticiones idénticas en vuelo (single-flight).
+
+Cuando muchos estudiantes hacen la misma pregunta a la vez, solo la primera
+petición (líder) ejecuta la búsqueda o la llamada al LLM; las demás esperan
+su resultado en lugar de repetir el trabajo.
+"""
+import asyncio
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+def normalizar_pregunta(pregunta: str) -> str:
+    """
+    Normaliza una pregunta para detectar duplicados.
+
+    Pasa a minúsculas, elimina tildes, signos de puntuación de los extremos
+    y espacios repetidos.
+
+    Args:
+        pregunta: Pregunta del usuario
+
+    Returns:
+        Pregunta normalizada
+    """
+    texto = unicodedata.normalize('NFKD', pregunta.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r'\s+', ' ', texto)
+    return texto.strip(' ¿?¡!.,;:')
+
+
+class _LiderCancelado(Exception):
+    """El líder fue cancelado antes de terminar: los que esperaban deben reintentar."""
+
+
+class SingleFlight:
+    """
+    Ejecuta una sola vez las llamadas concurrentes con la misma clave
+    """
+    def __init__(self):
+        """
+        Inicializa el registro de llamadas en vuelo.
+        """
+        self._lock = threading.Lock()
+        self._en_vuelo: Dict[Hashable, Future] = {}
+        self.compartidas = 0
+
+    def _unirse(self, key: Hashable) -> Tuple[Future, bool]:
+        """
+        Obtiene el futuro en vuelo para la clave o registra uno nuevo.
+
+        Args:
+            key: Clave que identifica la llamada
+
+        Returns:
+            Tupla con (futuro, True si el llamador es el líder)
+        """
+        with self._lock:
+            futuro = self._en_vuelo.get(key)
+            if futuro is None:
+                futuro = Future()
+                self._en_vuelo[key] = futuro
+                return futuro, True
+            self.compartidas += 1
+            return futuro, False
+
+    def _terminar(self, key: Hashable, futuro: Future):
+        """Quita la clave del registro si todavía corresponde a ``futuro``."""
+        with self._lock:
+            if self._en_vuelo.get(key) is futuro:
+                del self._en_vuelo[key]
+
+    def _abandonar(self, key: Hashable, futuro: Future):
+        """
+        Libera la clave de un líder cancelado y despierta a los que esperaban.
+
+        La cancelación (desconexión del cliente, ``GeneratorExit``) es del
+        líder, no del trabajo: no se comparte con los demás, que reintentan
+        y eligen un nuevo líder.
+        """
+        self._terminar(key, futuro)
+        futuro.set_exception(_LiderCancelado())
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Ejecuta ``fn`` o espera el resultado de una ejecución en curso con la misma clave.
+
+        Args:
+            key: Clave que identifica la llamada
+            fn: Función a ejecutar si no hay otra en vuelo
+
+        Returns:
+            Resultado de ``fn`` (propio o compartido)
+
+        Raises:
+            Exception: La excepción lanzada por ``fn`` se propaga a todos los que esperan
+        """
+        while True:
+            futuro, lider = self._unirse(key)
+            if lider:
+                break
+            try:
+                return futuro.result()
+            except _LiderCancelado:
+                continue
+
+        try:
+            resultado = fn()
+        except Exception as e:
+            futuro.set_exception(e)
+            raise
+        except BaseException:
+            self._abandonar(key, futuro)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            self._terminar(key, futuro)
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Versión asíncrona de ``do``: ejecuta la corrutina o espera la que está en vuelo.
+
+        Comparte el registro con ``do``, por lo que las llamadas síncronas y
+        asíncronas con la misma clave también se agrupan entre sí.
+
+        Args:
+            key: Clave que identifica la llamada
+            fn: Función que devuelve la corrutina a ejecutar si no hay otra en vuelo
+
+        Returns:
+            Resultado de la corrutina (propio o compartido)
+        """
+        while True:
+            futuro, lider = self._unirse(key)
+            if lider:
+                break
+            try:
+                # shield evita que cancelar a un seguidor cancele el futuro compartido
+                return await asyncio.shield(asyncio.wrap_future(futuro))
+            except _LiderCancelado:
+                continue
+
+        try:
+            resultado = await fn()
+        except Exception as e:
+            futuro.set_exception(e)
+            raise
+        except BaseException:
+            # CancelledError, GeneratorExit: solo afecta al líder
+            self._abandonar(key, futuro)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            self._terminar(key, futuro)
+
+    def en_vuelo(self) -> int:
+        """
+        Cantidad de llamadas líderes ejecutándose en este momento.
+
+        Returns:
+            Número de claves en vuelo
+        """
+        with self._lock:
+            return len(self._en_vuelo)
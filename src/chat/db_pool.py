@@ -0,0 +1,98 @@
+"""
+Pool de conexiones a PostgreSQL para el gestor de chat.
+
+Reutiliza conexiones abiertas en lugar de pagar la conexión (y la
+autenticación) en cada consulta. A diferencia de ``ThreadedConnectionPool``,
+cuando el pool está lleno los hilos esperan una conexión libre en lugar de
+recibir un error.
+"""
+import contextlib
+import threading
+import time
+
+import psycopg2
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+from core import metrics
+
+POOL_IN_USE = metrics.gauge(
+    'rag_postgres_pool_in_use', 'Conexiones del pool de Postgres en uso')
+POOL_SIZE = metrics.gauge(
+    'rag_postgres_pool_max', 'Máximo de conexiones del pool de Postgres')
+POOL_WAIT_SECONDS = metrics.histogram(
+    'rag_postgres_pool_wait_seconds', 'Espera para obtener una conexión del pool de Postgres')
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones con espera acotada cuando todas están en uso
+    """
+    def __init__(self, dsn: str, minconn: int = 1, maxconn: int = 10, timeout: float = 30.0):
+        """
+        Abre el pool de conexiones.
+
+        Args:
+            dsn: Cadena de conexión a PostgreSQL
+            minconn: Conexiones abiertas desde el inicio
+            maxconn: Máximo de conexiones abiertas a la vez
+            timeout: Segundos máximos de espera por una conexión libre
+        """
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._pool = ThreadedConnectionPool(minconn, maxconn, dsn)
+        self._libres = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._en_uso = 0
+        POOL_SIZE.set(maxconn)
+        POOL_IN_USE.set_function(lambda: self._en_uso)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Presta una conexión dentro de una transacción.
+
+        Igual que ``with psycopg2.connect(...) as conn``, confirma la
+        transacción si el bloque termina bien y la revierte si lanza una
+        excepción. Las conexiones rotas se descartan en lugar de devolverse.
+
+        Yields:
+            Conexión de psycopg2
+
+        Raises:
+            PoolError: Si no se libera una conexión a tiempo
+        """
+        inicio = time.perf_counter()
+        if not self._libres.acquire(timeout=self.timeout):
+            raise PoolError(
+                f"No hay conexiones libres a Postgres tras {self.timeout}s"
+            )
+        POOL_WAIT_SECONDS.observe(time.perf_counter() - inicio)
+        descartar = False
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._libres.release()
+            raise
+        with self._lock:
+            self._en_uso += 1
+        try:
+            with conn:
+                yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            descartar = True
+            raise
+        finally:
+            with self._lock:
+                self._en_uso -= 1
+            self._pool.putconn(conn, close=descartar or bool(conn.closed))
+            self._libres.release()
+
+    def warm_up(self):
+        """Verifica una conexión del pool ejecutando una consulta trivial."""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+
+    def close(self):
+        """Cierra todas las conexiones del pool."""
+        self._pool.closeall()
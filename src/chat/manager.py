@@ -2,24 +2,73 @@
 Gestor de chat con memoria de conversaciones y RAG.
 """
 import requests
-from typing import List, Dict, Any, Optional
-import psycopg2
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 from psycopg2.extras import DictCursor
 from datetime import datetime
 import uuid
-from core.utils import configurar_logging
+from core.utils import configurar_logging, medir_tiempo
 from core.errors import ErrorChat
+from core.fixtures import FixtureArchive
+from core import metrics
 from rag.vector_store import VectorStore
 from rag.reranking import rerank_fragments
-from chat.prompts import PROMPT_CHAT
+from rag.context_packing import estimate_tokens, pack_context, trim_history
+from chat.prompts import PROMPT_CHAT, PROMPT_SISTEMA
+from chat.migrations import aplicar_migraciones
+from chat.db_pool import ConnectionPool
+from chat.pagination import encode_cursor, decode_cursor
+from chat.coalescing import SingleFlight, normalizar_pregunta
+from chat.turn_metrics import registrar_turno
+from chat.version_listener import CANAL, VersionListener, aviso
+import asyncio
+import hashlib
+import time
 import importlib
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+
+CHAT_TURNS = metrics.counter(
+    'rag_chat_turns_total', 'Turnos de chat atendidos', ['outcome'])
+CHAT_STAGE_SECONDS = metrics.histogram(
+    'rag_chat_stage_seconds', 'Duración de cada etapa del turno de chat', ['stage'])
+CHAT_COALESCED = metrics.counter(
+    'rag_chat_coalesced_total', 'Llamadas resueltas con el resultado de otra idéntica en vuelo', ['stage'])
+CHAT_IN_FLIGHT = metrics.gauge(
+    'rag_chat_in_flight', 'Búsquedas y generaciones líderes en vuelo')
+LLM_ERRORS = metrics.counter(
+    'rag_llm_errors_total', 'Errores al llamar al LLM')
+LLM_TOKENS = metrics.counter(
+    'rag_llm_tokens_total', 'Tokens consumidos por el LLM', ['kind'])
+POSTGRES_ERRORS = metrics.counter(
+    'rag_postgres_errors_total', 'Errores en operaciones de Postgres', ['operation'])
 
 class ChatManager:
     """
     Gestor de chat con memoria de conversaciones y RAG
     """
-    def __init__(self, qdrant_client: VectorStore, db_connection: str, ollama_url: str, model_name: str = "llama3:8b"):
+    # Sesiones cuya versión se recuerda en memoria para las validaciones con ETag
+    MAX_CACHED_VERSIONS = 10000
+
+    def __init__(
+        self,
+        qdrant_client: VectorStore,
+        db_connection: str,
+        ollama_url: str,
+        model_name: str = "llama3:8b",
+        db_options: Optional[Dict[str, Any]] = None,
+        coalesce_requests: bool = True,
+        context_window: int = 4096,
+        answer_tokens: int = 512,
+        history_tokens: int = 1024,
+        search_limit: int = 8,
+        version_cache_seconds: float = 300.0,
+        version_notify: bool = True,
+        pool_min: int = 1,
+        pool_max: int = 10,
+        keep_alive: str = "30m",
+        fixtures: Optional[FixtureArchive] = None
+    ):
         """
         Inicializa el gestor de chat.
         
@@ -28,41 +77,166 @@ class ChatManager:
             db_connection: Cadena de conexión a PostgreSQL
             ollama_url: URL de Ollama para LLM
             model_name: Nombre del modelo de Ollama
+            db_options: Opciones de esquema (compact_keys, partition_messages,
+                partition_months_ahead)
+            coalesce_requests: Compartir la búsqueda y la generación entre
+                preguntas idénticas que llegan al mismo tiempo
+            context_window: Ventana de contexto del modelo (num_ctx) en tokens
+            answer_tokens: Tokens reservados para la respuesta
+            history_tokens: Máximo de tokens del historial incluido en el prompt
+            search_limit: Fragmentos candidatos recuperados de Qdrant por pregunta
+            version_cache_seconds: Segundos que se confía en la versión
+                (updated_at) cacheada de una sesión sin consultar Postgres
+            version_notify: Avisar las escrituras a los demás procesos worker
+                con LISTEN/NOTIFY; sin avisos, una escritura de otro worker
+                tarda hasta ``version_cache_seconds`` en verse
+            pool_min: Conexiones a Postgres abiertas desde el inicio
+            pool_max: Máximo de conexiones a Postgres abiertas a la vez
+            keep_alive: Tiempo que Ollama mantiene cargado el modelo tras el precalentamiento
+            fixtures: Archivo para grabar o reproducir las llamadas al LLM; None para usar la red
         """
         self.qdrant = qdrant_client
         self.db_connection = db_connection
         self.ollama_url = ollama_url
         self.model_name = model_name
+        self.db_options = db_options or {}
+        self.coalesce_requests = coalesce_requests
+        self.context_window = context_window
+        self.answer_tokens = answer_tokens
+        self.history_tokens = history_tokens
+        self.search_limit = search_limit
+        self.version_cache_seconds = version_cache_seconds
+        # session_id -> (updated_at, momento en que se leyó), en orden LRU
+        self._versiones: "OrderedDict[str, Tuple[datetime, float]]" = OrderedDict()
+        self._versiones_lock = threading.Lock()
+        self.version_notify = version_notify
+        self._listener: Optional[VersionListener] = None
+        self._reinicio_versiones = 0.0
+        self._single_flight = SingleFlight()
+        CHAT_IN_FLIGHT.set_function(self._single_flight.en_vuelo)
+        self.keep_alive = keep_alive
+        self.fixtures = fixtures
+        self._llm = None
+        self._async_llm = None
         self.logger = configurar_logging("chat_manager")
-        self._init_db()
+        self._pool = ConnectionPool(db_connection, minconn=pool_min, maxconn=pool_max)
+        try:
+            self._init_db()
+        except Exception:
+            # La instancia no llega a devolverse: nadie más cerraría sus conexiones
+            self._pool.close()
+            raise
+        if version_notify:
+            self._listener = VersionListener(db_connection, self._notified_version, self._forget_versions)
+            self._listener.start()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], vector_store: VectorStore) -> "ChatManager":
+        """
+        Crea un gestor de chat a partir de la configuración del sistema.
+        
+        Args:
+            config: Configuración del sistema
+            vector_store: Almacén de vectores ya inicializado
+            
+        Returns:
+            Instancia de ChatManager
+        """
+        # Selección de modelo de chat
+        chat_model = config['ollama']['model_name']
+        chat_url = config['ollama']['url']
+        if 'bitnet' in config and config['bitnet'].get('model_name'):
+            # Permitir override por env/config: si BITNET_MODEL está seteado, usarlo
+            chat_model = config['bitnet']['model_name']
+            chat_url = ""  # BitNet no requiere URL
+
+        postgres = config['postgres']
+        chat = config.get('chat') or {}
+        return cls(
+            qdrant_client=vector_store,
+            db_connection=postgres['connection_string'],
+            ollama_url=chat_url,
+            model_name=chat_model,
+            db_options={k: v for k, v in postgres.items()
+                        if k not in ('connection_string', 'pool_min', 'pool_max')},
+            coalesce_requests=chat.get('coalesce_requests', True),
+            context_window=int(chat.get('context_window', 4096)),
+            answer_tokens=int(chat.get('answer_tokens', 512)),
+            history_tokens=int(chat.get('history_tokens', 1024)),
+            search_limit=int(chat.get('search_limit', 8)),
+            version_cache_seconds=float(chat.get('version_cache_seconds', 300)),
+            version_notify=bool(chat.get('version_notify', True)),
+            pool_min=int(postgres.get('pool_min', 1)),
+            pool_max=int(postgres.get('pool_max', 10)),
+            keep_alive=str(config['ollama'].get('keep_alive', '30m')),
+            fixtures=FixtureArchive.from_config(config)
+        )
+
+    def warm_up(self):
+        """
+        Precalienta el gestor: verifica el pool de Postgres, abre los clientes
+        del LLM y carga el modelo de chat en Ollama.
+        
+        El modelo se carga con ``/api/generate`` sin prompt y queda residente
+        durante ``keep_alive``, así la primera pregunta no paga la carga.
+        
+        Returns:
+            Diccionario con la duración de cada paso en milisegundos
+        """
+        tiempos: Dict[str, float] = {}
+        with medir_tiempo(tiempos, 'postgres_ms'):
+            self._pool.warm_up()
+        if not self.ollama_url:
+            return tiempos
+        self._llm = self._llm or self._cliente_llm()
+        if self.fixtures is not None and self.fixtures.mode == 'replay':
+            # Las respuestas salen del archivo: no hay modelo que cargar
+            return tiempos
+        with medir_tiempo(tiempos, 'chat_model_ms'):
+            response = requests.post(
+                f"{self.ollama_url}/api/generate",
+                json={"model": self.model_name, "keep_alive": self.keep_alive},
+                timeout=300
+            )
+            response.raise_for_status()
+        return tiempos
+
+    def close(self):
+        """
+        Cierra las conexiones a Postgres, la escucha de versiones y el
+        cliente síncrono del LLM.
+        
+        El cliente asíncrono pertenece al event loop que lo creó y se
+        libera con él.
+        """
+        if self._listener is not None:
+            self._listener.stop()
+        self._pool.close()
+        if self._llm is not None:
+            self._llm.close()
+
+    def _cliente_llm(self) -> OpenAI:
+        """Crea el cliente del LLM, grabando o reproduciendo si hay archivo de grabación."""
+        http_client = self.fixtures.httpx_client() if self.fixtures is not None else None
+        return OpenAI(base_url=self.ollama_url + "/v1", api_key='ollama', http_client=http_client)
+
+    def _cliente_llm_async(self) -> AsyncOpenAI:
+        """Versión asíncrona de ``_cliente_llm``."""
+        http_client = self.fixtures.httpx_async_client() if self.fixtures is not None else None
+        return AsyncOpenAI(base_url=self.ollama_url + "/v1", api_key='ollama', http_client=http_client)
 
     def _init_db(self):
         """
-        Inicializa las tablas de la base de datos si no existen.
+        Inicializa el esquema de la base de datos aplicando las migraciones pendientes.
         
         Raises:
             ErrorChat: Si ocurre un error al inicializar la base de datos
         """
         try:
-            with psycopg2.connect(self.db_connection) as conn:
-                with conn.cursor() as cur:
-                    cur.execute("""
-                        CREATE TABLE IF NOT EXISTS chat_sessions (
-                            id VARCHAR(36) PRIMARY KEY,
-                            created_at TIMESTAMP NOT NULL,
-                            updated_at TIMESTAMP NOT NULL
-                        )
-                    """)
-                    cur.execute("""
-                        CREATE TABLE IF NOT EXISTS chat_messages (
-                            id VARCHAR(36) PRIMARY KEY,
-                            session_id VARCHAR(36) REFERENCES chat_sessions(id),
-                            sender VARCHAR(16) NOT NULL,
-                            content TEXT NOT NULL,
-                            timestamp TIMESTAMP NOT NULL
-                        )
-                    """)
+            with self._pool.connection() as conn:
+                aplicar_migraciones(conn, self.db_options, self.logger)
         except Exception as e:
+            POSTGRES_ERRORS.labels(operation='init_db').inc()
             self.logger.error(f"Error al inicializar la base de datos de chat: {e}")
             raise ErrorChat(str(e))
 
@@ -76,7 +250,7 @@ class ChatManager:
         try:
             session_id = str(uuid.uuid4())
             now = datetime.now()
-            with psycopg2.connect(self.db_connection) as conn:
+            with self._pool.connection() as conn:
                 with conn.cursor() as cur:
                     cur.execute(
                         "INSERT INTO chat_sessions (id, created_at, updated_at) VALUES (%s, %s, %s)",
@@ -84,6 +258,7 @@ class ChatManager:
                     )
             return session_id
         except Exception as e:
+            POSTGRES_ERRORS.labels(operation='create_session').inc()
             self.logger.error(f"Error al crear sesión de chat: {e}")
             return None
 
@@ -102,7 +277,7 @@ class ChatManager:
         try:
             msg_id = str(uuid.uuid4())
             now = datetime.now()
-            with psycopg2.connect(self.db_connection) as conn:
+            with self._pool.connection() as conn:
                 with conn.cursor() as cur:
                     cur.execute(
                         "INSERT INTO chat_messages (id, session_id, sender, content, timestamp) VALUES (%s, %s, %s, %s, %s)",
@@ -112,7 +287,12 @@ class ChatManager:
                         "UPDATE chat_sessions SET updated_at = %s WHERE id = %s",
                         (now, session_id)
                     )
+                    if self.version_notify:
+                        # Postgres entrega el aviso a los demás workers al confirmar la transacción
+                        cur.execute("SELECT pg_notify(%s, %s)", (CANAL, aviso(session_id, now)))
+            self._remember_version(session_id, now)
         except Exception as e:
+            POSTGRES_ERRORS.labels(operation='add_message').inc()
             self.logger.error(f"Error al guardar mensaje de chat: {e}")
             raise ErrorChat(str(e))
 
@@ -127,7 +307,7 @@ class ChatManager:
             Lista de mensajes con remitente, contenido y timestamp
         """
         try:
-            with psycopg2.connect(self.db_connection) as conn:
+            with self._pool.connection() as conn:
                 with conn.cursor(cursor_factory=DictCursor) as cur:
                     cur.execute(
                         "SELECT sender, content, timestamp FROM chat_messages WHERE session_id = %s ORDER BY timestamp ASC",
@@ -135,6 +315,7 @@ class ChatManager:
                     )
                     return [dict(row) for row in cur.fetchall()]
         except Exception as e:
+            POSTGRES_ERRORS.labels(operation='get_history').inc()
             self.logger.error(f"Error al obtener historial de chat: {e}")
             return []
 
@@ -149,7 +330,7 @@ class ChatManager:
             Lista de mensajes con role y content
         """
         try:
-            with psycopg2.connect(self.db_connection) as conn:
+            with self._pool.connection() as conn:
                 with conn.cursor(cursor_factory=DictCursor) as cur:
                     cur.execute(
                         "SELECT sender, content FROM chat_messages WHERE session_id = %s ORDER BY timestamp ASC",
@@ -157,9 +338,204 @@ class ChatManager:
                     )
                     return [{"role": row["sender"], "content": row["content"]} for row in cur.fetchall()]
         except Exception as e:
+            POSTGRES_ERRORS.labels(operation='get_session_messages').inc()
             self.logger.error(f"Error al obtener mensajes de sesión: {e}")
             return []
 
+    def get_messages_page(self, session_id: str, limit: int = 50, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Obtiene una página de mensajes de una sesión, de los más recientes hacia atrás.
+        
+        Usa paginación por keyset sobre (timestamp, id), por lo que el costo de
+        cada página no depende de la longitud de la conversación.
+        
+        Args:
+            session_id: ID de la sesión
+            limit: Cantidad máxima de mensajes en la página
+            cursor: Cursor devuelto por la página anterior (None = más recientes)
+            
+        Returns:
+            Diccionario con 'messages' (role y content, en orden cronológico)
+            y 'next_cursor' para pedir mensajes más antiguos (None si no hay más)
+            
+        Raises:
+            ValueError: Si el cursor no es válido
+        """
+        posicion = decode_cursor(cursor)
+        try:
+            with self._pool.connection() as conn:
+                with conn.cursor(cursor_factory=DictCursor) as cur:
+                    if posicion:
+                        cur.execute(
+                            "SELECT id, sender, content, timestamp FROM chat_messages "
+                            "WHERE session_id = %s AND (timestamp, id) < (%s, %s) "
+                            "ORDER BY timestamp DESC, id DESC LIMIT %s",
+                            (session_id, posicion[0], posicion[1], limit + 1)
+                        )
+                    else:
+                        cur.execute(
+                            "SELECT id, sender, content, timestamp FROM chat_messages "
+                            "WHERE session_id = %s "
+                            "ORDER BY timestamp DESC, id DESC LIMIT %s",
+                            (session_id, limit + 1)
+                        )
+                    rows = cur.fetchall()
+        except Exception as e:
+            POSTGRES_ERRORS.labels(operation='get_messages_page').inc()
+            self.logger.error(f"Error al obtener mensajes de sesión: {e}")
+            return {'messages': [], 'next_cursor': None}
+
+        pagina = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            ultimo = pagina[-1]
+            next_cursor = encode_cursor(ultimo['timestamp'], ultimo['id'])
+        latest_cursor = None
+        if not posicion and pagina:
+            latest_cursor = encode_cursor(pagina[0]['timestamp'], pagina[0]['id'])
+        return {
+            'messages': [
+                {"role": row["sender"], "content": row["content"]} for row in reversed(pagina)
+            ],
+            'next_cursor': next_cursor,
+            'latest_cursor': latest_cursor,
+        }
+
+    def get_messages_since(self, session_id: str, since: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """
+        Obtiene los mensajes posteriores a un cursor, en orden cronológico.
+        
+        Permite que la interfaz pida solo lo nuevo en lugar de volver a
+        descargar la conversación completa.
+        
+        Args:
+            session_id: ID de la sesión
+            since: Cursor del último mensaje que ya tiene el cliente (None = desde el principio)
+            limit: Cantidad máxima de mensajes a devolver
+            
+        Returns:
+            Diccionario con 'messages', 'latest_cursor' (para la próxima
+            consulta) y 'has_more' si quedaron mensajes nuevos sin devolver
+            
+        Raises:
+            ValueError: Si el cursor no es válido
+        """
+        posicion = decode_cursor(since)
+        try:
+            with self._pool.connection() as conn:
+                with conn.cursor(cursor_factory=DictCursor) as cur:
+                    if posicion:
+                        cur.execute(
+                            "SELECT id, sender, content, timestamp FROM chat_messages "
+                            "WHERE session_id = %s AND (timestamp, id) > (%s, %s) "
+                            "ORDER BY timestamp, id LIMIT %s",
+                            (session_id, posicion[0], posicion[1], limit + 1)
+                        )
+                    else:
+                        cur.execute(
+                            "SELECT id, sender, content, timestamp FROM chat_messages "
+                            "WHERE session_id = %s "
+                            "ORDER BY timestamp, id LIMIT %s",
+                            (session_id, limit + 1)
+                        )
+                    rows = cur.fetchall()
+        except Exception as e:
+            POSTGRES_ERRORS.labels(operation='get_messages_since').inc()
+            self.logger.error(f"Error al obtener mensajes nuevos de sesión: {e}")
+            return {'messages': [], 'latest_cursor': since, 'has_more': False}
+
+        pagina = rows[:limit]
+        latest_cursor = since
+        if pagina:
+            latest_cursor = encode_cursor(pagina[-1]['timestamp'], pagina[-1]['id'])
+        return {
+            'messages': [{"role": row["sender"], "content": row["content"]} for row in pagina],
+            'latest_cursor': latest_cursor,
+            'has_more': len(rows) > limit,
+        }
+
+    def get_session_version(self, session_id: str) -> Optional[datetime]:
+        """
+        Obtiene la versión (updated_at) de una sesión para validar cachés HTTP.
+        
+        Las escrituras de este proceso actualizan la versión en memoria y las
+        de otros procesos worker llegan por LISTEN/NOTIFY (``VersionListener``),
+        por lo que una conversación sin cambios se valida sin consultar
+        Postgres. Mientras la escucha está caída no se confía en la memoria y
+        cada llamada lee la base de datos; ``version_cache_seconds`` acota
+        además la vida de cada versión recordada (con ``version_notify``
+        deshabilitado, es lo que tarda en verse la escritura de otro worker).
+        
+        Args:
+            session_id: ID de la sesión
+            
+        Returns:
+            Fecha de la última modificación o None si la sesión no existe
+        """
+        with self._versiones_lock:
+            entrada = self._versiones.get(session_id)
+            confiable = self._listener is None or self._listener.activo
+            if entrada and confiable and time.monotonic() - entrada[1] < self.version_cache_seconds:
+                self._versiones.move_to_end(session_id)
+                return entrada[0]
+        consulta = time.monotonic()
+        try:
+            with self._pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT updated_at FROM chat_sessions WHERE id = %s", (session_id,))
+                    row = cur.fetchone()
+        except Exception as e:
+            POSTGRES_ERRORS.labels(operation='get_session_version').inc()
+            self.logger.error(f"Error al obtener versión de sesión: {e}")
+            return None
+        if row is None:
+            return None
+        self._remember_version(session_id, row[0], desde=consulta)
+        return row[0]
+
+    def _remember_version(self, session_id: str, updated_at: datetime, desde: Optional[float] = None):
+        """
+        Guarda en memoria la versión de una sesión, descartando las menos usadas.
+        
+        Args:
+            session_id: ID de la sesión
+            updated_at: Fecha de la última modificación
+            desde: Momento (``time.monotonic``) en que se empezó a leer la
+                versión de Postgres; no reemplaza la que llegó por un aviso
+                posterior ni se guarda si la escucha se reinició entretanto
+        """
+        with self._versiones_lock:
+            if desde is not None:
+                entrada = self._versiones.get(session_id)
+                if desde < self._reinicio_versiones or (entrada and entrada[1] > desde):
+                    return
+            self._versiones[session_id] = (updated_at, time.monotonic())
+            self._versiones.move_to_end(session_id)
+            while len(self._versiones) > self.MAX_CACHED_VERSIONS:
+                self._versiones.popitem(last=False)
+
+    def _notified_version(self, session_id: str, updated_at: datetime):
+        """
+        Aplica el aviso de una sesión modificada por algún worker.
+        
+        Solo se actualizan las sesiones que ya están en memoria. Postgres
+        entrega los avisos en el orden en que se confirmaron las escrituras.
+        
+        Args:
+            session_id: ID de la sesión
+            updated_at: Nueva versión de la sesión
+        """
+        with self._versiones_lock:
+            entrada = self._versiones.get(session_id)
+            if entrada is not None:
+                self._versiones[session_id] = (updated_at, time.monotonic())
+
+    def _forget_versions(self):
+        """Descarta las versiones en memoria (la escucha pudo perder avisos)."""
+        with self._versiones_lock:
+            self._versiones.clear()
+            self._reinicio_versiones = time.monotonic()
+
     def generate_response(self, session_id: str, pregunta: str) -> str:
         """
         Genera una respuesta a la pregunta del usuario utilizando RAG.
@@ -171,51 +547,452 @@ class ChatManager:
         Returns:
             Respuesta generada
         """
+        turno = self._new_turn(session_id)
+        try:
+            prompt, contexto, clave = self._prepare_turn(turno, pregunta)
+            with medir_tiempo(turno['tiempos'], 'llm_ms'):
+                respuesta, uso, compartida = self._coalesce(
+                    clave, lambda: self._generate(prompt, contexto)
+                )
+            self._finish_turn(turno, pregunta, respuesta, uso, compartida)
+            return respuesta
+        except Exception as e:
+            return self._fail_turn(turno, e)
+        finally:
+            self._close_turn(turno)
+
+    async def agenerate_response(self, session_id: str, pregunta: str) -> str:
+        """
+        Versión asíncrona de ``generate_response`` para el modo de servicio asíncrono.
+        
+        Las etapas cortas y bloqueantes (búsqueda, historial, persistencia) se
+        ejecutan en el pool de hilos del event loop; la llamada al LLM, que es
+        la etapa larga, se hace con un cliente asíncrono y no ocupa ningún hilo
+        mientras espera.
+        
+        Args:
+            session_id: ID de la sesión
+            pregunta: Pregunta del usuario
+            
+        Returns:
+            Respuesta generada
+        """
+        turno = self._new_turn(session_id)
         try:
-            resultados = self.qdrant.search(pregunta, limit=5)
-            fragmentos = [r.get('chunk_text', '') for r in resultados]
-            fragmentos_ordenados = rerank_fragments(pregunta, fragmentos)
-            contexto = '\n'.join(fragmentos_ordenados[:3])
-            historial = self.get_history(session_id)
-            historial_texto = '\n'.join([
-                f"{m['sender']}: {m['content']}" for m in historial
-            ])
-            prompt = PROMPT_CHAT.format(historial=historial_texto, pregunta=pregunta)
-            respuesta = self._call_llm(prompt, contexto)
-            self.add_message(session_id, "user", pregunta)
-            self.add_message(session_id, "assistant", respuesta)
+            prompt, contexto, clave = await asyncio.to_thread(self._prepare_turn, turno, pregunta)
+            with medir_tiempo(turno['tiempos'], 'llm_ms'):
+                respuesta, uso, compartida = await self._acoalesce(
+                    clave, lambda: self._agenerate(prompt, contexto)
+                )
+            await asyncio.to_thread(self._finish_turn, turno, pregunta, respuesta, uso, compartida)
             return respuesta
         except Exception as e:
-            self.logger.error(f"Error al generar respuesta: {e}")
-            error_message = "Lo siento, no pude generar una respuesta en este momento."
-            self.add_message(session_id, "assistant", error_message)
-            return error_message
+            return await asyncio.to_thread(self._fail_turn, turno, e)
+        finally:
+            await asyncio.to_thread(self._close_turn, turno)
+
+    async def astream_response(self, session_id: str, pregunta: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Genera la respuesta como eventos, enviando el texto a medida que el LLM lo produce.
+        
+        Recorre las mismas etapas que ``agenerate_response`` (búsqueda
+        compartida, historial, empaquetado, persistencia y métricas). La
+        generación no se comparte entre preguntas idénticas porque cada
+        cliente recibe su propio flujo de tokens.
+        
+        Args:
+            session_id: ID de la sesión
+            pregunta: Pregunta del usuario
+            
+        Yields:
+            Eventos ``{'type': 'token', 'text': ...}`` y un evento final
+            ``{'type': 'done', 'response': ...}`` con la respuesta completa
+            (o el mensaje de error si el turno falló)
+        """
+        turno = self._new_turn(session_id)
+        try:
+            prompt, contexto, _ = await asyncio.to_thread(self._prepare_turn, turno, pregunta)
+            partes: List[str] = []
+            uso: Dict[str, Any] = {}
+            with medir_tiempo(turno['tiempos'], 'llm_ms'):
+                async for parte in self._astream_llm(prompt, contexto, uso):
+                    partes.append(parte)
+                    yield {'type': 'token', 'text': parte}
+            respuesta = ''.join(partes).strip()
+            await asyncio.to_thread(self._finish_turn, turno, pregunta, respuesta, uso, False)
+        except (asyncio.CancelledError, GeneratorExit):
+            # El cliente se desconectó a mitad de la respuesta: no se guarda el turno
+            turno['error'] = True
+            raise
+        except Exception as e:
+            respuesta = await asyncio.to_thread(self._fail_turn, turno, e)
+        finally:
+            await asyncio.to_thread(self._close_turn, turno)
+        yield {'type': 'done', 'response': respuesta}
+
+    def _new_turn(self, session_id: str) -> Dict[str, Any]:
+        """
+        Crea el registro de un turno de chat que recorre todas las etapas.
+        
+        Args:
+            session_id: ID de la sesión
+            
+        Returns:
+            Registro del turno con sus tiempos por etapa
+        """
+        return {
+            'session_id': session_id,
+            'created_at': datetime.now(),
+            'coalesced': False,
+            'error': False,
+            'tiempos': {},
+            'inicio': time.perf_counter(),
+        }
+
+    def _prepare_turn(self, turno: Dict[str, Any], pregunta: str):
+        """
+        Ejecuta las etapas previas al LLM: búsqueda, historial y empaquetado del contexto.
+        
+        Args:
+            turno: Registro del turno
+            pregunta: Pregunta del usuario
+            
+        Returns:
+            Tupla con (prompt, contexto, clave para compartir la generación)
+        """
+        tiempos = turno['tiempos']
+        clave = (self.qdrant.collection_name, normalizar_pregunta(pregunta))
+        with medir_tiempo(tiempos, 'retrieval_ms'):
+            candidatos, tiempos_busqueda, compartida = self._coalesce(
+                ('retrieval',) + clave,
+                lambda: self._retrieve_context(pregunta)
+            )
+        tiempos.update(tiempos_busqueda)
+        turno['coalesced'] |= compartida
+        with medir_tiempo(tiempos, 'history_ms'):
+            historial = self.get_history(turno['session_id'])
+        historial = trim_history(historial, self.history_tokens)
+        historial_texto = '\n'.join([
+            f"{m['sender']}: {m['content']}" for m in historial
+        ])
+        prompt = PROMPT_CHAT.format(historial=historial_texto, pregunta=pregunta)
+        contexto, turno['chunk_ids'] = self._pack_context(prompt, candidatos)
+        # La generación solo se comparte entre turnos con el mismo historial
+        huella_historial = hashlib.sha1(historial_texto.encode('utf-8')).hexdigest()
+        return prompt, contexto, ('generation',) + clave + (huella_historial,)
+
+    def _finish_turn(self, turno: Dict[str, Any], pregunta: str, respuesta: str,
+                     uso: Dict[str, Any], compartida: bool):
+        """
+        Guarda la pregunta y la respuesta de un turno completado.
+        
+        Args:
+            turno: Registro del turno
+            pregunta: Pregunta del usuario
+            respuesta: Respuesta generada
+            uso: Tokens usados por el LLM
+            compartida: Si la respuesta se obtuvo de otra llamada en vuelo
+        """
+        turno.update(uso)
+        turno['coalesced'] |= compartida
+        with medir_tiempo(turno['tiempos'], 'persist_ms'):
+            self.add_message(turno['session_id'], "user", pregunta)
+            self.add_message(turno['session_id'], "assistant", respuesta)
+
+    def _fail_turn(self, turno: Dict[str, Any], error: Exception) -> str:
+        """
+        Registra un turno fallido y guarda el mensaje de error para el usuario.
+        
+        Args:
+            turno: Registro del turno
+            error: Excepción que interrumpió el turno
+            
+        Returns:
+            Mensaje de error mostrado al usuario
+        """
+        self.logger.error(f"Error al generar respuesta: {error}")
+        turno['error'] = True
+        error_message = "Lo siento, no pude generar una respuesta en este momento."
+        self.add_message(turno['session_id'], "assistant", error_message)
+        return error_message
+
+    def _close_turn(self, turno: Dict[str, Any]):
+        """
+        Completa la duración total del turno y guarda sus métricas.
+        
+        Args:
+            turno: Registro del turno
+        """
+        tiempos = turno['tiempos']
+        tiempos['total_ms'] = (time.perf_counter() - turno['inicio']) * 1000
+        CHAT_TURNS.labels(outcome='error' if turno['error'] else 'ok').inc()
+        for etapa, ms in tiempos.items():
+            CHAT_STAGE_SECONDS.labels(stage=etapa[:-3]).observe(ms / 1000)
+        registro = {k: v for k, v in turno.items() if k not in ('tiempos', 'inicio')}
+        registro.update(tiempos)
+        self._record_turn(registro)
+
+    def _coalesce(self, key, fn):
+        """
+        Ejecuta ``fn`` compartiendo el resultado con llamadas idénticas en vuelo.
+        
+        Args:
+            key: Clave que identifica la llamada
+            fn: Función a ejecutar que devuelve una tupla
+            
+        Returns:
+            Tupla devuelta por ``fn`` con un último elemento que indica si el
+            resultado se obtuvo de otra llamada en vuelo
+        """
+        if not self.coalesce_requests:
+            return fn() + (False,)
+        propio = []
+
+        def ejecutar():
+            propio.append(True)
+            return fn()
+
+        resultado = self._single_flight.do(key, ejecutar)
+        if not propio:
+            CHAT_COALESCED.labels(stage=key[0]).inc()
+        return resultado + (not propio,)
+
+    async def _acoalesce(self, key, fn):
+        """
+        Versión asíncrona de ``_coalesce`` para funciones que devuelven corrutinas.
+        
+        Args:
+            key: Clave que identifica la llamada
+            fn: Función que devuelve una corrutina que resuelve en una tupla
+            
+        Returns:
+            Tupla resultante con un último elemento que indica si fue compartida
+        """
+        if not self.coalesce_requests:
+            return await fn() + (False,)
+        propio = []
+
+        def ejecutar():
+            propio.append(True)
+            return fn()
+
+        resultado = await self._single_flight.ado(key, ejecutar)
+        if not propio:
+            CHAT_COALESCED.labels(stage=key[0]).inc()
+        return resultado + (not propio,)
+
+    def _retrieve_context(self, pregunta: str):
+        """
+        Busca y reordena los fragmentos candidatos para la pregunta.
+        
+        Args:
+            pregunta: Pregunta del usuario
+            
+        Returns:
+            Tupla con (candidatos ordenados por relevancia con 'text' e 'id',
+            tiempos de embed_ms, search_ms y rerank_ms)
+        """
+        tiempos: Dict[str, float] = {}
+        resultados = self.qdrant.search(pregunta, limit=self.search_limit, timings=tiempos)
+        with medir_tiempo(tiempos, 'rerank_ms'):
+            textos = {r.get('chunk_text', ''): r.get('point_id') for r in resultados}
+            fragmentos_ordenados = rerank_fragments(pregunta, list(textos))
+        candidatos = [{'text': f, 'id': textos[f]} for f in fragmentos_ordenados]
+        return candidatos, tiempos
+
+    def _pack_context(self, prompt: str, candidatos: List[Dict[str, Any]]):
+        """
+        Llena el presupuesto de tokens del contexto con los mejores candidatos.
+        
+        El presupuesto es la ventana del modelo menos la respuesta reservada,
+        el mensaje de sistema y el prompt (que ya incluye el historial recortado).
+        
+        Args:
+            prompt: Prompt con historial y pregunta
+            candidatos: Candidatos ordenados devueltos por ``_retrieve_context``
+            
+        Returns:
+            Tupla con (contexto, IDs de los fragmentos incluidos)
+        """
+        presupuesto = (
+            self.context_window
+            - self.answer_tokens
+            - estimate_tokens(PROMPT_SISTEMA)
+            - estimate_tokens(prompt)
+            - 32  # Encabezado del contexto y marcas de rol de la plantilla del modelo
+        )
+        empaquetados = pack_context([c['text'] for c in candidatos], presupuesto)
+        contexto = '\n\n'.join(texto for _, texto in empaquetados)
+        return contexto, [candidatos[i]['id'] for i, _ in empaquetados]
+
+    def _generate(self, prompt: str, contexto: str):
+        """
+        Genera la respuesta con el LLM y devuelve el uso de tokens.
+        
+        Args:
+            prompt: Prompt para el modelo
+            contexto: Contexto relevante para la respuesta
+            
+        Returns:
+            Tupla con (respuesta, diccionario con prompt_tokens y completion_tokens)
+        """
+        uso: Dict[str, Any] = {}
+        respuesta = self._call_llm(prompt, contexto, uso)
+        return respuesta, uso
+
+    def _record_turn(self, turno: Dict[str, Any]):
+        """
+        Guarda las métricas de un turno de chat sin interrumpir la respuesta si falla.
+        
+        Args:
+            turno: Registro del turno (ver chat.turn_metrics.registrar_turno)
+        """
+        try:
+            with self._pool.connection() as conn:
+                registrar_turno(conn, turno)
+        except Exception as e:
+            POSTGRES_ERRORS.labels(operation='record_turn').inc()
+            self.logger.warning(f"No se pudieron registrar las métricas del turno: {e}")
 
-    def _call_llm(self, prompt: str, contexto: str) -> str:
+    def _call_llm(self, prompt: str, contexto: str, uso: Optional[Dict[str, Any]] = None) -> str:
         """
         Llama al modelo de lenguaje para generar una respuesta.
         
         Args:
             prompt: Prompt para el modelo
             contexto: Contexto relevante para la respuesta
+            uso: Diccionario opcional donde guardar prompt_tokens y completion_tokens
             
         Returns:
             Respuesta generada por el modelo
         """
         try:
-            client = OpenAI(base_url=self.ollama_url + "/v1", api_key='ollama')
-            completion = client.chat.completions.create(
+            if self._llm is None:
+                self._llm = self._cliente_llm()
+            completion = self._llm.chat.completions.create(
                 model=self.model_name,
-                messages=[
-                    {"role": "system", "content": "Eres un asistente útil de Moodle. Responde en español."},
-                    {"role": "user", "content": f"{prompt}\n\nContexto relevante:\n{contexto}"},
-                ],
+                messages=self._llm_messages(prompt, contexto),
+                max_tokens=self.answer_tokens,
             )
-            return completion.choices[0].message.content.strip()
+            return self._read_completion(completion, uso)
         except Exception as e:
+            LLM_ERRORS.inc()
             self.logger.error(f"Error al llamar al LLM: {e}")
             return ""
 
+    async def _agenerate(self, prompt: str, contexto: str):
+        """
+        Versión asíncrona de ``_generate``.
+        
+        Args:
+            prompt: Prompt para el modelo
+            contexto: Contexto relevante para la respuesta
+            
+        Returns:
+            Tupla con (respuesta, diccionario con prompt_tokens y completion_tokens)
+        """
+        uso: Dict[str, Any] = {}
+        respuesta = await self._acall_llm(prompt, contexto, uso)
+        return respuesta, uso
+
+    async def _acall_llm(self, prompt: str, contexto: str, uso: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Llama al modelo de lenguaje sin bloquear el event loop.
+        
+        Args:
+            prompt: Prompt para el modelo
+            contexto: Contexto relevante para la respuesta
+            uso: Diccionario opcional donde guardar prompt_tokens y completion_tokens
+            
+        Returns:
+            Respuesta generada por el modelo
+        """
+        try:
+            if self._async_llm is None:
+                self._async_llm = self._cliente_llm_async()
+            completion = await self._async_llm.chat.completions.create(
+                model=self.model_name,
+                messages=self._llm_messages(prompt, contexto),
+                max_tokens=self.answer_tokens,
+            )
+            return self._read_completion(completion, uso)
+        except Exception as e:
+            LLM_ERRORS.inc()
+            self.logger.error(f"Error al llamar al LLM: {e}")
+            return ""
+
+    async def _astream_llm(self, prompt: str, contexto: str, uso: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Llama al modelo de lenguaje en modo streaming.
+        
+        Args:
+            prompt: Prompt para el modelo
+            contexto: Contexto relevante para la respuesta
+            uso: Diccionario donde guardar prompt_tokens y completion_tokens
+            
+        Yields:
+            Fragmentos de texto de la respuesta
+            
+        Raises:
+            ErrorChat: Si falla la llamada al LLM
+        """
+        try:
+            if self._async_llm is None:
+                self._async_llm = self._cliente_llm_async()
+            stream = await self._async_llm.chat.completions.create(
+                model=self.model_name,
+                messages=self._llm_messages(prompt, contexto),
+                max_tokens=self.answer_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async for chunk in stream:
+                if chunk.usage:
+                    uso['prompt_tokens'] = chunk.usage.prompt_tokens
+                    uso['completion_tokens'] = chunk.usage.completion_tokens
+                    LLM_TOKENS.labels(kind='prompt').inc(chunk.usage.prompt_tokens)
+                    LLM_TOKENS.labels(kind='completion').inc(chunk.usage.completion_tokens)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            LLM_ERRORS.inc()
+            self.logger.error(f"Error al llamar al LLM en modo streaming: {e}")
+            raise ErrorChat(str(e))
+
+    def _llm_messages(self, prompt: str, contexto: str) -> List[Dict[str, str]]:
+        """
+        Arma los mensajes de sistema y usuario enviados al LLM.
+        
+        Args:
+            prompt: Prompt para el modelo
+            contexto: Contexto relevante para la respuesta
+            
+        Returns:
+            Lista de mensajes en formato de chat
+        """
+        return [
+            {"role": "system", "content": PROMPT_SISTEMA},
+            {"role": "user", "content": f"{prompt}\n\nContexto relevante:\n{contexto}"},
+        ]
+
+    def _read_completion(self, completion, uso: Optional[Dict[str, Any]]) -> str:
+        """
+        Extrae el texto de la respuesta del LLM y el uso de tokens.
+        
+        Args:
+            completion: Respuesta de la API de chat
+            uso: Diccionario opcional donde guardar prompt_tokens y completion_tokens
+            
+        Returns:
+            Texto de la respuesta
+        """
+        if uso is not None and completion.usage:
+            uso['prompt_tokens'] = completion.usage.prompt_tokens
+            uso['completion_tokens'] = completion.usage.completion_tokens
+            LLM_TOKENS.labels(kind='prompt').inc(completion.usage.prompt_tokens)
+            LLM_TOKENS.labels(kind='completion').inc(completion.usage.completion_tokens)
+        return completion.choices[0].message.content.strip()
+
     def start_interactive_chat(self):
         """
         Inicia un chat interactivo en la consola.
@@ -243,12 +1020,72 @@ class ChatManager:
             Lista de sesiones con id, created_at y updated_at
         """
         try:
-            with psycopg2.connect(self.db_connection) as conn:
+            with self._pool.connection() as conn:
                 with conn.cursor(cursor_factory=DictCursor) as cur:
                     cur.execute(
                         "SELECT id, created_at, updated_at FROM chat_sessions ORDER BY updated_at DESC"
                     )
                     return [dict(row) for row in cur.fetchall()]
         except Exception as e:
+            POSTGRES_ERRORS.labels(operation='get_sessions').inc()
+            self.logger.error(f"Error al obtener sesiones: {e}")
+            return []
+
+    def get_sessions_page(self, limit: int = 20, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Obtiene una página de sesiones ordenadas por última actualización.
+        
+        La cantidad de mensajes y la vista previa del último mensaje se calculan
+        en la misma consulta mediante LATERAL JOIN sobre el índice de mensajes.
+        
+        Args:
+            limit: Cantidad máxima de sesiones en la página
+            cursor: Cursor devuelto por la página anterior (None = primera página)
+            
+        Returns:
+            Diccionario con 'sessions' (id, created_at, updated_at, message_count,
+            last_message) y 'next_cursor' (None si no hay más páginas)
+            
+        Raises:
+            ValueError: Si el cursor no es válido
+        """
+        posicion = decode_cursor(cursor)
+        consulta = """
+            SELECT s.id, s.created_at, s.updated_at,
+                   c.message_count, LEFT(l.content, 120) AS last_message
+            FROM chat_sessions s
+            LEFT JOIN LATERAL (
+                SELECT COUNT(*) AS message_count
+                FROM chat_messages m WHERE m.session_id = s.id
+            ) c ON TRUE
+            LEFT JOIN LATERAL (
+                SELECT m.content FROM chat_messages m
+                WHERE m.session_id = s.id
+                ORDER BY m.timestamp DESC LIMIT 1
+            ) l ON TRUE
+            {filtro}
+            ORDER BY s.updated_at DESC, s.id DESC
+            LIMIT %s
+        """
+        try:
+            with self._pool.connection() as conn:
+                with conn.cursor(cursor_factory=DictCursor) as cur:
+                    if posicion:
+                        cur.execute(
+                            consulta.format(filtro="WHERE (s.updated_at, s.id) < (%s, %s)"),
+                            (posicion[0], posicion[1], limit + 1)
+                        )
+                    else:
+                        cur.execute(consulta.format(filtro=""), (limit + 1,))
+                    rows = [dict(row) for row in cur.fetchall()]
+        except Exception as e:
+            POSTGRES_ERRORS.labels(operation='get_sessions_page').inc()
             self.logger.error(f"Error al obtener sesiones: {e}")
-            return []
\ No newline at end of file
+            return {'sessions': [], 'next_cursor': None}
+
+        pagina = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            ultima = pagina[-1]
+            next_cursor = encode_cursor(ultima['updated_at'], ultima['id'])
+        return {'sessions': pagina, 'next_cursor': next_cursor}
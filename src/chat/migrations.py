@@ -0,0 +1,304 @@
+"""
+Migraciones versionadas del esquema de chat en PostgreSQL.
+
+Cada migración tiene un número de versión único y se registra en la tabla
+``schema_migrations`` una vez aplicada. Las migraciones opcionales solo se
+aplican cuando su opción está habilitada en la configuración, por lo que
+pueden activarse más adelante sin afectar a las ya aplicadas.
+"""
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+# Lista ordenada de migraciones. 'opcion' indica la clave de configuración
+# que debe estar habilitada para aplicar la migración (None = siempre).
+# Cada paso de 'sql' es una sentencia o una función que recibe el cursor.
+MIGRACIONES: List[Dict[str, Any]] = [
+    {
+        'version': 1,
+        'descripcion': 'Tablas base de sesiones y mensajes',
+        'opcion': None,
+        'sql': [
+            """
+            CREATE TABLE IF NOT EXISTS chat_sessions (
+                id VARCHAR(36) PRIMARY KEY,
+                created_at TIMESTAMP NOT NULL,
+                updated_at TIMESTAMP NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id VARCHAR(36) PRIMARY KEY,
+                session_id VARCHAR(36) REFERENCES chat_sessions(id),
+                sender VARCHAR(16) NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TIMESTAMP NOT NULL
+            )
+            """,
+        ],
+    },
+    {
+        'version': 2,
+        'descripcion': 'Índices compuestos para historial y listado de sesiones',
+        'opcion': None,
+        'sql': [
+            "CREATE INDEX IF NOT EXISTS ix_chat_messages_session_ts "
+            "ON chat_messages (session_id, timestamp)",
+            "CREATE INDEX IF NOT EXISTS ix_chat_sessions_updated "
+            "ON chat_sessions (updated_at DESC, id DESC)",
+        ],
+    },
+    {
+        'version': 3,
+        'descripcion': 'Claves compactas: VARCHAR(36) a UUID nativo (16 bytes)',
+        'opcion': 'compact_keys',
+        'sql': [
+            "ALTER TABLE chat_messages DROP CONSTRAINT IF EXISTS chat_messages_session_id_fkey",
+            "ALTER TABLE chat_sessions ALTER COLUMN id TYPE UUID USING id::uuid",
+            "ALTER TABLE chat_messages "
+            "ALTER COLUMN id TYPE UUID USING id::uuid, "
+            "ALTER COLUMN session_id TYPE UUID USING session_id::uuid",
+            "ALTER TABLE chat_messages ADD CONSTRAINT chat_messages_session_id_fkey "
+            "FOREIGN KEY (session_id) REFERENCES chat_sessions(id)",
+        ],
+    },
+    {
+        'version': 4,
+        'descripcion': 'Particionado mensual de chat_messages por timestamp',
+        'opcion': 'partition_messages',
+        'sql': [
+            "CREATE TABLE chat_messages_particionada (LIKE chat_messages INCLUDING DEFAULTS) "
+            "PARTITION BY RANGE (timestamp)",
+            "ALTER TABLE chat_messages_particionada ADD PRIMARY KEY (id, timestamp)",
+            "CREATE TABLE chat_messages_default PARTITION OF chat_messages_particionada DEFAULT",
+            lambda cur: crear_particiones(cur, tabla='chat_messages_particionada'),
+            "INSERT INTO chat_messages_particionada SELECT * FROM chat_messages",
+            "DROP TABLE chat_messages",
+            "ALTER TABLE chat_messages_particionada RENAME TO chat_messages",
+            "ALTER TABLE chat_messages ADD CONSTRAINT chat_messages_session_id_fkey "
+            "FOREIGN KEY (session_id) REFERENCES chat_sessions(id)",
+            "CREATE INDEX IF NOT EXISTS ix_chat_messages_session_ts "
+            "ON chat_messages (session_id, timestamp)",
+        ],
+    },
+    {
+        'version': 5,
+        'descripcion': 'Métricas de latencia por turno de chat',
+        'opcion': None,
+        'sql': [
+            """
+            CREATE TABLE IF NOT EXISTS chat_turn_metrics (
+                id BIGSERIAL PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                created_at TIMESTAMP NOT NULL,
+                embed_ms REAL,
+                search_ms REAL,
+                rerank_ms REAL,
+                retrieval_ms REAL,
+                history_ms REAL,
+                llm_ms REAL,
+                persist_ms REAL,
+                total_ms REAL NOT NULL,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                chunk_ids TEXT[],
+                coalesced BOOLEAN NOT NULL DEFAULT FALSE,
+                error BOOLEAN NOT NULL DEFAULT FALSE
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_chat_turn_metrics_created "
+            "ON chat_turn_metrics (created_at)",
+        ],
+    },
+]
+
+# Índices que deben existir para que las consultas de chat no recorran
+# tablas completas: (tabla, nombre del índice, columnas)
+INDICES_ESPERADOS = [
+    ('chat_messages', 'ix_chat_messages_session_ts', '(session_id, timestamp)'),
+    ('chat_sessions', 'ix_chat_sessions_updated', '(updated_at DESC, id DESC)'),
+    ('chat_turn_metrics', 'ix_chat_turn_metrics_created', '(created_at)'),
+]
+
+# Clave arbitraria para serializar migraciones entre procesos concurrentes
+_LOCK_MIGRACIONES = 72_026_001
+
+
+def _crear_tabla_versiones(cur):
+    """Crea la tabla de control de versiones si no existe."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            descripcion TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    """)
+
+
+def versiones_aplicadas(cur) -> List[int]:
+    """
+    Obtiene las versiones de migración ya aplicadas.
+
+    Args:
+        cur: Cursor de PostgreSQL
+
+    Returns:
+        Lista ordenada de versiones aplicadas
+    """
+    cur.execute("SELECT to_regclass('schema_migrations')")
+    if cur.fetchone()[0] is None:
+        return []
+    cur.execute("SELECT version FROM schema_migrations ORDER BY version")
+    return [row[0] for row in cur.fetchall()]
+
+
+def migraciones_pendientes(cur, opciones: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Obtiene las migraciones habilitadas que todavía no se aplicaron.
+
+    Args:
+        cur: Cursor de PostgreSQL
+        opciones: Opciones de configuración que habilitan migraciones opcionales
+
+    Returns:
+        Lista de migraciones pendientes en orden de versión
+    """
+    opciones = opciones or {}
+    aplicadas = set(versiones_aplicadas(cur))
+    return [
+        m for m in MIGRACIONES
+        if m['version'] not in aplicadas
+        and (m['opcion'] is None or opciones.get(m['opcion']))
+    ]
+
+
+def aplicar_migraciones(conn, opciones: Optional[Dict[str, Any]] = None, logger=None) -> List[int]:
+    """
+    Aplica las migraciones pendientes dentro de una transacción.
+
+    Un advisory lock evita que dos procesos (por ejemplo, varios workers web)
+    migren el esquema al mismo tiempo.
+
+    Args:
+        conn: Conexión de PostgreSQL (se confirma al salir del bloque ``with``)
+        opciones: Opciones de configuración que habilitan migraciones opcionales
+        logger: Logger donde informar las migraciones aplicadas
+
+    Returns:
+        Lista de versiones aplicadas en esta llamada
+    """
+    opciones = opciones or {}
+    aplicadas = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_MIGRACIONES,))
+        _crear_tabla_versiones(cur)
+        for migracion in migraciones_pendientes(cur, opciones):
+            if logger:
+                logger.info(f"Aplicando migración {migracion['version']}: {migracion['descripcion']}")
+            for paso in migracion['sql']:
+                if callable(paso):
+                    paso(cur)
+                else:
+                    cur.execute(paso)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, descripcion) VALUES (%s, %s)",
+                (migracion['version'], migracion['descripcion'])
+            )
+            aplicadas.append(migracion['version'])
+        if opciones.get('partition_messages'):
+            crear_particiones(cur, int(opciones.get('partition_months_ahead', 3)), logger)
+    return aplicadas
+
+
+def _sumar_meses(fecha: date, meses: int) -> date:
+    """Devuelve el primer día del mes desplazado ``meses`` respecto a ``fecha``."""
+    total = fecha.year * 12 + fecha.month - 1 + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def crear_particiones(cur, meses_adelante: int = 3, logger=None, tabla: str = 'chat_messages') -> List[str]:
+    """
+    Crea las particiones mensuales de chat_messages que falten.
+
+    Se crean las particiones del mes actual y de los ``meses_adelante``
+    siguientes. Si la partición por defecto ya contiene filas de ese rango,
+    PostgreSQL rechaza la creación; en ese caso se omite y se informa.
+
+    Args:
+        cur: Cursor de PostgreSQL
+        meses_adelante: Cantidad de meses futuros a preparar
+        logger: Logger donde informar las particiones creadas
+        tabla: Tabla particionada padre
+
+    Returns:
+        Lista de nombres de particiones creadas
+    """
+    creadas = []
+    inicio_mes = date.today().replace(day=1)
+    for i in range(meses_adelante + 1):
+        desde = _sumar_meses(inicio_mes, i)
+        hasta = _sumar_meses(inicio_mes, i + 1)
+        nombre = f"chat_messages_{desde.year}_{desde.month:02d}"
+        cur.execute("SELECT to_regclass(%s)", (nombre,))
+        if cur.fetchone()[0] is not None:
+            continue
+        cur.execute("SAVEPOINT crear_particion")
+        try:
+            cur.execute(
+                f"CREATE TABLE {nombre} PARTITION OF {tabla} "
+                "FOR VALUES FROM (%s) TO (%s)",
+                (desde, hasta)
+            )
+            cur.execute("RELEASE SAVEPOINT crear_particion")
+            creadas.append(nombre)
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT crear_particion")
+            if logger:
+                logger.warning(f"No se pudo crear la partición {nombre}: {e}")
+    if creadas and logger:
+        logger.info(f"Particiones creadas: {', '.join(creadas)}")
+    return creadas
+
+
+def verificar_indices(cur) -> List[Dict[str, str]]:
+    """
+    Comprueba qué índices esperados faltan en la base de datos.
+
+    Args:
+        cur: Cursor de PostgreSQL
+
+    Returns:
+        Lista de índices faltantes con tabla, nombre y columnas
+    """
+    cur.execute(
+        "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() "
+        "AND indexname = ANY(%s)",
+        ([nombre for _, nombre, _ in INDICES_ESPERADOS],)
+    )
+    existentes = {row[0] for row in cur.fetchall()}
+    return [
+        {'tabla': tabla, 'indice': nombre, 'columnas': columnas}
+        for tabla, nombre, columnas in INDICES_ESPERADOS
+        if nombre not in existentes
+    ]
+
+
+def informe_esquema(conn, opciones: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Genera un informe del estado del esquema sin modificarlo.
+
+    Args:
+        conn: Conexión de PostgreSQL
+        opciones: Opciones de configuración que habilitan migraciones opcionales
+
+    Returns:
+        Diccionario con versiones aplicadas, migraciones pendientes e índices faltantes
+    """
+    with conn.cursor() as cur:
+        return {
+            'aplicadas': versiones_aplicadas(cur),
+            'pendientes': [
+                f"{m['version']}: {m['descripcion']}"
+                for m in migraciones_pendientes(cur, opciones)
+            ],
+            'indices_faltantes': verificar_indices(cur),
+        }
@@ -0,0 +1,49 @@
+"""
+Cursores opacos para la paginación por keyset de sesiones y mensajes.
+
+Un cursor codifica la posición (timestamp, id) de la última fila devuelta,
+de forma que la página siguiente se obtiene con un rango sobre el índice en
+lugar de un OFFSET que recorre todas las filas anteriores.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+
+def encode_cursor(timestamp: datetime, row_id: Any) -> str:
+    """
+    Codifica una posición de keyset como cursor opaco.
+
+    Args:
+        timestamp: Marca temporal de la fila
+        row_id: ID de la fila (desempata filas con la misma marca temporal)
+
+    Returns:
+        Cursor en base64 apto para URLs
+    """
+    raw = json.dumps([timestamp.isoformat(), str(row_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, str]]:
+    """
+    Decodifica un cursor generado por ``encode_cursor``.
+
+    Args:
+        cursor: Cursor opaco (o None)
+
+    Returns:
+        Tupla (timestamp, id) o None si el cursor está vacío
+
+    Raises:
+        ValueError: Si el cursor no es válido
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(timestamp), row_id
+    except Exception as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
@@ -2,6 +2,8 @@
 Plantillas de prompts reutilizables para el sistema RAG. Todas en español.
 """
 
+PROMPT_SISTEMA="Eres un asistente útil de Moodle. Responde en español."
+
 PROMPT_BUSQUEDA="""
 Eres un asistente académico. Responde de forma clara y concisa usando solo la información relevante encontrada en los documentos del curso.
 Pregunta del usuario: {pregunta}
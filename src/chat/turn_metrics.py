@@ -0,0 +1,125 @@
+"""
+Registro y consulta de métricas de latencia por turno de chat.
+
+Cada turno guarda en ``chat_turn_metrics`` cuánto tardó cada etapa
+(embedding, búsqueda en Qdrant, reranking, historial, LLM y persistencia),
+los tokens usados y los IDs de los fragmentos recuperados.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+# Etapas registradas por turno, en el orden en que se ejecutan
+ETAPAS = [
+    'embed_ms', 'search_ms', 'rerank_ms', 'retrieval_ms',
+    'history_ms', 'llm_ms', 'persist_ms', 'total_ms',
+]
+
+PERCENTILES = [0.5, 0.9, 0.99]
+
+
+def registrar_turno(conn, registro: Dict[str, Any]):
+    """
+    Inserta el registro de un turno de chat.
+
+    Args:
+        conn: Conexión de PostgreSQL
+        registro: Diccionario con session_id, created_at, las etapas de ETAPAS,
+            prompt_tokens, completion_tokens, chunk_ids, coalesced y error
+    """
+    columnas = ['session_id', 'created_at'] + ETAPAS + [
+        'prompt_tokens', 'completion_tokens', 'chunk_ids', 'coalesced', 'error'
+    ]
+    valores = [registro.get(c) for c in columnas]
+    with conn.cursor() as cur:
+        cur.execute(
+            f"INSERT INTO chat_turn_metrics ({', '.join(columnas)}) "
+            f"VALUES ({', '.join(['%s'] * len(columnas))})",
+            valores
+        )
+
+
+def informe_latencias(conn, horas: float = 24, hasta: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Calcula percentiles de latencia por etapa en una ventana de tiempo.
+
+    Args:
+        conn: Conexión de PostgreSQL
+        horas: Tamaño de la ventana en horas
+        hasta: Fin de la ventana (por defecto, ahora)
+
+    Returns:
+        Diccionario con 'desde', 'hasta', 'turnos', 'errores', 'coalescidos',
+        'tokens' y 'etapas' (por etapa: p50, p90, p99 y media en ms)
+    """
+    hasta = hasta or datetime.now()
+    desde = hasta - timedelta(hours=horas)
+    agregados = []
+    for etapa in ETAPAS:
+        agregados.append(
+            f"percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY {etapa})"
+        )
+        agregados.append(f"AVG({etapa})")
+    consulta = f"""
+        SELECT COUNT(*), COUNT(*) FILTER (WHERE error), COUNT(*) FILTER (WHERE coalesced),
+               AVG(prompt_tokens), AVG(completion_tokens), {', '.join(agregados)}
+        FROM chat_turn_metrics
+        WHERE created_at >= %s AND created_at < %s
+    """
+    with conn.cursor() as cur:
+        cur.execute(consulta, [PERCENTILES] * len(ETAPAS) + [desde, hasta])
+        fila = cur.fetchone()
+
+    etapas = {}
+    for i, etapa in enumerate(ETAPAS):
+        percentiles, media = fila[5 + 2 * i], fila[6 + 2 * i]
+        percentiles = percentiles or [None] * len(PERCENTILES)
+        etapas[etapa] = {
+            'p50': percentiles[0],
+            'p90': percentiles[1],
+            'p99': percentiles[2],
+            'media': float(media) if media is not None else None,
+        }
+    return {
+        'desde': desde,
+        'hasta': hasta,
+        'turnos': fila[0],
+        'errores': fila[1],
+        'coalescidos': fila[2],
+        'tokens': {
+            'prompt_medio': float(fila[3]) if fila[3] is not None else None,
+            'respuesta_medio': float(fila[4]) if fila[4] is not None else None,
+        },
+        'etapas': etapas,
+    }
+
+
+def formatear_informe(informe: Dict[str, Any]) -> List[str]:
+    """
+    Da formato de tabla de texto a un informe de latencias.
+
+    Args:
+        informe: Informe devuelto por ``informe_latencias``
+
+    Returns:
+        Líneas de texto listas para imprimir
+    """
+    def ms(valor):
+        return f"{valor:10.1f}" if valor is not None else f"{'-':>10}"
+
+    lineas = [
+        f"Turnos entre {informe['desde']:%Y-%m-%d %H:%M} y {informe['hasta']:%Y-%m-%d %H:%M}: "
+        f"{informe['turnos']} (errores: {informe['errores']}, coalescidos: {informe['coalescidos']})",
+        f"{'etapa':<14}{'p50':>10}{'p90':>10}{'p99':>10}{'media':>10}",
+    ]
+    for etapa, valores in informe['etapas'].items():
+        lineas.append(
+            f"{etapa:<14}{ms(valores['p50'])}{ms(valores['p90'])}"
+            f"{ms(valores['p99'])}{ms(valores['media'])}"
+        )
+    tokens = informe['tokens']
+    if tokens['prompt_medio'] is not None:
+        lineas.append(
+            f"Tokens medios: prompt {tokens['prompt_medio']:.0f}, "
+            f"respuesta {tokens['respuesta_medio'] or 0:.0f}"
+        )
+    return lineas
@@ -0,0 +1,144 @@
+"""
+Avisos entre procesos worker de las sesiones modificadas.
+
+``ChatManager`` recuerda en memoria la versión (``updated_at``) de cada
+sesión para responder las revalidaciones de ``/messages`` sin consultar
+Postgres. Cada escritura de un mensaje emite ``NOTIFY`` en el canal
+``CANAL`` dentro de su transacción (Postgres lo entrega al confirmarla), y
+``VersionListener`` escucha ese canal en una conexión propia para que cada
+worker actualice su versión en memoria aunque la escritura la haya hecho
+otro.
+
+Mientras la conexión de escucha no está activa los avisos se pierden, así
+que ``activo`` es False y el gestor no confía en las versiones en memoria;
+al reconectarse se descartan todas, porque pudieron cambiar entretanto.
+"""
+import select
+import threading
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+from core import metrics
+from core.utils import configurar_logging
+
+# Canal de NOTIFY de las sesiones modificadas
+CANAL = 'chat_session_versions'
+
+NOTIFICATIONS = metrics.counter(
+    'rag_chat_version_notifications_total', 'Avisos recibidos de sesiones modificadas por algún worker')
+LISTENER_UP = metrics.gauge(
+    'rag_chat_version_listener_up', 'Conexión de escucha de versiones de sesión activa (1) o caída (0)')
+
+
+def aviso(session_id: str, updated_at: datetime) -> str:
+    """
+    Arma el contenido del NOTIFY de una sesión modificada.
+
+    Args:
+        session_id: ID de la sesión
+        updated_at: Nueva versión de la sesión
+
+    Returns:
+        Texto del aviso
+    """
+    return f"{session_id} {updated_at.isoformat()}"
+
+
+def leer_aviso(payload: str) -> Optional[Tuple[str, datetime]]:
+    """
+    Interpreta el contenido de un NOTIFY.
+
+    Args:
+        payload: Texto del aviso
+
+    Returns:
+        ID de la sesión y versión, o None si el aviso no es válido
+    """
+    session_id, _, version = payload.partition(' ')
+    try:
+        return session_id, datetime.fromisoformat(version)
+    except ValueError:
+        return None
+
+
+class VersionListener:
+    """
+    Hilo que escucha los avisos de sesiones modificadas en Postgres
+    """
+    def __init__(self, dsn: str, on_version: Callable[[str, datetime], None],
+                 on_reset: Callable[[], None], reconnect_seconds: float = 5.0):
+        """
+        Prepara la escucha (no se conecta hasta ``start``).
+
+        Args:
+            dsn: Cadena de conexión a PostgreSQL
+            on_version: Recibe el ID y la nueva versión de cada sesión modificada
+            on_reset: Se llama al (re)conectarse: los avisos anteriores se perdieron
+            reconnect_seconds: Espera antes de reintentar una conexión caída
+        """
+        self.dsn = dsn
+        self.on_version = on_version
+        self.on_reset = on_reset
+        self.reconnect_seconds = reconnect_seconds
+        self.logger = configurar_logging("version_listener")
+        self._detener = threading.Event()
+        self._activo = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        LISTENER_UP.set_function(lambda: 1 if self._activo.is_set() else 0)
+
+    @property
+    def activo(self) -> bool:
+        """Indica si la conexión de escucha está activa (los avisos llegan)."""
+        return self._activo.is_set()
+
+    def start(self):
+        """Inicia el hilo de escucha."""
+        self._hilo = threading.Thread(target=self._ejecutar, name="version-listener", daemon=True)
+        self._hilo.start()
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Detiene el hilo de escucha.
+
+        Args:
+            timeout: Segundos máximos de espera a que termine
+        """
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+
+    def _ejecutar(self):
+        """Escucha el canal y se reconecta mientras no se detenga."""
+        while not self._detener.is_set():
+            try:
+                self._escuchar()
+            except psycopg2.Error as e:
+                self.logger.warning(f"Escucha de versiones de sesión interrumpida: {e}; "
+                                    f"se reintenta en {self.reconnect_seconds}s")
+            finally:
+                self._activo.clear()
+            self._detener.wait(self.reconnect_seconds)
+
+    def _escuchar(self):
+        """Abre la conexión de escucha y atiende los avisos hasta que se cae o se detiene."""
+        conn = psycopg2.connect(self.dsn)
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CANAL}")
+            self.on_reset()
+            self._activo.set()
+            while not self._detener.is_set():
+                # Despertar cada segundo para ver si hay que detenerse
+                if select.select([conn], [], [], 1.0)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        NOTIFICATIONS.inc()
+                        leido = leer_aviso(conn.notifies.pop(0).payload)
+                        if leido is not None:
+                            self.on_version(*leido)
+        finally:
+            conn.close()
@@ -0,0 +1,58 @@
+"""
+Precalentamiento del chat antes de atender al primer usuario.
+
+Tras un despliegue o un reinicio de Ollama, la primera pregunta paga la
+carga de los modelos, las páginas frías de Qdrant y la apertura de
+conexiones. El precalentamiento hace ese trabajo al arrancar, de modo que
+la primera pregunta real tenga la latencia habitual.
+"""
+import logging
+from typing import Any, Dict
+
+from core import metrics
+
+# Consultas usadas si la configuración no define otras
+CONSULTAS_POR_DEFECTO = [
+    "¿De qué trata el curso?",
+    "¿Cuáles son los criterios de evaluación?",
+    "¿Cuándo son las fechas de entrega?",
+]
+
+WARMUP_SECONDS = metrics.gauge(
+    'rag_warmup_step_seconds', 'Duración de cada paso del último precalentamiento', ['step'])
+
+
+def precalentar(chat_manager, config: Dict[str, Any], logger: logging.Logger) -> Dict[str, float]:
+    """
+    Precalienta el almacén de vectores y el gestor de chat.
+
+    Los pasos que fallan se registran y no detienen el arranque: las sondas
+    de ``/readyz`` informan si la dependencia sigue sin responder.
+
+    Args:
+        chat_manager: Gestor de chat inicializado (con su VectorStore)
+        config: Configuración del sistema (sección ``warmup``)
+        logger: Logger donde informar el resultado
+
+    Returns:
+        Diccionario con la duración de cada paso en milisegundos
+    """
+    warmup = config.get('warmup') or {}
+    if not warmup.get('enabled', True):
+        return {}
+    consultas = warmup.get('queries') or CONSULTAS_POR_DEFECTO
+    pasos = [
+        ('vector_store', lambda: chat_manager.qdrant.warm_up(consultas, limit=chat_manager.search_limit)),
+        ('chat', chat_manager.warm_up),
+    ]
+    tiempos: Dict[str, float] = {}
+    for nombre, paso in pasos:
+        try:
+            tiempos.update(paso())
+        except Exception as e:
+            logger.warning(f"Falló el precalentamiento de {nombre}: {e}")
+    for paso, ms in tiempos.items():
+        WARMUP_SECONDS.labels(step=paso[:-3]).set(ms / 1000)
+    resumen = ', '.join(f"{paso[:-3]}={ms:.0f}ms" for paso, ms in tiempos.items())
+    logger.info(f"Precalentamiento completado: {resumen}")
+    return tiempos
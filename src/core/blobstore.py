@@ -0,0 +1,189 @@
+"""
+Almacén de archivos en disco identificados por hash.
+
+Las cachés del sistema (texto extraído, OCR, descargas de Moodle, cuerpos
+grabados en los fixtures) guardan cada entrada en un archivo cuyo nombre es
+un hash, repartido en subdirectorios por los dos primeros caracteres para
+no acumular miles de archivos en un solo directorio. Aquí está esa parte
+común: la ruta de cada clave, la publicación atómica (un archivo temporal
+en el mismo directorio que se renombra al terminar, así que un lector
+nunca ve una entrada a medio escribir) y, opcionalmente, el tamaño total
+con el descarte de las entradas usadas hace más tiempo.
+"""
+import contextlib
+import os
+import tempfile
+import threading
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+from core.utils import configurar_logging
+
+# Sufijo de los archivos a medio escribir
+SUFIJO_TEMPORAL = '.tmp'
+
+
+def ruta_blob(directory: str, clave: str, suffix: str = '') -> str:
+    """
+    Calcula la ruta del archivo de una clave (repartido en subdirectorios por prefijo).
+
+    Args:
+        directory: Directorio del almacén
+        clave: Hash en hexadecimal
+        suffix: Extensión de los archivos del almacén
+
+    Returns:
+        Ruta del archivo
+    """
+    return os.path.join(directory, clave[:2], clave + suffix)
+
+
+class BlobStore:
+    """
+    Archivos por hash con publicación atómica y tamaño máximo opcional
+    """
+    def __init__(self, directory: str, suffix: str = '', max_bytes: Optional[int] = None,
+                 descripcion: str = 'Caché'):
+        """
+        Abre (o crea) el almacén.
+
+        Args:
+            directory: Directorio de los archivos
+            suffix: Extensión de los archivos (distingue las entradas de otros archivos)
+            max_bytes: Tamaño máximo; None para no limitarlo
+            descripcion: Nombre del almacén en los mensajes de log
+        """
+        self.directory = directory
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.descripcion = descripcion
+        self.logger = configurar_logging("blobstore")
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.total = sum(size for _, size, _ in self._entradas())
+
+    def ruta(self, clave: str) -> str:
+        """Ruta del archivo de una clave."""
+        return ruta_blob(self.directory, clave, self.suffix)
+
+    def contiene(self, clave: str) -> bool:
+        """Indica si la clave está publicada."""
+        return os.path.exists(self.ruta(clave))
+
+    def abrir(self, clave: str) -> Optional[BinaryIO]:
+        """
+        Abre el archivo de una clave para leerlo y lo marca como usado.
+
+        Un descarte posterior puede borrarlo, pero el archivo abierto se
+        sigue leyendo completo.
+
+        Args:
+            clave: Hash de la entrada
+
+        Returns:
+            Archivo binario abierto, o None si la clave no está
+        """
+        ruta = self.ruta(clave)
+        try:
+            archivo = open(ruta, 'rb')
+        except FileNotFoundError:
+            return None
+        if self.max_bytes is not None:
+            # La fecha de modificación marca el último uso para el descarte por tamaño
+            with contextlib.suppress(OSError):
+                os.utime(ruta)
+        return archivo
+
+    @contextlib.contextmanager
+    def escribir(self, clave: str) -> Iterator[BinaryIO]:
+        """
+        Escribe una entrada y la publica al salir del bloque sin errores.
+
+        Si el bloque termina con una excepción (o el generador que lo usa se
+        abandona), el temporal se borra y la clave no cambia.
+
+        Args:
+            clave: Hash de la entrada
+
+        Yields:
+            Archivo temporal, abierto para escritura binaria
+        """
+        ruta = self.ruta(clave)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        tmp = tempfile.NamedTemporaryFile(dir=os.path.dirname(ruta), suffix=SUFIJO_TEMPORAL, delete=False)
+        publicada = False
+        try:
+            with tmp:
+                yield tmp
+            self._publicar(tmp.name, ruta)
+            publicada = True
+        finally:
+            if not publicada:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(tmp.name)
+
+    def guardar(self, clave: str, datos: bytes):
+        """
+        Publica una entrada completa.
+
+        Args:
+            clave: Hash de la entrada
+            datos: Contenido
+        """
+        with self.escribir(clave) as tmp:
+            tmp.write(datos)
+
+    def _publicar(self, temporal: str, ruta: str):
+        """Renombra el temporal sobre la entrada, actualiza el total y descarta si hace falta."""
+        with self._lock:
+            try:
+                anterior = os.path.getsize(ruta)
+            except FileNotFoundError:
+                anterior = 0
+            size = os.path.getsize(temporal)
+            os.replace(temporal, ruta)
+            self.total += size - anterior
+            self._evict()
+
+    def descartar(self, clave: str):
+        """
+        Borra una entrada.
+
+        Args:
+            clave: Hash de la entrada
+        """
+        ruta = self.ruta(clave)
+        with self._lock:
+            try:
+                size = os.path.getsize(ruta)
+                os.unlink(ruta)
+                self.total -= size
+            except FileNotFoundError:
+                pass
+
+    def _entradas(self) -> List[Tuple[float, int, str]]:
+        """Fecha de último uso, tamaño y ruta de cada entrada publicada."""
+        entradas = []
+        for carpeta, _, nombres in os.walk(self.directory):
+            for nombre in nombres:
+                if nombre.endswith(self.suffix) and not nombre.endswith(SUFIJO_TEMPORAL):
+                    ruta = os.path.join(carpeta, nombre)
+                    with contextlib.suppress(FileNotFoundError):
+                        estado = os.stat(ruta)
+                        entradas.append((estado.st_mtime, estado.st_size, ruta))
+        return entradas
+
+    def _evict(self):
+        """Descarta las entradas usadas hace más tiempo hasta respetar el máximo. Requiere ``_lock``."""
+        if self.max_bytes is None or self.total <= self.max_bytes:
+            return
+        # Descartar hasta el 90 % del máximo para no recorrer el directorio en cada escritura
+        objetivo = self.max_bytes * 0.9
+        for _, size, ruta in sorted(self._entradas()):
+            if self.total <= objetivo:
+                break
+            try:
+                os.unlink(ruta)
+                self.total -= size
+            except FileNotFoundError:
+                pass
+        self.logger.info(f"{self.descripcion} reducida a {self.total / 1024 / 1024:.1f} MB")
@@ -15,4 +15,20 @@ class ErrorVectorDB(ErrorRAG):
     """Error en la base de datos vectorial."""
 
 class ErrorChat(ErrorRAG):
-    """Error en el gestor de chat."""
\ No newline at end of file
+    """Error en el gestor de chat."""
+
+class ErrorSobrecarga(ErrorChat):
+    """El sistema está saturado y rechaza la petición para no superar el tiempo de espera."""
+
+    def __init__(self, mensaje: str, retry_after: float):
+        super().__init__(mensaje)
+        self.retry_after = retry_after
+
+class ErrorArchivoDemasiadoGrande(ErrorMoodle):
+    """El archivo supera el tamaño máximo permitido para la descarga."""
+
+class ErrorFormatoNoSoportado(ErrorMoodle):
+    """El formato del archivo, detectado por sus primeros bytes, no tiene extractor."""
+
+class ErrorFixture(ErrorRAG):
+    """No hay una respuesta grabada para la petición en modo replay."""
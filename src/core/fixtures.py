@@ -0,0 +1,376 @@
+"""
+Grabación y reproducción de las peticiones HTTP a Moodle y a los modelos.
+
+En modo ``record`` cada petición se envía normalmente y el par
+petición/respuesta se guarda en un archivo local; en modo ``replay`` las
+respuestas se sirven desde el disco, sin red, con una latencia sintética
+opcional. Así se pueden medir y comparar cambios de rendimiento del
+indexador y del chat sin Moodle ni Ollama, siempre con las mismas respuestas.
+
+El archivo es un directorio con un índice ``index.jsonl`` (una línea por
+petición grabada) y los cuerpos de las respuestas en ``bodies/`` por hash
+SHA-256. Las peticiones se identifican por método, ruta, parámetros (sin
+``token`` ni ``wstoken``) y cuerpo; si la misma petición se grabó varias
+veces, las respuestas se reproducen en el orden en que se grabaron.
+
+Se integra como adaptador de ``requests`` (Moodle y embeddings de Ollama) y
+como transporte de ``httpx`` (clientes de OpenAI usados para el LLM).
+"""
+import asyncio
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from core import metrics
+from core.blobstore import BlobStore
+from core.errors import ErrorFixture
+from core.utils import configurar_logging
+
+FIXTURE_REQUESTS = metrics.counter(
+    'rag_fixture_requests_total', 'Peticiones atendidas por el archivo de grabación', ['mode', 'outcome'])
+
+# Parámetros que no forman parte de la identidad de una petición ni se guardan
+PARAMETROS_SECRETOS = {'token', 'wstoken'}
+
+# Cabeceras de la respuesta que se conservan (el cuerpo se guarda ya descomprimido)
+CABECERAS_GUARDADAS = ('content-type', 'content-disposition', 'retry-after')
+
+_archivos: Dict[str, "FixtureArchive"] = {}
+_archivos_lock = threading.Lock()
+
+
+def _url_sin_secretos(url: str) -> str:
+    """Quita de la URL los parámetros con credenciales y ordena el resto."""
+    partes = urlsplit(url)
+    parametros = sorted((k, v) for k, v in parse_qsl(partes.query, keep_blank_values=True)
+                        if k not in PARAMETROS_SECRETOS)
+    return urlunsplit((partes.scheme, partes.netloc, partes.path, urlencode(parametros), ''))
+
+
+def _cuerpo_canonico(body: Any) -> bytes:
+    """Normaliza el cuerpo de la petición (JSON con claves ordenadas si lo es)."""
+    if body is None:
+        return b''
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    try:
+        return json.dumps(json.loads(body), sort_keys=True, separators=(',', ':')).encode('utf-8')
+    except ValueError:
+        return bytes(body)
+
+
+def _cabeceras(headers) -> Dict[str, str]:
+    """Cabeceras de una respuesta ya leída, sin las de compresión ni longitud."""
+    return {k: v for k, v in headers.items()
+            if k.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')}
+
+
+class FixtureArchive:
+    """
+    Archivo local de pares petición/respuesta para los modos record y replay
+    """
+    def __init__(self, directory: str, mode: str = 'replay', latency_scale: float = 0.0,
+                 latency_ms: float = 0.0):
+        """
+        Abre (o crea) el archivo de grabación.
+
+        Args:
+            directory: Directorio del índice y de los cuerpos
+            mode: 'record' para grabar o 'replay' para reproducir
+            latency_scale: En replay, fracción de la latencia grabada que se
+                reproduce (1.0 la reproduce completa; 0 responde sin espera)
+            latency_ms: En replay, latencia fija por petición; si es mayor que
+                cero reemplaza a ``latency_scale``
+
+        Raises:
+            ValueError: Si el modo no es 'record' ni 'replay'
+        """
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Modo de grabación no soportado: {mode}")
+        self.directory = directory
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.latency_ms = latency_ms
+        self.logger = configurar_logging("fixtures")
+        self._lock = threading.Lock()
+        self._indice = os.path.join(directory, 'index.jsonl')
+        self._grabadas: Dict[str, List[Dict[str, Any]]] = {}
+        self._siguiente: Dict[str, int] = {}
+        self._cuerpos = BlobStore(os.path.join(directory, 'bodies'), descripcion='Archivo de grabación')
+        if os.path.exists(self._indice):
+            with open(self._indice, encoding='utf-8') as f:
+                for linea in f:
+                    if linea.strip():
+                        entrada = json.loads(linea)
+                        self._grabadas.setdefault(entrada['key'], []).append(entrada)
+        self.logger.info(f"Archivo de grabación {directory} en modo {mode} "
+                         f"({sum(map(len, self._grabadas.values()))} respuestas grabadas)")
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["FixtureArchive"]:
+        """
+        Obtiene el archivo de grabación de la sección ``fixtures`` de la configuración.
+
+        Todos los clientes de un proceso comparten la misma instancia por
+        directorio, para que las respuestas repetidas se reproduzcan en orden.
+
+        Args:
+            config: Configuración del sistema
+
+        Returns:
+            Instancia de FixtureArchive, o None si ``fixtures.mode`` es 'off'
+        """
+        fixtures = config.get('fixtures') or {}
+        # YAML interpreta "off" sin comillas como False
+        mode = fixtures.get('mode') or 'off'
+        if mode == 'off':
+            return None
+        directorio = os.path.abspath(fixtures.get('path', './fixtures/default'))
+        with _archivos_lock:
+            archivo = _archivos.get(directorio)
+            if archivo is None or archivo.mode != mode:
+                archivo = cls(
+                    directorio, mode=mode,
+                    latency_scale=float(fixtures.get('latency_scale', 0)),
+                    latency_ms=float(fixtures.get('latency_ms', 0))
+                )
+                _archivos[directorio] = archivo
+            return archivo
+
+    @staticmethod
+    def key(method: str, url: str, body: Any = None) -> str:
+        """
+        Calcula la clave de una petición.
+
+        El host no forma parte de la clave: una grabación hecha contra un
+        Moodle u Ollama sirve para otra URL base con las mismas rutas.
+
+        Args:
+            method: Método HTTP
+            url: URL completa (con parámetros)
+            body: Cuerpo de la petición
+
+        Returns:
+            Hash SHA-256 en hexadecimal
+        """
+        partes = urlsplit(_url_sin_secretos(url))
+        digest = hashlib.sha256()
+        for parte in (method.upper().encode(), partes.path.encode(), partes.query.encode(),
+                      _cuerpo_canonico(body)):
+            digest.update(parte)
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def record(self, method: str, url: str, body: Any, status: int,
+               headers: Dict[str, str], content: bytes, elapsed: float):
+        """
+        Guarda la respuesta de una petición.
+
+        Args:
+            method: Método HTTP
+            url: URL de la petición
+            body: Cuerpo de la petición
+            status: Código de estado de la respuesta
+            headers: Cabeceras de la respuesta
+            content: Cuerpo de la respuesta, ya descomprimido
+            elapsed: Segundos que tardó la respuesta completa
+        """
+        clave = self.key(method, url, body)
+        sha256 = hashlib.sha256(content).hexdigest()
+        entrada = {
+            'key': clave,
+            'method': method.upper(),
+            'url': _url_sin_secretos(url),
+            'status': status,
+            'headers': {k.lower(): v for k, v in headers.items() if k.lower() in CABECERAS_GUARDADAS},
+            'body': sha256,
+            'size': len(content),
+            'elapsed': round(elapsed, 4),
+        }
+        with self._lock:
+            if not self._cuerpos.contiene(sha256):
+                self._cuerpos.guardar(sha256, content)
+            with open(self._indice, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entrada, ensure_ascii=False) + '\n')
+            self._grabadas.setdefault(clave, []).append(entrada)
+        FIXTURE_REQUESTS.labels(mode='record', outcome='recorded').inc()
+
+    def replay(self, method: str, url: str, body: Any = None) -> Tuple[Dict[str, Any], bytes, float]:
+        """
+        Busca la respuesta grabada de una petición.
+
+        Args:
+            method: Método HTTP
+            url: URL de la petición
+            body: Cuerpo de la petición
+
+        Returns:
+            Tupla (entrada del índice, cuerpo de la respuesta, segundos de latencia a simular)
+
+        Raises:
+            ErrorFixture: Si la petición no se grabó
+        """
+        clave = self.key(method, url, body)
+        with self._lock:
+            grabadas = self._grabadas.get(clave)
+            if not grabadas:
+                FIXTURE_REQUESTS.labels(mode='replay', outcome='miss').inc()
+                raise ErrorFixture(f"No hay una respuesta grabada para {method.upper()} {_url_sin_secretos(url)}")
+            # Las repeticiones se sirven en orden y vuelven a empezar al agotarse
+            indice = self._siguiente.get(clave, 0)
+            self._siguiente[clave] = indice + 1
+            entrada = grabadas[indice % len(grabadas)]
+        with open(self._cuerpos.ruta(entrada['body']), 'rb') as f:
+            content = f.read()
+        FIXTURE_REQUESTS.labels(mode='replay', outcome='hit').inc()
+        if self.latency_ms > 0:
+            espera = self.latency_ms / 1000
+        else:
+            espera = entrada.get('elapsed', 0.0) * self.latency_scale
+        return entrada, content, espera
+
+    def requests_adapter(self, **kwargs) -> "FixtureAdapter":
+        """
+        Crea un adaptador de ``requests`` que graba o reproduce las peticiones.
+
+        Args:
+            **kwargs: Argumentos de ``HTTPAdapter`` (pool_connections, pool_maxsize)
+
+        Returns:
+            Adaptador para montar en una ``requests.Session``
+        """
+        return FixtureAdapter(self, **kwargs)
+
+    def httpx_client(self, **kwargs) -> httpx.Client:
+        """
+        Crea un cliente de ``httpx`` (para ``http_client`` de OpenAI) que graba o reproduce.
+
+        Args:
+            **kwargs: Argumentos adicionales de ``httpx.Client``
+
+        Returns:
+            Cliente síncrono
+        """
+        return httpx.Client(transport=FixtureTransport(self), **kwargs)
+
+    def httpx_async_client(self, **kwargs) -> httpx.AsyncClient:
+        """
+        Crea un cliente asíncrono de ``httpx`` que graba o reproduce.
+
+        Args:
+            **kwargs: Argumentos adicionales de ``httpx.AsyncClient``
+
+        Returns:
+            Cliente asíncrono
+        """
+        return httpx.AsyncClient(transport=AsyncFixtureTransport(self), **kwargs)
+
+
+class FixtureAdapter(HTTPAdapter):
+    """
+    Adaptador de ``requests`` que graba las respuestas o las sirve desde el archivo
+    """
+    def __init__(self, archive: FixtureArchive, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if self.archive.mode == 'replay':
+            entrada, content, espera = self.archive.replay(request.method, request.url, request.body)
+            if espera:
+                time.sleep(espera)
+            response = requests.Response()
+            response.status_code = entrada['status']
+            response.headers = CaseInsensitiveDict(entrada['headers'])
+            response.headers['Content-Length'] = str(len(content))
+            response.encoding = get_encoding_from_headers(response.headers)
+            # Un BytesIO permite leer la respuesta en bloques como una descarga real
+            response.raw = io.BytesIO(content)
+            response.url = request.url
+            response.request = request
+            response.reason = ''
+            response.connection = self
+            return response
+
+        inicio = time.perf_counter()
+        # El cuerpo se lee completo para grabarlo; iter_content lo sirve desde memoria
+        response = super().send(request, stream=False, timeout=timeout, verify=verify,
+                                cert=cert, proxies=proxies)
+        self.archive.record(request.method, request.url, request.body, response.status_code,
+                            dict(response.headers), response.content, time.perf_counter() - inicio)
+        return response
+
+
+class FixtureTransport(httpx.BaseTransport):
+    """
+    Transporte de ``httpx`` que graba las respuestas o las sirve desde el archivo
+    """
+    def __init__(self, archive: FixtureArchive):
+        self.archive = archive
+        self._inner = httpx.HTTPTransport() if archive.mode == 'record' else None
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        if self._inner is None:
+            entrada, content, espera = self.archive.replay(request.method, str(request.url), body)
+            if espera:
+                time.sleep(espera)
+            return httpx.Response(entrada['status'], headers=entrada['headers'],
+                                  content=content, request=request)
+        inicio = time.perf_counter()
+        response = self._inner.handle_request(request)
+        try:
+            content = response.read()
+        finally:
+            response.close()
+        self.archive.record(request.method, str(request.url), body, response.status_code,
+                            dict(response.headers), content, time.perf_counter() - inicio)
+        return httpx.Response(response.status_code, headers=_cabeceras(response.headers),
+                              content=content, request=request)
+
+    def close(self):
+        if self._inner is not None:
+            self._inner.close()
+
+
+class AsyncFixtureTransport(httpx.AsyncBaseTransport):
+    """
+    Transporte asíncrono de ``httpx`` que graba las respuestas o las sirve desde el archivo
+    """
+    def __init__(self, archive: FixtureArchive):
+        self.archive = archive
+        self._inner = httpx.AsyncHTTPTransport() if archive.mode == 'record' else None
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        if self._inner is None:
+            entrada, content, espera = self.archive.replay(request.method, str(request.url), body)
+            if espera:
+                await asyncio.sleep(espera)
+            return httpx.Response(entrada['status'], headers=entrada['headers'],
+                                  content=content, request=request)
+        inicio = time.perf_counter()
+        response = await self._inner.handle_async_request(request)
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        self.archive.record(request.method, str(request.url), body, response.status_code,
+                            dict(response.headers), content, time.perf_counter() - inicio)
+        return httpx.Response(response.status_code, headers=_cabeceras(response.headers),
+                              content=content, request=request)
+
+    async def aclose(self):
+        if self._inner is not None:
+            await self._inner.aclose()
@@ -0,0 +1,296 @@
+"""
+Registro de métricas con exposición en el formato de texto de Prometheus.
+
+Los módulos definen sus métricas a nivel de módulo con ``counter``, ``gauge``
+e ``histogram`` sobre el registro global ``REGISTRY``; la aplicación web las
+publica en ``/metrics`` y la indexación puede volcarlas a un archivo al final
+de la ejecución (para el textfile collector de node_exporter).
+"""
+import math
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Límites por defecto de los histogramas de latencia, en segundos
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escapar(valor: str) -> str:
+    """Escapa un valor de etiqueta según el formato de texto de Prometheus."""
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_valor(valor: float) -> str:
+    """Formatea un número como lo espera Prometheus (incluye +Inf/-Inf/NaN)."""
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    if math.isnan(valor):
+        return 'NaN'
+    return repr(float(valor))
+
+
+def _etiquetas(nombres: Sequence[str], valores: Sequence[str], extra: str = '') -> str:
+    """Arma el bloque {a="b",...} de una muestra."""
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+class _Metrica:
+    """
+    Base de las métricas: nombre, ayuda, etiquetas e hijos por combinación de etiquetas
+    """
+    tipo = ''
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+        self._hijos: Dict[Tuple[str, ...], '_Metrica'] = {}
+
+    def labels(self, **valores) -> '_Metrica':
+        """
+        Devuelve la serie correspondiente a los valores de etiqueta dados.
+
+        Args:
+            **valores: Un valor por cada etiqueta declarada
+
+        Returns:
+            Serie hija sobre la que operar (inc, set, observe)
+        """
+        clave = tuple(str(valores[e]) for e in self.etiquetas)
+        with self._lock:
+            hijo = self._hijos.get(clave)
+            if hijo is None:
+                hijo = self._nuevo_hijo()
+                self._hijos[clave] = hijo
+            return hijo
+
+    def _nuevo_hijo(self) -> '_Metrica':
+        raise NotImplementedError
+
+    def _series(self) -> Iterable[Tuple[Tuple[str, ...], '_Metrica']]:
+        """Series a exponer: las hijas si hay etiquetas o la propia métrica si no."""
+        if self.etiquetas:
+            with self._lock:
+                return list(self._hijos.items())
+        return [((), self)]
+
+    def exponer(self) -> List[str]:
+        """
+        Genera las líneas de texto de la métrica.
+
+        Returns:
+            Líneas en formato de exposición de Prometheus
+        """
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        for valores, serie in self._series():
+            lineas.extend(serie._muestras(self.nombre, self.etiquetas, valores))
+        return lineas
+
+    def _muestras(self, nombre, etiquetas, valores) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metrica):
+    """
+    Contador monótono
+    """
+    tipo = 'counter'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valor = 0.0
+
+    def _nuevo_hijo(self):
+        return Counter(self.nombre, self.ayuda)
+
+    def inc(self, cantidad: float = 1.0):
+        """Incrementa el contador."""
+        with self._lock:
+            self._valor += cantidad
+
+    def value(self) -> float:
+        """Valor actual del contador."""
+        return self._valor
+
+    def _muestras(self, nombre, etiquetas, valores):
+        return [f"{nombre}{_etiquetas(etiquetas, valores)} {_formatear_valor(self._valor)}"]
+
+
+class Gauge(_Metrica):
+    """
+    Valor que sube y baja, opcionalmente calculado al momento de exponer
+    """
+    tipo = 'gauge'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valor = 0.0
+        self._funcion: Optional[Callable[[], float]] = None
+
+    def _nuevo_hijo(self):
+        return Gauge(self.nombre, self.ayuda)
+
+    def set(self, valor: float):
+        """Fija el valor."""
+        with self._lock:
+            self._valor = float(valor)
+
+    def inc(self, cantidad: float = 1.0):
+        """Incrementa el valor."""
+        with self._lock:
+            self._valor += cantidad
+
+    def dec(self, cantidad: float = 1.0):
+        """Decrementa el valor."""
+        self.inc(-cantidad)
+
+    def set_function(self, funcion: Callable[[], float]):
+        """
+        Calcula el valor con ``funcion`` cada vez que se exponen las métricas.
+
+        Args:
+            funcion: Función sin argumentos que devuelve el valor actual
+        """
+        self._funcion = funcion
+
+    def value(self) -> float:
+        """Valor actual."""
+        if self._funcion is not None:
+            try:
+                return float(self._funcion())
+            except Exception:
+                return float('nan')
+        return self._valor
+
+    def _muestras(self, nombre, etiquetas, valores):
+        return [f"{nombre}{_etiquetas(etiquetas, valores)} {_formatear_valor(self.value())}"]
+
+
+class Histogram(_Metrica):
+    """
+    Distribución de observaciones en buckets acumulativos
+    """
+    tipo = 'histogram'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                 buckets: Sequence[float] = BUCKETS_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        self._conteos = [0] * len(self.buckets)
+        self._suma = 0.0
+        self._total = 0
+
+    def _nuevo_hijo(self):
+        return Histogram(self.nombre, self.ayuda, buckets=self.buckets)
+
+    def observe(self, valor: float):
+        """Registra una observación."""
+        with self._lock:
+            self._suma += valor
+            self._total += 1
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    self._conteos[i] += 1
+                    break
+
+    def _muestras(self, nombre, etiquetas, valores):
+        with self._lock:
+            conteos, suma, total = list(self._conteos), self._suma, self._total
+        lineas = []
+        acumulado = 0
+        for limite, conteo in zip(self.buckets, conteos):
+            acumulado += conteo
+            le = f'le="{_formatear_valor(limite)}"'
+            lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, valores, le)} {acumulado}")
+        infinito = 'le="+Inf"'
+        lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, valores, infinito)} {total}")
+        lineas.append(f"{nombre}_sum{_etiquetas(etiquetas, valores)} {_formatear_valor(suma)}")
+        lineas.append(f"{nombre}_count{_etiquetas(etiquetas, valores)} {total}")
+        return lineas
+
+
+class MetricsRegistry:
+    """
+    Conjunto de métricas del proceso
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metricas: Dict[str, _Metrica] = {}
+
+    def _obtener(self, clase, nombre: str, ayuda: str, etiquetas: Sequence[str], **kwargs):
+        """Devuelve la métrica existente con ese nombre o la registra."""
+        with self._lock:
+            metrica = self._metricas.get(nombre)
+            if metrica is None:
+                metrica = clase(nombre, ayuda, etiquetas, **kwargs)
+                self._metricas[nombre] = metrica
+            elif not isinstance(metrica, clase):
+                raise ValueError(f"La métrica {nombre} ya existe con otro tipo")
+            return metrica
+
+    def counter(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> Counter:
+        """Obtiene o crea un contador."""
+        return self._obtener(Counter, nombre, ayuda, etiquetas)
+
+    def gauge(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> Gauge:
+        """Obtiene o crea un gauge."""
+        return self._obtener(Gauge, nombre, ayuda, etiquetas)
+
+    def histogram(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                  buckets: Sequence[float] = BUCKETS_LATENCIA) -> Histogram:
+        """Obtiene o crea un histograma."""
+        return self._obtener(Histogram, nombre, ayuda, etiquetas, buckets=buckets)
+
+    def exposition(self) -> str:
+        """
+        Genera el texto completo de todas las métricas.
+
+        Returns:
+            Texto en formato de exposición de Prometheus (versión 0.0.4)
+        """
+        with self._lock:
+            metricas = sorted(self._metricas.values(), key=lambda m: m.nombre)
+        lineas: List[str] = []
+        for metrica in metricas:
+            lineas.extend(metrica.exponer())
+        return '\n'.join(lineas) + '\n'
+
+    def write_file(self, ruta: str):
+        """
+        Escribe las métricas en un archivo de forma atómica.
+
+        Args:
+            ruta: Ruta del archivo de destino (por ejemplo, ``*.prom``)
+        """
+        directorio = os.path.dirname(os.path.abspath(ruta))
+        os.makedirs(directorio, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=directorio, delete=False, suffix='.tmp',
+                                         encoding='utf-8') as tmp:
+            tmp.write(self.exposition())
+        os.replace(tmp.name, ruta)
+
+
+REGISTRY = MetricsRegistry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def counter(nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> Counter:
+    """Obtiene o crea un contador en el registro global."""
+    return REGISTRY.counter(nombre, ayuda, etiquetas)
+
+
+def gauge(nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> Gauge:
+    """Obtiene o crea un gauge en el registro global."""
+    return REGISTRY.gauge(nombre, ayuda, etiquetas)
+
+
+def histogram(nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+              buckets: Sequence[float] = BUCKETS_LATENCIA) -> Histogram:
+    """Obtiene o crea un histograma en el registro global."""
+    return REGISTRY.histogram(nombre, ayuda, etiquetas, buckets)
@@ -0,0 +1,327 @@
+"""
+Detección del formato real de un archivo a partir de sus primeros bytes.
+
+Moodle suele servir los archivos como ``application/octet-stream`` o con
+un tipo equivocado. Las firmas ("magic bytes") del comienzo del archivo
+permiten saber qué es antes de descargarlo entero: la descarga se corta
+apenas se reconoce un formato que no se puede indexar o que supera el
+tamaño máximo de su tipo, y el documento se procesa con el extractor que
+corresponde a su contenido y no al tipo declarado.
+"""
+import codecs
+import mimetypes
+import re
+from typing import Any, Dict, Optional
+
+from core.errors import ErrorArchivoDemasiadoGrande, ErrorFormatoNoSoportado
+
+# Bytes del comienzo del archivo que se examinan
+SNIFF_BYTES = 8192
+
+PDF = 'application/pdf'
+DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+PPTX = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+OLE2 = 'application/x-ole-storage'
+ZIP = 'application/zip'
+OCTET_STREAM = 'application/octet-stream'
+
+# Firmas al comienzo del archivo, de la más específica a la más general
+FIRMAS = [
+    (b'%PDF-', PDF),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', OLE2),
+    (b'{\\rtf', 'application/rtf'),
+    (b'\x1f\x8b', 'application/gzip'),
+    (b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (b'7z\xbc\xaf\x27\x1c', 'application/x-7z-compressed'),
+    (b'ID3', 'audio/mpeg'),
+    (b'OggS', 'audio/ogg'),
+    (b'fLaC', 'audio/flac'),
+    (b'\x1aE\xdf\xa3', 'video/webm'),
+    (b'FWS', 'application/x-shockwave-flash'),
+    (b'CWS', 'application/x-shockwave-flash'),
+]
+
+# Formatos RIFF: el tipo está en los bytes 8 a 12
+RIFF = {b'WEBP': 'image/webp', b'WAVE': 'audio/wav', b'AVI ': 'video/x-msvideo'}
+
+# Documentos de Office binarios (OLE2): el tipo concreto sale del nombre o del tipo declarado
+TIPOS_OLE2 = {'application/msword', 'application/vnd.ms-powerpoint', 'application/vnd.ms-excel'}
+
+# Formatos que DocumentProcessor sabe extraer (las imágenes, con OCR)
+SOPORTADOS = {PDF, DOCX, PPTX}
+PREFIJOS_SOPORTADOS = ('text/', 'image/')
+
+# Marcas de orden de bytes (BOM) y la codificación que indican
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# Codificación declarada en el propio archivo (HTML o XML)
+CHARSET_HTML = re.compile(rb'<meta[^>]*?charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+ENCODING_XML = re.compile(rb'^<\?xml[^>]*?encoding\s*=\s*["\']([\w.:-]+)')
+
+
+def _tipo_zip(cabecera: bytes, filename: str) -> str:
+    """
+    Distingue un documento OOXML u ODF de un zip cualquiera.
+
+    Los nombres de las entradas aparecen sin comprimir en las cabeceras
+    locales del zip, así que las primeras (``word/``, ``ppt/``, ``xl/``)
+    suelen estar dentro de los primeros bytes. Los documentos ODF guardan
+    su tipo sin comprimir en la entrada ``mimetype``.
+    """
+    if cabecera[30:38] == b'mimetype':
+        return cabecera[38:100].split(b'PK', 1)[0].decode('ascii', errors='ignore') or ZIP
+    if b'word/' in cabecera:
+        return DOCX
+    if b'ppt/' in cabecera:
+        return PPTX
+    if b'xl/' in cabecera:
+        return XLSX
+    # Entradas más allá de lo examinado: se confía en la extensión si es OOXML
+    por_nombre, _ = mimetypes.guess_type(filename)
+    return por_nombre if por_nombre in (DOCX, PPTX, XLSX) else ZIP
+
+
+def _es_texto(cabecera: bytes) -> bool:
+    """Indica si los bytes parecen texto UTF-8 (sin NUL y decodificable)."""
+    if not cabecera or b'\x00' in cabecera:
+        return False
+    try:
+        cabecera.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # Un carácter multibyte cortado al final del bloque no descarta el texto
+        return e.start >= len(cabecera) - 3 and e.reason == 'unexpected end of data'
+    return True
+
+
+def detectar_tipo(cabecera: bytes) -> Optional[str]:
+    """
+    Detecta el formato por las firmas del comienzo del archivo.
+
+    Args:
+        cabecera: Primeros bytes del archivo (al menos ``SNIFF_BYTES`` si los hay)
+
+    Returns:
+        Tipo MIME detectado, o None si ninguna firma coincide
+    """
+    for firma, tipo in FIRMAS:
+        if cabecera.startswith(firma):
+            return tipo
+    if cabecera.startswith(b'RIFF') and cabecera[8:12] in RIFF:
+        return RIFF[cabecera[8:12]]
+    if cabecera[4:8] == b'ftyp':
+        return 'video/mp4'
+    return None
+
+
+def tipo_contenido(cabecera: bytes, filename: str = '', declarado: str = '') -> str:
+    """
+    Decide el tipo de un archivo combinando sus primeros bytes, el tipo declarado y el nombre.
+
+    La firma manda sobre lo declarado. Sin firma reconocible se respeta el
+    tipo declarado, salvo que sea un formato que debería tener firma (PDF,
+    OOXML, imagen). Unos bytes de texto solo se tratan como texto si el
+    tipo declarado o, sin él, la extensión ya son ``text/*``: un "PDF" o un
+    ``apunte.pdf`` que resulta ser texto es casi siempre una página de
+    inicio de sesión o un error de Moodle (HTML o JSON), no un documento.
+    Sin tipo declarado se usa la extensión.
+
+    Args:
+        cabecera: Primeros bytes del archivo
+        filename: Nombre del archivo
+        declarado: Tipo informado por el servidor (``Content-Type``)
+
+    Returns:
+        Tipo MIME sin parámetros
+
+    Raises:
+        ErrorFormatoNoSoportado: Si el tipo declarado o la extensión son un
+            formato binario y los bytes son texto
+    """
+    declarado = (declarado or '').split(';')[0].strip().lower()
+    if declarado == OCTET_STREAM:
+        declarado = ''
+    por_nombre, _ = mimetypes.guess_type(filename or '')
+
+    detectado = detectar_tipo(cabecera)
+    if detectado == OLE2:
+        for candidato in (declarado, por_nombre):
+            if candidato in TIPOS_OLE2:
+                return candidato
+        return OLE2
+    if detectado is not None:
+        return detectado
+    if cabecera.startswith(b'PK\x03\x04'):
+        return _tipo_zip(cabecera, filename or '')
+    if declarado and declarado not in SOPORTADOS and not declarado.startswith('image/'):
+        return declarado
+    if _es_texto(cabecera):
+        esperado = declarado or por_nombre or ''
+        if esperado.startswith('text/'):
+            return esperado
+        if esperado:
+            # Texto con un tipo binario (un .pdf que es HTML o un error JSON de Moodle)
+            raise ErrorFormatoNoSoportado(
+                f"{filename or 'El archivo'} debería ser {esperado} pero es texto "
+                f"(probablemente una página de error o de inicio de sesión)"
+            )
+    return declarado or por_nombre or OCTET_STREAM
+
+
+def _codificacion(nombre: str) -> Optional[str]:
+    """Nombre normalizado de una codificación, o None si Python no la conoce."""
+    try:
+        return codecs.lookup(nombre.strip().strip('"\'')).name
+    except LookupError:
+        return None
+
+
+def charset(declarado: str = '', cabecera: bytes = b'') -> Optional[str]:
+    """
+    Decide la codificación de un archivo de texto.
+
+    Manda el parámetro ``charset`` del tipo declarado (``Content-Type``);
+    sin él, la marca de orden de bytes y, en HTML o XML, la codificación
+    que el archivo declara en sus primeros bytes.
+
+    Args:
+        declarado: Tipo con parámetros (por ejemplo ``text/plain; charset=iso-8859-1``)
+        cabecera: Primeros bytes del archivo
+
+    Returns:
+        Nombre de la codificación, o None si no se conoce (se usa UTF-8)
+    """
+    for parametro in (declarado or '').split(';')[1:]:
+        clave, _, valor = parametro.partition('=')
+        if clave.strip().lower() == 'charset':
+            codificacion = _codificacion(valor)
+            if codificacion:
+                return codificacion
+    for bom, codificacion in BOMS:
+        if cabecera.startswith(bom):
+            return codificacion
+    encontrado = ENCODING_XML.search(cabecera) or CHARSET_HTML.search(cabecera)
+    if encontrado:
+        return _codificacion(encontrado.group(1).decode('ascii'))
+    return None
+
+
+def con_charset(content_type: str, codificacion: Optional[str]) -> str:
+    """
+    Agrega el parámetro ``charset`` a un tipo MIME.
+
+    Args:
+        content_type: Tipo MIME sin parámetros
+        codificacion: Codificación; None para dejar el tipo sin parámetros
+
+    Returns:
+        Tipo con ``charset``, o el mismo tipo
+    """
+    return f"{content_type}; charset={codificacion}" if codificacion else content_type
+
+
+def es_soportado(content_type: str) -> bool:
+    """
+    Indica si DocumentProcessor puede extraer texto de un tipo.
+
+    Los documentos de Office binarios (.doc, .ppt) no están soportados:
+    python-docx y python-pptx solo leen los formatos OOXML.
+
+    Args:
+        content_type: Tipo MIME
+
+    Returns:
+        True si el tipo tiene un extractor
+    """
+    return content_type in SOPORTADOS or content_type.startswith(PREFIJOS_SOPORTADOS)
+
+
+class FormatPolicy:
+    """
+    Qué formatos se descargan y con qué tamaño máximo, decidido con los primeros bytes
+    """
+    def __init__(self, skip_unsupported: bool = True, max_bytes_by_type: Optional[Dict[str, int]] = None):
+        """
+        Inicializa la política.
+
+        Args:
+            skip_unsupported: Cortar la descarga de los formatos sin extractor
+            max_bytes_by_type: Tamaño máximo por tipo MIME o prefijo terminado
+                en '/' (por ejemplo ``{'image/': 20 MB}``); el más específico gana
+        """
+        self.skip_unsupported = skip_unsupported
+        self.max_bytes_by_type = max_bytes_by_type or {}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "FormatPolicy":
+        """
+        Crea la política a partir de la sección ``downloads`` de la configuración.
+
+        Args:
+            config: Configuración del sistema
+
+        Returns:
+            Instancia de FormatPolicy
+        """
+        downloads = config.get('downloads') or {}
+        return cls(
+            skip_unsupported=downloads.get('skip_unsupported', True),
+            max_bytes_by_type={tipo: int(float(mb) * 1024 * 1024)
+                               for tipo, mb in (downloads.get('max_mb_by_type') or {}).items()}
+        )
+
+    def limite(self, content_type: str, max_bytes: Optional[int] = None) -> Optional[int]:
+        """
+        Calcula el tamaño máximo de un archivo según su tipo.
+
+        Args:
+            content_type: Tipo MIME detectado
+            max_bytes: Máximo general; None si no hay
+
+        Returns:
+            El menor entre el máximo general y el de su tipo; None si no hay ninguno
+        """
+        propio = self.max_bytes_by_type.get(content_type)
+        if propio is None:
+            propio = self.max_bytes_by_type.get(content_type.split('/')[0] + '/')
+        limites = [m for m in (max_bytes, propio) if m is not None]
+        return min(limites) if limites else None
+
+    def verificar(self, filename: str, content_type: str, size: Optional[int],
+                  max_bytes: Optional[int] = None) -> Optional[int]:
+        """
+        Decide si un archivo se sigue descargando una vez conocido su formato.
+
+        Args:
+            filename: Nombre del archivo
+            content_type: Tipo MIME detectado
+            size: Tamaño anunciado por el servidor; None si no se conoce
+            max_bytes: Máximo general
+
+        Returns:
+            Tamaño máximo a aplicar durante el resto de la descarga
+
+        Raises:
+            ErrorFormatoNoSoportado: Si el formato no tiene extractor
+            ErrorArchivoDemasiadoGrande: Si el tamaño anunciado supera el máximo de su tipo
+        """
+        if self.skip_unsupported and not es_soportado(content_type):
+            raise ErrorFormatoNoSoportado(f"{filename} es {content_type}, formato sin extractor")
+        limite = self.limite(content_type, max_bytes)
+        if limite is not None and size is not None and size > limite:
+            raise ErrorArchivoDemasiadoGrande(
+                f"{filename} ({content_type}) ocupa {size} bytes (máximo {limite})"
+            )
+        return limite
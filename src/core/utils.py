@@ -2,6 +2,9 @@
 Utilidades generales y configuración de logging para el sistema RAG.
 """
 import logging
+import time
+from contextlib import contextmanager
+from typing import Dict
 
 def configurar_logging(nombre="sistema-rag", nivel=logging.INFO, archivo="moodle_rag.log"):
     """
@@ -15,12 +18,33 @@ def configurar_logging(nombre="sistema-rag", nivel=logging.INFO, archivo="moodle
     Returns:
         Un objeto logger configurado
     """
-    logging.basicConfig(
-        level=nivel,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler(archivo)
-        ]
-    )
-    return logging.getLogger(nombre)
\ No newline at end of file
+    # Solo la primera llamada configura los handlers; el archivo de log se
+    # abre al escribir el primer mensaje, no al importar los módulos
+    if not logging.getLogger().handlers:
+        logging.basicConfig(
+            level=nivel,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            handlers=[
+                logging.StreamHandler(),
+                logging.FileHandler(archivo, delay=True)
+            ]
+        )
+    return logging.getLogger(nombre)
+
+@contextmanager
+def medir_tiempo(tiempos: Dict[str, float], etapa: str):
+    """
+    Mide la duración de un bloque y la acumula en milisegundos.
+    
+    Args:
+        tiempos: Diccionario donde acumular la duración
+        etapa: Clave bajo la que se guarda la duración
+        
+    Yields:
+        None
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tiempos[etapa] = tiempos.get(etapa, 0.0) + (time.perf_counter() - inicio) * 1000
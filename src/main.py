@@ -4,145 +4,230 @@ Punto de entrada principal para el sistema RAG de Moodle.
 
 Este script proporciona una interfaz unificada para todas las funcionalidades
 del sistema: indexación de documentos, chat interactivo, interfaz web y fine-tuning.
+
+Cada modo importa solo los subsistemas que usa (Flask, Qdrant, Postgres,
+OpenAI, extractores de documentos), para que las ejecuciones cortas como
+--index desde cron o --chat no paguen el costo de importar todo.
 """
 import argparse
+import time
 from pathlib import Path
 
-from chat.manager import ChatManager
+from core import metrics
 from core.config import load_config
 from core.utils import configurar_logging
-from fine_tuning.manager import run_fine_tuning
-from moodle.client import MoodleClient
-from rag.document_processor import DocumentProcessor
-from rag.vector_store import VectorStore
-from web.app import run_app
 import os
 
 # Configurar logging
 logger = configurar_logging("main")
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+INDEX_DURATION = metrics.gauge(
+    'rag_index_duration_seconds', 'Duración de la última ejecución de indexación')
+INDEX_LAST_RUN = metrics.gauge(
+    'rag_index_last_run_timestamp_seconds', 'Momento en que terminó la última indexación')
+
 
-def indexar_documentos(config):
+def cursos_configurados(config, shortnames=None, category=None, all_visible=False):
   """
-  Descarga e indexa documentos de Moodle.
+  Completa la selección de cursos con la configuración si no se indicó ninguna.
 
   Args:
       config: Configuración del sistema
+      shortnames: Nombres cortos indicados en la línea de comandos
+      category: Categoría indicada en la línea de comandos
+      all_visible: Si se pidieron todos los cursos visibles
+
+  Returns:
+      Tupla (shortnames, category, all_visible); si no hay nada configurado,
+      el curso de ``moodle.target_course``
   """
+  if shortnames or category is not None or all_visible:
+    return shortnames, category, all_visible
+  moodle = config['moodle']
+  shortnames = moodle.get('courses') or []
+  category = moodle.get('category')
+  all_visible = bool(moodle.get('all_courses'))
+  if not (shortnames or category is not None or all_visible):
+    shortnames = [moodle['target_course']]
+  return shortnames, category, all_visible
+
+
+def indexar_documentos(config, shortnames=None, category=None, all_visible=False):
+  """
+  Descarga e indexa documentos de uno o varios cursos de Moodle.
+
+  Sin argumentos se usan los cursos de la configuración (``moodle.courses``,
+  ``moodle.category``, ``moodle.all_courses`` o, si no hay ninguno,
+  ``moodle.target_course``).
+
+  Args:
+      config: Configuración del sistema
+      shortnames: Nombres cortos de los cursos a indexar
+      category: ID de una categoría cuyos cursos visibles se indexan
+      all_visible: Indexar todos los cursos visibles
+  """
+  from moodle.client import MoodleClient
+  from rag.indexer import CourseIndexer, seleccionar_cursos
+  from rag.vector_store import VectorStore
+
   logger.info("Iniciando indexación de documentos de Moodle")
 
-  # Inicializar cliente de Moodle
-  moodle_client = MoodleClient(
-      url=config['moodle']['url'],
-      token=config['moodle']['token']
-  )
+  shortnames, category, all_visible = cursos_configurados(config, shortnames, category, all_visible)
 
-  # Inicializar procesador de documentos
-  doc_processor = DocumentProcessor()
+  # Inicializar cliente de Moodle (sesión con keep-alive y reintentos)
+  moodle_client = MoodleClient.from_config(config)
 
   # Inicializar VectorStore
-  embedding_provider = config['embeddings']['provider']
-  if embedding_provider == 'ollama':
-    vector_store = VectorStore(
-        host=config['qdrant']['host'],
-        port=config['qdrant']['port'],
-        collection_name=config['qdrant']['collection_name'],
-        embedding_provider='ollama',
-        ollama_url=config['ollama']['url']
-    )
-  elif embedding_provider == 'openai':
-    vector_store = VectorStore(
-        host=config['qdrant']['host'],
-        port=config['qdrant']['port'],
-        collection_name=config['qdrant']['collection_name'],
-        embedding_provider='openai',
-        openai_api_key=config['embeddings']['openai_api_key'],
-        openai_model=config['embeddings']['openai_model']
-    )
-  else:
-    logger.error(f"Proveedor de embeddings no soportado: {embedding_provider}")
+  try:
+    vector_store = VectorStore.from_config(config)
+  except ValueError as e:
+    logger.error(str(e))
     return
 
-  # Obtener cursos
+  indexer = CourseIndexer.from_config(config, moodle_client, vector_store)
+
   try:
-    cursos = moodle_client.get_courses()
+    cursos = seleccionar_cursos(moodle_client, shortnames, category, all_visible)
     if not cursos:
-      logger.error("No se encontraron cursos en Moodle")
-      return
-
-    # Buscar el curso objetivo
-    curso_objetivo = None
-    for curso in cursos:
-      if curso.get('shortname') == config['moodle']['target_course']:
-        curso_objetivo = curso
-        break
-
-    if not curso_objetivo:
-      logger.error(
-        f"No se encontró el curso '{config['moodle']['target_course']}'")
-      logger.info("Cursos disponibles:")
-      for curso in cursos:
-        logger.info(f"  - {curso.get('shortname')}: {curso.get('fullname')}")
+      logger.error("No se encontraron cursos para indexar en Moodle")
       return
 
-    logger.info(f"Procesando curso: {curso_objetivo.get('fullname')}")
-
-    # Obtener contenido del curso
-    contenido = moodle_client.get_course_contents(curso_objetivo.get('id'))
-
-    # Procesar cada sección y módulo
-    for seccion in contenido:
-      logger.info(f"Procesando sección: {seccion.get('name')}")
-
-      for modulo in seccion.get('modules', []):
-        nombre_modulo = modulo.get('name')
-        tipo_modulo = modulo.get('modname')
-
-        # Procesar archivos
-        if 'contents' in modulo:
-          for contenido in modulo.get('contents', []):
-            if 'fileurl' in contenido:
-              nombre_archivo = contenido.get('filename')
-              url_archivo = contenido.get('fileurl')
-
-              logger.info(f"Descargando archivo: {nombre_archivo}")
-              try:
-                # Descargar archivo
-                contenido_archivo, tipo_contenido = moodle_client.download_file(
-                    url_archivo, nombre_archivo
-                )
-
-                # Procesar documento
-                texto, metadata = doc_processor.process_document(
-                    contenido_archivo, tipo_contenido, nombre_archivo
-                )
-
-                if texto:
-                  # Añadir metadatos adicionales
-                  metadata.update({
-                    'course': curso_objetivo.get('fullname'),
-                    'section': seccion.get('name'),
-                    'module': nombre_modulo,
-                    'module_type': tipo_modulo
-                  })
-
-                  # Indexar documento
-                  logger.info(f"Indexando documento: {nombre_archivo}")
-                  vector_store.index_document(texto, metadata)
-                else:
-                  logger.warning(
-                    f"No se pudo extraer texto de {nombre_archivo}")
-
-              except Exception as e:
-                logger.error(f"Error al procesar {nombre_archivo}: {e}")
+    resumenes = indexer.index_courses(cursos)
 
     logger.info("Indexación de documentos completada")
+    for resumen in sorted(resumenes, key=lambda r: r['course']):
+      logger.info(f"  {resumen['course']}: {resumen['indexed']}/{resumen['files']} indexados, "
+                  f"{resumen['failed']} fallidos")
+    logger.info(f"Moodle: {moodle_client.reintentos} reintentos, "
+                f"{moodle_client.fallos} peticiones fallidas")
 
   except Exception as e:
     logger.error(f"Error durante la indexación: {e}")
 
 
+def indexar_desde_cache(config):
+  """
+  Reconstruye el índice solo con los archivos de la caché de descargas.
+
+  No contacta a Moodle: sirve para probar cambios de fragmentación o de
+  embeddings sin volver a descargar los cursos.
+
+  Args:
+      config: Configuración del sistema
+  """
+  from moodle.cache import DownloadCache
+  from rag.document_processor import DocumentProcessor
+  from rag.indexer import CourseIndexer
+  from rag.vector_store import VectorStore
+
+  cache = DownloadCache.from_config(config)
+  if cache is None:
+    logger.error("La caché de descargas está deshabilitada (moodle.cache_dir)")
+    return
+
+  logger.info(f"Reconstruyendo el índice desde la caché en {cache.directory}")
+  try:
+    vector_store = VectorStore.from_config(config)
+  except ValueError as e:
+    logger.error(str(e))
+    return
+  indexer = CourseIndexer(None, None, DocumentProcessor.from_config(config), vector_store)
+
+  total = 0
+  for entrada in cache.entries():
+    archivo = {**entrada['metadata'], 'filename': entrada['filename']}
+    with open(entrada['path'], 'rb') as contenido:
+      indexer.index_file(contenido, entrada['content_type'], archivo)
+    total += 1
+  cache.close()
+  logger.info(f"Indexación desde la caché completada: {total} archivos")
+
+
+def sincronizar(config, shortnames=None, category=None, all_visible=False):
+  """
+  Mantiene el índice al día consultando los cambios de Moodle periódicamente.
+
+  Se detiene con SIGTERM o Ctrl+C al terminar la consulta en curso.
+
+  Args:
+      config: Configuración del sistema
+      shortnames: Nombres cortos de los cursos a sincronizar
+      category: ID de una categoría cuyos cursos visibles se sincronizan
+      all_visible: Sincronizar todos los cursos visibles
+  """
+  import signal
+  import threading
+  from moodle.client import MoodleClient
+  from rag.indexer import CourseIndexer
+  from rag.sync import SyncDaemon
+  from rag.vector_store import VectorStore
+
+  shortnames, category, all_visible = cursos_configurados(config, shortnames, category, all_visible)
+  moodle_client = MoodleClient.from_config(config)
+  try:
+    vector_store = VectorStore.from_config(config)
+  except ValueError as e:
+    logger.error(str(e))
+    return
+  indexer = CourseIndexer.from_config(config, moodle_client, vector_store)
+  daemon = SyncDaemon.from_config(config, indexer, shortnames, category, all_visible)
+
+  stop = threading.Event()
+  for senal in (signal.SIGTERM, signal.SIGINT):
+    signal.signal(senal, lambda *_: stop.set())
+  daemon.run(stop)
+
+
+def recolectar_huerfanos(config, shortnames=None, category=None, all_visible=False, dry_run=False):
+  """
+  Borra de Qdrant los puntos de archivos que ya no existen en Moodle e informa el espacio liberado.
+
+  Args:
+      config: Configuración del sistema
+      shortnames: Nombres cortos de los cursos a reconciliar
+      category: ID de una categoría cuyos cursos visibles se reconcilian
+      all_visible: Reconciliar todos los cursos visibles
+      dry_run: Solo informar, sin borrar
+  """
+  from moodle.client import MoodleClient
+  from rag.indexer import seleccionar_cursos
+  from rag.reconcile import formatear_informe, reconciliar
+  from rag.vector_store import VectorStore
+
+  shortnames, category, all_visible = cursos_configurados(config, shortnames, category, all_visible)
+  moodle_client = MoodleClient.from_config(config)
+  try:
+    vector_store = VectorStore.from_config(config)
+  except ValueError as e:
+    logger.error(str(e))
+    return
+  cursos = seleccionar_cursos(moodle_client, shortnames, category, all_visible)
+  informe = reconciliar(vector_store, moodle_client, cursos, dry_run=dry_run)
+  for linea in formatear_informe(informe, dry_run):
+    print(linea)
+
+
+def escribir_metricas(ruta, inicio):
+  """
+  Escribe las métricas de una ejecución de indexación en un archivo de texto.
+
+  El formato es el de Prometheus, apto para el textfile collector de node_exporter.
+
+  Args:
+      ruta: Ruta del archivo de métricas
+      inicio: Momento de inicio de la ejecución (time.time())
+  """
+  fin = time.time()
+  INDEX_DURATION.set(fin - inicio)
+  INDEX_LAST_RUN.set(fin)
+  try:
+    metrics.REGISTRY.write_file(ruta)
+    logger.info(f"Métricas de indexación escritas en {ruta}")
+  except OSError as e:
+    logger.error(f"No se pudieron escribir las métricas en {ruta}: {e}")
+
+
 def iniciar_chat(config):
   """
   Inicia el chat interactivo en la consola.
@@ -150,62 +235,102 @@ def iniciar_chat(config):
   Args:
       config: Configuración del sistema
   """
+  from chat.manager import ChatManager
+  from chat.warmup import precalentar
+  from rag.vector_store import VectorStore
+
   logger.info("Iniciando chat interactivo")
 
   # Inicializar VectorStore (embeddings: ollama/openai only)
-  embedding_provider = config['embeddings']['provider']
-  if embedding_provider == 'ollama':
-    vector_store = VectorStore(
-        host=config['qdrant']['host'],
-        port=config['qdrant']['port'],
-        collection_name=config['qdrant']['collection_name'],
-        embedding_provider='ollama',
-        ollama_url=config['ollama']['url']
-    )
-  elif embedding_provider == 'openai':
-    vector_store = VectorStore(
-        host=config['qdrant']['host'],
-        port=config['qdrant']['port'],
-        collection_name=config['qdrant']['collection_name'],
-        embedding_provider='openai',
-        openai_api_key=config['embeddings']['openai_api_key'],
-        openai_model=config['embeddings']['openai_model']
-    )
-  else:
-    logger.error(f"Proveedor de embeddings no soportado: {embedding_provider}")
+  try:
+    vector_store = VectorStore.from_config(config)
+  except ValueError as e:
+    logger.error(str(e))
     return
 
-  # Selección de modelo de chat
-  chat_model = config['ollama']['model_name']
-  chat_url = config['ollama']['url']
-  if 'bitnet' in config and config['bitnet'].get('model_name'):
-    # Permitir override por env/config: si BITNET_MODEL está seteado, usarlo
-    chat_model = config['bitnet']['model_name']
-    chat_url = ""  # BitNet no requiere URL
-
-  # Inicializar ChatManager
-  chat_manager = ChatManager(
-      qdrant_client=vector_store,
-      db_connection=config['postgres']['connection_string'],
-      ollama_url=chat_url,
-      model_name=chat_model
-  )
+  # Inicializar ChatManager (el modelo de chat puede ser Ollama o BitNet)
+  chat_manager = ChatManager.from_config(config, vector_store)
+
+  # Cargar modelos y abrir conexiones antes de la primera pregunta
+  precalentar(chat_manager, config, logger)
 
   # Iniciar chat interactivo
   chat_manager.start_interactive_chat()
 
 
-def iniciar_web(host='0.0.0.0', port=5000, debug=True):
+def verificar_base_datos(config):
+  """
+  Informa el estado del esquema de chat sin modificarlo.
+
+  Muestra las migraciones aplicadas y pendientes y los índices que faltan.
+
+  Args:
+      config: Configuración del sistema
+
+  Returns:
+      True si no faltan índices ni hay migraciones pendientes; False también
+      si no se pudo consultar la base de datos
+  """
+  import psycopg2
+  from chat.migrations import informe_esquema
+
+  opciones = {k: v for k, v in config['postgres'].items()
+              if k != 'connection_string'}
+  try:
+    with psycopg2.connect(config['postgres']['connection_string']) as conn:
+      informe = informe_esquema(conn, opciones)
+  except psycopg2.Error as e:
+    logger.error(f"No se pudo consultar la base de datos: {e}")
+    print("No se pudo verificar el esquema: la base de datos no responde")
+    return False
+
+  print(f"Migraciones aplicadas: {informe['aplicadas'] or 'ninguna'}")
+  for pendiente in informe['pendientes']:
+    print(f"  Pendiente: {pendiente}")
+  for indice in informe['indices_faltantes']:
+    print(f"  Falta índice {indice['indice']} en {indice['tabla']} {indice['columnas']}")
+  correcto = not informe['pendientes'] and not informe['indices_faltantes']
+  print("Esquema correcto" if correcto else
+        "Esquema incompleto: ejecute --chat o --web para aplicar las migraciones")
+  return correcto
+
+
+def informe_latencia(config, horas=24):
+  """
+  Imprime percentiles de latencia por etapa de los turnos de chat recientes.
+
+  Args:
+      config: Configuración del sistema
+      horas: Ventana de tiempo a considerar, en horas
+  """
+  import psycopg2
+  from chat.turn_metrics import informe_latencias, formatear_informe
+
+  with psycopg2.connect(config['postgres']['connection_string']) as conn:
+    informe = informe_latencias(conn, horas)
+  for linea in formatear_informe(informe):
+    print(linea)
+
+
+def iniciar_web(host='0.0.0.0', port=5000, debug=True, server='flask', workers=1,
+                config_path=None, fixtures=None):
   """
   Inicia la aplicación web.
 
   Args:
       host: Host donde escuchar
       port: Puerto donde escuchar
-      debug: Modo debug
+      debug: Modo debug (solo servidor de desarrollo)
+      server: 'flask' (desarrollo) o 'async' (producción, ASGI con uvicorn)
+      workers: Cantidad de procesos worker en modo 'async'
+      config_path: Ruta al archivo de configuración (``--config``)
+      fixtures: Modo de grabación o reproducción (``--fixtures``)
   """
-  logger.info(f"Iniciando aplicación web en {host}:{port}")
-  run_app(host=host, port=port, debug=debug)
+  from web.app import run_app
+
+  logger.info(f"Iniciando aplicación web ({server}) en {host}:{port}")
+  run_app(host=host, port=port, debug=debug, server=server, workers=workers,
+          config_path=config_path, fixtures=fixtures)
 
 
 def main():
@@ -218,32 +343,92 @@ def main():
                      help='Indexar documentos de Moodle')
   group.add_argument('--chat', action='store_true',
                      help='Iniciar chat interactivo')
+  group.add_argument('--sync', action='store_true',
+                     help='Sincronizar continuamente los cambios de Moodle con el índice')
+  group.add_argument('--gc', action='store_true',
+                     help='Borrar de Qdrant los puntos de archivos eliminados en Moodle')
   group.add_argument('--web', action='store_true',
                      help='Iniciar aplicación web')
   group.add_argument('--fine-tune', action='store_true',
                      help='Realizar fine-tuning del modelo')
+  group.add_argument('--check-db', action='store_true',
+                     help='Verificar migraciones e índices del esquema de chat')
+  group.add_argument('--latency-report', action='store_true',
+                     help='Mostrar percentiles de latencia por etapa del chat')
 
   # Argumentos opcionales
   parser.add_argument('--config', type=str,
                       help='Ruta al archivo de configuración')
   parser.add_argument('--provider', type=str, choices=['local', 'openai'],
                       default='local', help='Proveedor para fine-tuning')
+  parser.add_argument('--window-hours', type=float, default=24,
+                      help='Ventana en horas para --latency-report')
+  parser.add_argument('--server', type=str, choices=['flask', 'async'],
+                      help='Servidor web: flask (desarrollo) o async (producción)')
+  parser.add_argument('--workers', type=int,
+                      help='Procesos worker del servidor async')
+  parser.add_argument('--metrics-file', type=str,
+                      help='Archivo donde escribir las métricas al terminar --index')
+  parser.add_argument('--courses', type=str,
+                      help='Con --index, --sync o --gc, nombres cortos de los cursos separados por comas')
+  parser.add_argument('--category', type=int,
+                      help='Con --index, --sync o --gc, ID de la categoría cuyos cursos visibles se usan')
+  parser.add_argument('--all-courses', action='store_true',
+                      help='Con --index, --sync o --gc, usar todos los cursos visibles')
+  parser.add_argument('--dry-run', action='store_true',
+                      help='Con --gc, informar los puntos huérfanos sin borrarlos')
+  parser.add_argument('--from-cache', action='store_true',
+                      help='Con --index, reconstruir el índice desde la caché de descargas sin contactar a Moodle')
+  parser.add_argument('--fixtures', type=str, choices=['off', 'record', 'replay'],
+                      help='Grabar o reproducir las peticiones a Moodle, embeddings y LLM (reemplaza fixtures.mode)')
 
   args = parser.parse_args()
 
   # Cargar configuración
   config_path = Path(args.config) if args.config else Path('./config.yaml')
   config = load_config(config_path)
+  if args.fixtures:
+    config.setdefault('fixtures', {})['mode'] = args.fixtures
+
+  shortnames = [c.strip() for c in args.courses.split(',') if c.strip()] if args.courses else None
 
   # Ejecutar la acción correspondiente
   if args.index:
-    indexar_documentos(config)
+    inicio = time.time()
+    try:
+      if args.from_cache:
+        indexar_desde_cache(config)
+      else:
+        indexar_documentos(config, shortnames, args.category, args.all_courses)
+    finally:
+      if args.metrics_file:
+        escribir_metricas(args.metrics_file, inicio)
+  elif args.sync:
+    sincronizar(config, shortnames, args.category, args.all_courses)
+  elif args.gc:
+    recolectar_huerfanos(config, shortnames, args.category, args.all_courses, args.dry_run)
   elif args.chat:
     iniciar_chat(config)
   elif args.web:
-    iniciar_web()
+    web = config.get('web') or {}
+    server = args.server or web.get('server', 'flask')
+    iniciar_web(
+        host=web.get('host', '0.0.0.0'),
+        port=int(web.get('port', 5000)),
+        debug=server == 'flask',
+        server=server,
+        workers=args.workers or int(web.get('workers', 1)),
+        config_path=config_path,
+        fixtures=args.fixtures
+    )
   elif args.fine_tune:
+    from fine_tuning.manager import run_fine_tuning
     run_fine_tuning(config_path, args.provider)
+  elif args.check_db:
+    if not verificar_base_datos(config):
+      raise SystemExit(1)
+  elif args.latency_report:
+    informe_latencia(config, args.window_hours)
 
 
 if __name__ == "__main__":
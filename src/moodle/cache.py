@@ -0,0 +1,273 @@
+"""
+Caché local de archivos descargados de Moodle, direccionada por contenido.
+
+Cada archivo se identifica por su URL junto con el ``timemodified`` y el
+``filesize`` que informa ``core_course_get_contents``: si Moodle no cambió el
+archivo, la reindexación lo lee del disco en lugar de descargarlo. El
+contenido se guarda una sola vez por hash SHA-256 (dos URLs con el mismo
+archivo comparten el blob) y la caché se mantiene por debajo de un tamaño
+máximo descartando primero los blobs usados hace más tiempo.
+
+El índice es una base SQLite junto a los blobs; guarda también los
+metadatos de cada archivo (curso, sección, módulo) para poder reconstruir
+el índice vectorial solo desde la caché.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, BinaryIO, Dict, Iterator, Optional
+
+from core import metrics
+from core.blobstore import ruta_blob
+from core.utils import configurar_logging
+
+CACHE_LOOKUPS = metrics.counter(
+    'rag_moodle_cache_lookups_total', 'Búsquedas en la caché de descargas de Moodle', ['result'])
+CACHE_BYTES = metrics.gauge(
+    'rag_moodle_cache_bytes', 'Bytes ocupados por los blobs de la caché de descargas')
+CACHE_EVICTIONS = metrics.counter(
+    'rag_moodle_cache_evictions_total', 'Blobs descartados de la caché de descargas por tamaño')
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT NOT NULL,
+    timemodified INTEGER NOT NULL,
+    filesize INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    sha256 TEXT NOT NULL REFERENCES blobs(sha256),
+    metadata TEXT NOT NULL DEFAULT '{}',
+    PRIMARY KEY (url, timemodified, filesize)
+);
+CREATE INDEX IF NOT EXISTS entries_sha256 ON entries(sha256);
+CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs(last_used);
+"""
+
+
+class DownloadCache:
+    """
+    Caché en disco de archivos de Moodle con deduplicación por hash y límite de tamaño
+    """
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        """
+        Abre (o crea) la caché.
+
+        Args:
+            directory: Directorio donde guardar el índice y los blobs
+            max_bytes: Tamaño máximo de los blobs; None para no limitarlo
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.logger = configurar_logging("moodle_cache")
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self._db.executescript(ESQUEMA)
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        CACHE_BYTES.set_function(lambda: self._total)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["DownloadCache"]:
+        """
+        Crea la caché a partir de la sección ``moodle`` de la configuración.
+
+        Args:
+            config: Configuración del sistema
+
+        Returns:
+            Instancia de DownloadCache, o None si ``moodle.cache_dir`` está vacío
+        """
+        moodle = config.get('moodle') or {}
+        directorio = moodle.get('cache_dir')
+        if not directorio:
+            return None
+        max_mb = moodle.get('cache_max_mb', 2048)
+        return cls(directorio, max_bytes=int(float(max_mb) * 1024 * 1024) if max_mb else None)
+
+    def _ruta_blob(self, sha256: str) -> str:
+        """Ruta del blob de un hash."""
+        return ruta_blob(os.path.join(self.directory, 'blobs'), sha256)
+
+    def lookup(self, url: str, timemodified: int, filesize: int) -> Optional[Dict[str, Any]]:
+        """
+        Busca un archivo en la caché.
+
+        Args:
+            url: URL del archivo (sin token)
+            timemodified: Fecha de modificación informada por Moodle
+            filesize: Tamaño informado por Moodle
+
+        Returns:
+            Diccionario con 'path', 'content_type', 'size' y 'sha256', o None si no está
+        """
+        with self._lock:
+            fila = self._db.execute(
+                "SELECT e.sha256, e.content_type, b.size FROM entries e "
+                "JOIN blobs b ON b.sha256 = e.sha256 "
+                "WHERE e.url = ? AND e.timemodified = ? AND e.filesize = ?",
+                (url, timemodified, filesize)
+            ).fetchone()
+            if fila is None or not os.path.exists(self._ruta_blob(fila[0])):
+                CACHE_LOOKUPS.labels(result='miss').inc()
+                return None
+            with self._db:
+                self._db.execute("UPDATE blobs SET last_used = ? WHERE sha256 = ?", (time.time(), fila[0]))
+        CACHE_LOOKUPS.labels(result='hit').inc()
+        return {'path': self._ruta_blob(fila[0]), 'content_type': fila[1], 'size': fila[2], 'sha256': fila[0]}
+
+    def store(self, url: str, timemodified: int, filesize: int, filename: str,
+              content_type: str, content: BinaryIO, metadata: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Guarda un archivo descargado.
+
+        Las versiones anteriores de la misma URL se olvidan y sus blobs se
+        borran si ninguna otra entrada los usa.
+
+        Args:
+            url: URL del archivo (sin token)
+            timemodified: Fecha de modificación informada por Moodle
+            filesize: Tamaño informado por Moodle
+            filename: Nombre del archivo
+            content_type: Tipo MIME detectado en la descarga
+            content: Archivo binario con el contenido (se lee desde el principio)
+            metadata: Datos para reconstruir el índice sin Moodle (curso, sección, módulo)
+
+        Returns:
+            Hash SHA-256 del contenido
+        """
+        # Copiar a un temporal en el mismo sistema de archivos calculando el hash
+        content.seek(0)
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False, suffix='.tmp') as tmp:
+            for bloque in iter(lambda: content.read(1024 * 1024), b''):
+                digest.update(bloque)
+                tmp.write(bloque)
+                size += len(bloque)
+        content.seek(0)
+        sha256 = digest.hexdigest()
+        ruta = self._ruta_blob(sha256)
+        with self._lock:
+            if os.path.exists(ruta):
+                os.unlink(tmp.name)
+            else:
+                os.makedirs(os.path.dirname(ruta), exist_ok=True)
+                os.replace(tmp.name, ruta)
+            with self._db:
+                nuevo = self._db.execute(
+                    "INSERT OR IGNORE INTO blobs (sha256, size, last_used) VALUES (?, ?, ?)",
+                    (sha256, size, time.time())
+                ).rowcount
+                if not nuevo:
+                    self._db.execute("UPDATE blobs SET last_used = ? WHERE sha256 = ?", (time.time(), sha256))
+                anteriores = [f[0] for f in self._db.execute(
+                    "SELECT sha256 FROM entries WHERE url = ? AND NOT (timemodified = ? AND filesize = ?)",
+                    (url, timemodified, filesize)
+                )]
+                self._db.execute(
+                    "DELETE FROM entries WHERE url = ? AND NOT (timemodified = ? AND filesize = ?)",
+                    (url, timemodified, filesize)
+                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries "
+                    "(url, timemodified, filesize, filename, content_type, sha256, metadata) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, timemodified, filesize, filename, content_type, sha256,
+                     json.dumps(metadata or {}, ensure_ascii=False, default=str))
+                )
+            if nuevo:
+                self._total += size
+            for anterior in set(anteriores) - {sha256}:
+                self._borrar_si_huerfano(anterior)
+            self._evict()
+        return sha256
+
+    def _borrar_si_huerfano(self, sha256: str) -> bool:
+        """Borra un blob que ya no usa ninguna entrada. Requiere ``_lock``."""
+        if self._db.execute("SELECT 1 FROM entries WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone():
+            return False
+        self._borrar_blob(sha256)
+        return True
+
+    def _borrar_blob(self, sha256: str):
+        """Borra un blob y sus entradas. Requiere ``_lock``."""
+        with self._db:
+            fila = self._db.execute("SELECT size FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+            self._db.execute("DELETE FROM entries WHERE sha256 = ?", (sha256,))
+            self._db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+        if fila:
+            self._total -= fila[0]
+        try:
+            os.unlink(self._ruta_blob(sha256))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """Descarta los blobs usados hace más tiempo hasta respetar el máximo. Requiere ``_lock``."""
+        if self.max_bytes is None or self._total <= self.max_bytes:
+            return
+        for (sha256,) in self._db.execute("SELECT sha256 FROM blobs ORDER BY last_used").fetchall():
+            if self._total <= self.max_bytes:
+                break
+            self._borrar_blob(sha256)
+            CACHE_EVICTIONS.inc()
+        self.logger.info(f"Caché de descargas reducida a {self._total / 1024 / 1024:.1f} MB")
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre los archivos guardados (la versión más reciente de cada URL).
+
+        Returns:
+            Iterador de diccionarios con 'url', 'filename', 'content_type',
+            'timemodified', 'filesize', 'path' y 'metadata'
+        """
+        with self._lock:
+            filas = self._db.execute(
+                "SELECT url, filename, content_type, timemodified, filesize, sha256, metadata "
+                "FROM entries ORDER BY url"
+            ).fetchall()
+        for url, filename, content_type, timemodified, filesize, sha256, metadata in filas:
+            ruta = self._ruta_blob(sha256)
+            if os.path.exists(ruta):
+                yield {
+                    'url': url, 'filename': filename, 'content_type': content_type,
+                    'timemodified': timemodified, 'filesize': filesize,
+                    'path': ruta, 'metadata': json.loads(metadata),
+                }
+
+    def copy_to(self, path: str, destino: BinaryIO):
+        """
+        Copia un blob de la caché a un archivo abierto.
+
+        El blob se abre con el lock tomado: un descarte concurrente puede
+        borrarlo después, pero el archivo abierto se sigue leyendo completo.
+
+        Args:
+            path: Ruta del blob (de ``lookup``)
+            destino: Archivo binario de destino (se sobrescribe)
+
+        Raises:
+            FileNotFoundError: Si el blob se descartó después de ``lookup``
+        """
+        with self._lock:
+            origen = open(path, 'rb')
+        with origen:
+            destino.seek(0)
+            destino.truncate()
+            shutil.copyfileobj(origen, destino, 1024 * 1024)
+        destino.seek(0)
+
+    def close(self):
+        """Cierra el índice de la caché."""
+        with self._lock:
+            self._db.close()
@@ -1,26 +1,199 @@
 """
 Cliente para conectar con la API de Moodle.
 """
+import io
+import itertools
 import requests
-import mimetypes
+import random
+import sqlite3
+import time
+from typing import Any, BinaryIO, Dict, Optional
 from core.utils import configurar_logging
-from core.errors import ErrorMoodle
+from core.errors import ErrorArchivoDemasiadoGrande, ErrorFormatoNoSoportado, ErrorMoodle
+from core import metrics
+from core.fixtures import FixtureArchive
+from core.sniffing import SNIFF_BYTES, FormatPolicy, charset, con_charset, tipo_contenido
+from moodle.cache import DownloadCache
+
+MOODLE_REQUESTS = metrics.counter(
+    'rag_moodle_requests_total', 'Peticiones a la API de Moodle', ['function', 'outcome'])
+MOODLE_SECONDS = metrics.histogram(
+    'rag_moodle_request_seconds', 'Duración de las peticiones a Moodle', ['function'])
+MOODLE_DOWNLOAD_BYTES = metrics.counter(
+    'rag_moodle_download_bytes_total', 'Bytes descargados de Moodle')
+MOODLE_RETRIES = metrics.counter(
+    'rag_moodle_retries_total', 'Reintentos de peticiones a Moodle', ['function'])
+
+# Respuestas transitorias que vale la pena reintentar
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Errores de red transitorios (incluye cortes a mitad de la descarga del cuerpo)
+RETRY_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+# Tipos que, además de text/*, son texto: download_file los decodifica y
+# stream_file informa su charset
+TIPOS_TEXTO = {
+    'application/json', 'application/xml',
+    'application/javascript', 'application/xhtml+xml',
+}
+
+# Tamaño de los bloques leídos al descargar un archivo
+CHUNK_BYTES = 64 * 1024
 
 class MoodleClient:
     """
     Cliente para conectar con la API de Moodle
     """
-    def __init__(self, url: str, token: str):
+    def __init__(
+        self,
+        url: str,
+        token: str,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5,
+        max_backoff_seconds: float = 30.0,
+        pool_size: int = 8,
+        cache: Optional[DownloadCache] = None,
+        fixtures: Optional[FixtureArchive] = None
+    ):
         """
         Inicializa el cliente de Moodle.
         
         Args:
             url: URL base de la instancia de Moodle
             token: Token de autenticación para la API de Moodle
+            connect_timeout: Segundos máximos para establecer la conexión
+            read_timeout: Segundos máximos sin recibir datos (no es el total de la descarga)
+            max_retries: Reintentos de una petición ante errores transitorios
+            backoff_seconds: Espera base del backoff exponencial
+            max_backoff_seconds: Espera máxima entre reintentos
+            pool_size: Conexiones keep-alive reutilizables hacia Moodle
+            cache: Caché local de archivos descargados; None para descargar siempre
+            fixtures: Archivo para grabar o reproducir las peticiones; None para usar la red
         """
         self.url = url
         self.token = token
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.cache = cache
+        self.reintentos = 0
+        self.fallos = 0
         self.logger = configurar_logging("moodle_client")
+        # Sesión con keep-alive: evita un handshake TCP+TLS por petición
+        self._session = requests.Session()
+        if fixtures is not None:
+            adapter = fixtures.requests_adapter(pool_connections=1, pool_maxsize=pool_size)
+        else:
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "MoodleClient":
+        """
+        Crea un cliente a partir de la sección ``moodle`` de la configuración.
+        
+        Args:
+            config: Configuración del sistema
+            
+        Returns:
+            Instancia de MoodleClient
+        """
+        moodle = config['moodle']
+        return cls(
+            url=moodle['url'],
+            token=moodle['token'],
+            connect_timeout=float(moodle.get('connect_timeout', 5)),
+            read_timeout=float(moodle.get('read_timeout', 60)),
+            max_retries=int(moodle.get('max_retries', 3)),
+            backoff_seconds=float(moodle.get('backoff_seconds', 0.5)),
+            max_backoff_seconds=float(moodle.get('max_backoff_seconds', 30)),
+            pool_size=int(moodle.get('pool_size', 8)),
+            cache=DownloadCache.from_config(config),
+            fixtures=FixtureArchive.from_config(config)
+        )
+
+    def _espera(self, intento: int, retry_after: Optional[str] = None) -> float:
+        """
+        Calcula la espera antes del siguiente reintento.
+        
+        Usa backoff exponencial con jitter completo, o el ``Retry-After``
+        indicado por el servidor si lo hay.
+        
+        Args:
+            intento: Número de reintento (desde 0)
+            retry_after: Valor del encabezado Retry-After
+            
+        Returns:
+            Segundos de espera
+        """
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff_seconds)
+        return random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** intento))
+
+    def _reintentar(self, function: str, intento: int, espera: float, motivo: str):
+        """
+        Registra un reintento y espera antes de realizarlo.
+        
+        Args:
+            function: Nombre de la operación (para logs y métricas)
+            intento: Número del reintento (desde 1)
+            espera: Segundos de espera
+            motivo: Causa del reintento
+        """
+        self.reintentos += 1
+        MOODLE_RETRIES.labels(function=function).inc()
+        self.logger.warning(
+            "Reintentando %s (%d/%d) en %.1fs: %s",
+            function, intento, self.max_retries, espera, motivo
+        )
+        time.sleep(espera)
+
+    def _get(self, url: str, params: Optional[Dict[str, Any]] = None, function: str = '',
+             stream: bool = False) -> requests.Response:
+        """
+        Realiza un GET idempotente reintentando los errores transitorios.
+        
+        Args:
+            url: URL a solicitar
+            params: Parámetros de la consulta
+            function: Nombre de la operación (para logs y métricas)
+            stream: Si es True, el cuerpo no se lee hasta iterar la respuesta
+            
+        Returns:
+            Respuesta exitosa
+            
+        Raises:
+            requests.RequestException: Si la petición falla tras agotar los reintentos
+        """
+        intento = 0
+        while True:
+            try:
+                response = self._session.get(
+                    url, params=params, timeout=(self.connect_timeout, self.read_timeout),
+                    stream=stream
+                )
+                if response.status_code not in RETRY_STATUS or intento >= self.max_retries:
+                    response.raise_for_status()
+                    return response
+                espera = self._espera(intento, response.headers.get('Retry-After'))
+                motivo = f"HTTP {response.status_code}"
+                response.close()
+            except RETRY_ERRORS as e:
+                if intento >= self.max_retries:
+                    raise
+                espera = self._espera(intento)
+                motivo = str(e)
+            intento += 1
+            self._reintentar(function, intento, espera, motivo)
 
     def _make_request(self, function: str, params=None):
         """
@@ -45,16 +218,21 @@ class MoodleClient:
             'moodlewsrestformat': 'json',
             **params
         }
+        inicio = time.perf_counter()
         try:
             self.logger.debug("Solicitando %s a Moodle", function)
-            response = requests.get(request_url, params=request_params, timeout=10)
-            response.raise_for_status()
+            response = self._get(request_url, params=request_params, function=function)
             data = response.json()
+            MOODLE_SECONDS.labels(function=function).observe(time.perf_counter() - inicio)
             if isinstance(data, dict) and 'exception' in data:
+                MOODLE_REQUESTS.labels(function=function, outcome='moodle_error').inc()
                 self.logger.error("Error de Moodle: %s", data.get('message', 'Error desconocido'))
                 raise ErrorMoodle(data.get('message', 'Error desconocido'))
+            MOODLE_REQUESTS.labels(function=function, outcome='ok').inc()
             return data
         except requests.RequestException as e:
+            self.fallos += 1
+            MOODLE_REQUESTS.labels(function=function, outcome='http_error').inc()
             self.logger.error("Error al comunicarse con Moodle: %s", e)
             raise ErrorMoodle(str(e))
 
@@ -70,6 +248,23 @@ class MoodleClient:
             return []
         return result
 
+    def get_courses_by_field(self, field: str = '', value: Any = ''):
+        """
+        Obtiene cursos filtrados por un campo, sin recorrer la lista completa.
+        
+        Args:
+            field: Campo de búsqueda ('id', 'shortname', 'category', ...); vacío para todos
+            value: Valor buscado
+            
+        Returns:
+            Lista de cursos
+        """
+        params = {'field': field, 'value': value} if field else {}
+        result = self._make_request('core_course_get_courses_by_field', params)
+        if not result:
+            return []
+        return result.get('courses', [])
+
     def get_course_contents(self, course_id: int):
         """
         Obtiene el contenido de un curso.
@@ -85,37 +280,215 @@ class MoodleClient:
             return []
         return result
 
-    def download_file(self, file_url: str, filename: str):
+    def get_updates_since(self, course_id: int, since: int):
         """
-        Descarga un archivo de Moodle.
+        Obtiene los módulos de un curso modificados desde un momento dado.
+        
+        Moodle no informa los módulos eliminados; para detectarlos hay que
+        comparar el contenido completo del curso.
+        
+        Args:
+            course_id: ID del curso
+            since: Marca de tiempo Unix
+            
+        Returns:
+            Lista de instancias modificadas ({'contextlevel', 'id', 'updates'})
+        """
+        result = self._make_request(
+            'core_course_get_updates_since', {'courseid': course_id, 'since': int(since)}
+        )
+        if not result:
+            return []
+        return result.get('instances', [])
+
+    def stream_file(self, file_url: str, filename: str, destino: BinaryIO,
+                    max_bytes: Optional[int] = None, timemodified: Optional[int] = None,
+                    filesize: Optional[int] = None, metadata: Optional[Dict[str, Any]] = None,
+                    policy: Optional[FormatPolicy] = None) -> str:
+        """
+        Descarga un archivo de Moodle en bloques hacia ``destino``.
+        
+        El archivo nunca se carga entero en memoria. Si la conexión se corta a
+        mitad del cuerpo, la descarga se reinicia desde el principio (con el
+        mismo backoff que el resto de las peticiones).
+        
+        El tipo se detecta con los primeros bytes (``core.sniffing``), no con
+        el ``Content-Type`` que informa Moodle. Con ``policy``, la descarga se
+        corta en ese momento si el formato no tiene extractor o supera el
+        tamaño máximo de su tipo.
+        
+        Si el cliente tiene caché y se indican ``timemodified`` y ``filesize``
+        (de ``core_course_get_contents``), la descarga se guarda en ella; para
+        leerla sin contactar a Moodle se usa ``copy_from_cache``.
         
         Args:
             file_url: URL del archivo
             filename: Nombre del archivo
+            destino: Archivo binario abierto para escritura (se sobrescribe)
+            max_bytes: Tamaño máximo aceptado; None para no limitarlo
+            timemodified: Fecha de modificación informada por Moodle
+            filesize: Tamaño informado por Moodle
+            metadata: Datos guardados junto al archivo en la caché (curso, sección, módulo)
+            policy: Formatos admitidos y tamaño máximo por tipo; None para admitir todos
             
         Returns:
-            Tupla con (contenido del archivo, tipo de contenido)
+            Tipo de contenido del archivo; si es texto, con el parámetro
+            ``charset`` del ``Content-Type`` (o el que declara el propio
+            archivo), cuando se conoce
             
         Raises:
+            ErrorArchivoDemasiadoGrande: Si el archivo supera ``max_bytes`` o el máximo de su tipo
+            ErrorFormatoNoSoportado: Si ``policy`` no admite el formato detectado
             ErrorMoodle: Si ocurre un error al descargar el archivo
         """
+        usar_cache = self.cache is not None and timemodified is not None and filesize is not None
+        inicio = time.perf_counter()
+        url_with_token = f"{file_url}&token={self.token}"
+        self.logger.debug("Descargando archivo: %s", filename)
+        intento = 0
         try:
-            url_with_token = f"{file_url}&token={self.token}"
-            self.logger.debug("Descargando archivo: %s", filename)
-            response = requests.get(url_with_token, timeout=30)
-            response.raise_for_status()
-            content_type = response.headers.get('Content-Type', '')
-            if not content_type or content_type == 'application/octet-stream':
-                content_type, _ = mimetypes.guess_type(filename)
-                if not content_type:
-                    content_type = 'application/octet-stream'
-            self.logger.debug("Tipo de contenido detectado: %s", content_type)
-            if content_type.startswith('text/') or content_type in [
-                'application/json', 'application/xml',
-                'application/javascript', 'application/xhtml+xml']:
-                return response.text, content_type
-            else:
-                return response.content, content_type
+            while True:
+                with self._get(url_with_token, function='download_file', stream=True) as response:
+                    longitud = response.headers.get('Content-Length', '')
+                    if max_bytes is not None and longitud.isdigit() and int(longitud) > max_bytes:
+                        raise ErrorArchivoDemasiadoGrande(
+                            f"{filename} ocupa {int(longitud)} bytes (máximo {max_bytes})"
+                        )
+                    destino.seek(0)
+                    destino.truncate()
+                    total = 0
+                    try:
+                        bloques = response.iter_content(CHUNK_BYTES)
+                        cabecera = b''
+                        for bloque in bloques:
+                            cabecera += bloque
+                            if len(cabecera) >= SNIFF_BYTES:
+                                break
+                        # El formato se decide con los primeros bytes, antes de bajar el resto
+                        content_type, limite = self._formato(cabecera, filename, response.headers,
+                                                             max_bytes, policy)
+                        for bloque in itertools.chain([cabecera], bloques):
+                            total += len(bloque)
+                            if limite is not None and total > limite:
+                                raise ErrorArchivoDemasiadoGrande(
+                                    f"{filename} supera el máximo de {limite} bytes"
+                                )
+                            destino.write(bloque)
+                    except RETRY_ERRORS as e:
+                        # Corte a mitad del cuerpo: se reinicia la descarga completa
+                        if intento >= self.max_retries:
+                            raise
+                        motivo = str(e)
+                    else:
+                        break
+                intento += 1
+                self._reintentar('download_file', intento, self._espera(intento - 1), motivo)
+        except ErrorArchivoDemasiadoGrande:
+            MOODLE_REQUESTS.labels(function='download_file', outcome='too_large').inc()
+            raise
+        except ErrorFormatoNoSoportado:
+            MOODLE_REQUESTS.labels(function='download_file', outcome='unsupported').inc()
+            raise
         except requests.RequestException as e:
+            self.fallos += 1
+            MOODLE_REQUESTS.labels(function='download_file', outcome='http_error').inc()
             self.logger.error("Error al descargar archivo: %s", e)
-            raise ErrorMoodle(str(e))
\ No newline at end of file
+            raise ErrorMoodle(str(e))
+        MOODLE_SECONDS.labels(function='download_file').observe(time.perf_counter() - inicio)
+        MOODLE_REQUESTS.labels(function='download_file', outcome='ok').inc()
+        MOODLE_DOWNLOAD_BYTES.inc(total)
+        destino.seek(0)
+        self.logger.debug("Tipo de contenido detectado: %s", content_type)
+        if usar_cache:
+            try:
+                self.cache.store(file_url, timemodified, filesize, filename,
+                                 content_type, destino, metadata)
+            except (OSError, sqlite3.Error) as e:
+                self.logger.warning("No se pudo guardar %s en la caché: %s", filename, e)
+        return content_type
+
+    @staticmethod
+    def _formato(cabecera: bytes, filename: str, headers, max_bytes: Optional[int],
+                 policy: Optional[FormatPolicy]):
+        """
+        Detecta el tipo de un archivo con sus primeros bytes y aplica la política de formatos.
+        
+        Args:
+            cabecera: Primeros bytes del cuerpo
+            filename: Nombre del archivo
+            headers: Cabeceras de la respuesta
+            max_bytes: Tamaño máximo general
+            policy: Política de formatos; None para admitir todos
+            
+        Returns:
+            Tupla con (tipo de contenido, con su ``charset`` si es texto, y
+            tamaño máximo a aplicar)
+            
+        Raises:
+            ErrorArchivoDemasiadoGrande: Si el tamaño anunciado supera el máximo de su tipo
+            ErrorFormatoNoSoportado: Si la política no admite el formato
+        """
+        declarado = headers.get('Content-Type', '')
+        content_type = tipo_contenido(cabecera, filename, declarado)
+        limite = max_bytes
+        if policy is not None:
+            longitud = headers.get('Content-Length', '')
+            limite = policy.verificar(
+                filename, content_type, int(longitud) if longitud.isdigit() else None, max_bytes
+            )
+        if content_type.startswith('text/') or content_type in TIPOS_TEXTO:
+            # Sin el charset, el texto se decodificaría siempre como UTF-8
+            content_type = con_charset(content_type, charset(declarado, cabecera))
+        return content_type, limite
+
+    def copy_from_cache(self, file_url: str, destino: BinaryIO, timemodified: Optional[int],
+                        filesize: Optional[int], max_bytes: Optional[int] = None) -> Optional[str]:
+        """
+        Copia un archivo desde la caché local si está sin cambios.
+        
+        Args:
+            file_url: URL del archivo
+            destino: Archivo binario abierto para escritura (se sobrescribe)
+            timemodified: Fecha de modificación informada por Moodle
+            filesize: Tamaño informado por Moodle
+            max_bytes: Tamaño máximo aceptado; None para no limitarlo
+            
+        Returns:
+            Tipo de contenido del archivo, o None si no está en la caché
+        """
+        if self.cache is None or timemodified is None or filesize is None:
+            return None
+        guardado = self.cache.lookup(file_url, timemodified, filesize)
+        if guardado is None or (max_bytes is not None and guardado['size'] > max_bytes):
+            return None
+        try:
+            self.cache.copy_to(guardado['path'], destino)
+        except FileNotFoundError:
+            # Otra descarga lo descartó de la caché entre la búsqueda y la copia
+            return None
+        return guardado['content_type']
+
+    def download_file(self, file_url: str, filename: str):
+        """
+        Descarga un archivo de Moodle en memoria.
+        
+        Para archivos grandes o descargas en lote, usar ``stream_file`` o
+        ``moodle.downloader.FileDownloader``.
+        
+        Args:
+            file_url: URL del archivo
+            filename: Nombre del archivo
+            
+        Returns:
+            Tupla con (contenido del archivo, tipo de contenido); el texto se
+            decodifica con su ``charset`` o, si no se conoce, como UTF-8
+            
+        Raises:
+            ErrorMoodle: Si ocurre un error al descargar el archivo
+        """
+        buffer = io.BytesIO()
+        content_type = self.stream_file(file_url, filename, buffer)
+        tipo = content_type.split(';')[0]
+        if tipo.startswith('text/') or tipo in TIPOS_TEXTO:
+            return buffer.getvalue().decode(charset(content_type) or 'utf-8', errors='replace'), content_type
+        return buffer.getvalue(), content_type
@@ -0,0 +1,282 @@
+"""
+Descarga concurrente de archivos de Moodle.
+
+Los archivos se descargan en bloques hacia un ``SpooledTemporaryFile``: los
+pequeños quedan en memoria y los grandes pasan a disco, de modo que la
+memoria no crece con el tamaño del archivo. El límite de tamaño se aplica
+antes de descargar, con el ``filesize`` que informa ``core_course_get_contents``,
+y de nuevo durante la descarga por si ese dato no es fiable.
+
+Varias descargas corren a la vez con un límite global y otro por host, con
+un intervalo mínimo entre peticiones al mismo host para no saturar el LMS.
+"""
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+from core import metrics
+from core.errors import ErrorArchivoDemasiadoGrande, ErrorFormatoNoSoportado
+from core.sniffing import FormatPolicy
+from core.utils import configurar_logging
+
+DOWNLOADS = metrics.counter(
+    'rag_moodle_downloads_total', 'Archivos procesados por el descargador', ['outcome'])
+DOWNLOADS_IN_FLIGHT = metrics.gauge(
+    'rag_moodle_downloads_in_flight', 'Descargas de Moodle en curso')
+
+
+@dataclass
+class DownloadedFile:
+    """
+    Archivo descargado, listo para leer desde el principio
+    """
+    filename: str
+    file_url: str
+    content_type: str
+    size: int
+    content: BinaryIO
+    entry: Dict[str, Any] = field(default_factory=dict)
+
+    def close(self):
+        """Libera el archivo temporal (memoria o disco)."""
+        self.content.close()
+
+    def __enter__(self) -> "DownloadedFile":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _HostPoliteness:
+    """
+    Límite de descargas simultáneas e intervalo mínimo entre peticiones a un host
+    """
+    def __init__(self, max_concurrent: int, min_interval: float):
+        self.min_interval = min_interval
+        self._semaforo = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._siguiente = 0.0
+
+    def __enter__(self):
+        self._semaforo.acquire()
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._siguiente)
+            self._siguiente = turno + self.min_interval
+        if turno > ahora:
+            time.sleep(turno - ahora)
+        return self
+
+    def __exit__(self, *exc):
+        self._semaforo.release()
+
+
+class FileDownloader:
+    """
+    Descargador concurrente de archivos de Moodle con límites de tamaño y por host
+    """
+    def __init__(
+        self,
+        client,
+        concurrency: int = 4,
+        per_host: int = 2,
+        min_interval_seconds: float = 0.0,
+        max_file_bytes: Optional[int] = None,
+        spool_bytes: int = 8 * 1024 * 1024,
+        policy: Optional[FormatPolicy] = None
+    ):
+        """
+        Inicializa el descargador.
+
+        Args:
+            client: MoodleClient usado para las descargas
+            concurrency: Descargas simultáneas en total
+            per_host: Descargas simultáneas hacia un mismo host
+            min_interval_seconds: Separación mínima entre peticiones al mismo host
+            max_file_bytes: Tamaño máximo de archivo; None para no limitarlo
+            spool_bytes: Tamaño a partir del cual el archivo pasa de memoria a disco
+            policy: Formatos admitidos y tamaño máximo por tipo, decididos con los
+                primeros bytes de cada descarga; None para admitir todos
+        """
+        self.client = client
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.min_interval_seconds = min_interval_seconds
+        self.max_file_bytes = max_file_bytes
+        self.spool_bytes = spool_bytes
+        self.policy = policy
+        self.logger = configurar_logging("moodle_downloader")
+        # Cupos compartidos por todas las llamadas (varios cursos a la vez)
+        self._cupos = threading.BoundedSemaphore(self.concurrency)
+        self._hosts: Dict[str, _HostPoliteness] = {}
+        self._hosts_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, client, config: Dict[str, Any]) -> "FileDownloader":
+        """
+        Crea un descargador a partir de la sección ``downloads`` de la configuración.
+
+        Args:
+            client: MoodleClient usado para las descargas
+            config: Configuración del sistema
+
+        Returns:
+            Instancia de FileDownloader
+        """
+        downloads = config.get('downloads') or {}
+        max_mb = downloads.get('max_file_mb', 100)
+        return cls(
+            client,
+            concurrency=int(downloads.get('concurrency', 4)),
+            per_host=int(downloads.get('per_host', 2)),
+            min_interval_seconds=float(downloads.get('min_interval_seconds', 0)),
+            max_file_bytes=int(float(max_mb) * 1024 * 1024) if max_mb else None,
+            spool_bytes=int(float(downloads.get('spool_mb', 8)) * 1024 * 1024),
+            policy=FormatPolicy.from_config(config)
+        )
+
+    def _host(self, file_url: str) -> _HostPoliteness:
+        """Devuelve el limitador del host de la URL, creándolo si hace falta."""
+        host = urlsplit(file_url).netloc
+        with self._hosts_lock:
+            if host not in self._hosts:
+                self._hosts[host] = _HostPoliteness(self.per_host, self.min_interval_seconds)
+            return self._hosts[host]
+
+    def excede_limite(self, entry: Dict[str, Any]) -> bool:
+        """
+        Indica si el tamaño declarado por Moodle supera el máximo permitido.
+
+        Args:
+            entry: Entrada de ``contents`` de un módulo del curso
+
+        Returns:
+            True si el archivo no debe descargarse
+        """
+        filesize = entry.get('filesize')
+        return (self.max_file_bytes is not None and isinstance(filesize, int)
+                and filesize > self.max_file_bytes)
+
+    def download(self, entry: Dict[str, Any]) -> DownloadedFile:
+        """
+        Descarga un archivo respetando los límites de tamaño y del host.
+
+        Args:
+            entry: Entrada de ``contents`` con al menos ``fileurl`` y ``filename``
+
+        Returns:
+            Archivo descargado; el llamador debe cerrarlo
+
+        Raises:
+            ErrorArchivoDemasiadoGrande: Si el archivo supera el tamaño máximo
+            ErrorFormatoNoSoportado: Si el formato detectado no tiene extractor
+            ErrorMoodle: Si ocurre un error al descargar el archivo
+        """
+        filename = entry.get('filename', '')
+        file_url = entry['fileurl']
+        if self.excede_limite(entry):
+            raise ErrorArchivoDemasiadoGrande(
+                f"{filename} ocupa {entry['filesize']} bytes (máximo {self.max_file_bytes})"
+            )
+        destino = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes)
+        try:
+            # Los archivos en la caché local no cuentan para los límites del host
+            content_type = self.client.copy_from_cache(
+                file_url, destino, entry.get('timemodified'), entry.get('filesize'),
+                self.max_file_bytes
+            )
+            if content_type is None:
+                with self._cupos, self._host(file_url):
+                    DOWNLOADS_IN_FLIGHT.inc()
+                    try:
+                        content_type = self.client.stream_file(
+                            file_url, filename, destino, max_bytes=self.max_file_bytes,
+                            timemodified=entry.get('timemodified'), filesize=entry.get('filesize'),
+                            metadata=entry, policy=self.policy
+                        )
+                    finally:
+                        DOWNLOADS_IN_FLIGHT.dec()
+            destino.seek(0, 2)
+            size = destino.tell()
+            destino.seek(0)
+        except Exception:
+            destino.close()
+            raise
+        return DownloadedFile(filename, file_url, content_type, size, destino, entry)
+
+    def _download_counted(self, entry: Dict[str, Any]) -> DownloadedFile:
+        """Descarga un archivo registrando el resultado en las métricas."""
+        try:
+            descargado = self.download(entry)
+        except ErrorArchivoDemasiadoGrande:
+            DOWNLOADS.labels(outcome='too_large').inc()
+            raise
+        except ErrorFormatoNoSoportado:
+            DOWNLOADS.labels(outcome='unsupported').inc()
+            raise
+        except Exception:
+            DOWNLOADS.labels(outcome='error').inc()
+            raise
+        DOWNLOADS.labels(outcome='ok').inc()
+        return descargado
+
+    def download_all(
+        self, entries: Iterable[Dict[str, Any]]
+    ) -> Iterator[Tuple[Dict[str, Any], Optional[DownloadedFile], Optional[Exception]]]:
+        """
+        Descarga varios archivos en paralelo y los entrega según terminan.
+
+        Solo hay ``2 * concurrency`` descargas pendientes o sin consumir a la
+        vez, así los archivos descargados no se acumulan si el procesamiento
+        es más lento que la red. Si varias llamadas corren en paralelo (por
+        ejemplo, una por curso), comparten el límite de ``concurrency``. Los archivos que superan el tamaño máximo
+        declarado se descartan sin contactar a Moodle.
+
+        Args:
+            entries: Entradas de ``contents`` con ``fileurl`` y ``filename``
+
+        Yields:
+            Tuplas (entrada, archivo descargado o None, error o None); el
+            llamador debe cerrar cada archivo descargado
+        """
+        pendientes: Dict[Future, Dict[str, Any]] = {}
+        ventana = self.concurrency * 2
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='moodle-download')
+        try:
+            for entry in entries:
+                if self.excede_limite(entry):
+                    DOWNLOADS.labels(outcome='too_large').inc()
+                    yield entry, None, ErrorArchivoDemasiadoGrande(
+                        f"{entry.get('filename')} ocupa {entry['filesize']} bytes "
+                        f"(máximo {self.max_file_bytes})"
+                    )
+                    continue
+                pendientes[executor.submit(self._download_counted, entry)] = entry
+                while len(pendientes) >= ventana:
+                    yield from self._recoger(pendientes)
+            while pendientes:
+                yield from self._recoger(pendientes)
+        finally:
+            # Si el llamador abandona la iteración, liberar lo ya descargado
+            for futuro in pendientes:
+                futuro.cancel()
+            executor.shutdown(wait=True)
+            for futuro in pendientes:
+                if futuro.done() and not futuro.cancelled() and futuro.exception() is None:
+                    futuro.result().close()
+
+    def _recoger(self, pendientes: Dict[Future, Dict[str, Any]]):
+        """Espera a que termine al menos una descarga y entrega las terminadas."""
+        hechos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+        for futuro in hechos:
+            entry = pendientes.pop(futuro)
+            error = futuro.exception()
+            if error is not None:
+                yield entry, None, error
+            else:
+                yield entry, futuro.result(), None
@@ -0,0 +1,135 @@
+"""
+Empaquetado de contexto por presupuesto de tokens.
+
+En lugar de tomar siempre los tres primeros fragmentos, se llena un
+presupuesto de tokens con los fragmentos mejor ordenados, descartando los
+duplicados y recortando los solapamientos entre fragmentos contiguos.
+"""
+import re
+from typing import Dict, List, Tuple
+
+# Palabras y signos de puntuación: aproximación rápida a los tokens BPE
+_PIEZAS = re.compile(r"\w+|[^\w\s]")
+
+# Longitud del prefijo usado para detectar solapamientos entre fragmentos
+_SONDA = 48
+
+
+def estimate_tokens(texto: str) -> int:
+    """
+    Estima la cantidad de tokens de un texto sin cargar un tokenizador.
+
+    Cada signo de puntuación cuenta como un token y cada palabra como uno más
+    uno por cada 6 caracteres adicionales, lo que se aproxima a los
+    tokenizadores BPE de los modelos de Ollama en textos en español.
+
+    Args:
+        texto: Texto a medir
+
+    Returns:
+        Cantidad estimada de tokens
+    """
+    return sum(1 + (len(pieza) - 1) // 6 for pieza in _PIEZAS.findall(texto))
+
+
+def _recortar_a_tokens(texto: str, tokens: int) -> str:
+    """
+    Recorta un texto para que no supere la cantidad de tokens indicada.
+
+    Args:
+        texto: Texto a recortar
+        tokens: Máximo de tokens permitido
+
+    Returns:
+        Prefijo del texto que entra en el presupuesto
+    """
+    usados = 0
+    for pieza in _PIEZAS.finditer(texto):
+        usados += 1 + (len(pieza.group()) - 1) // 6
+        if usados > tokens:
+            return texto[:pieza.start()].rstrip()
+    return texto
+
+
+def _sin_solapamiento(fragmento: str, elegidos: List[str]) -> str:
+    """
+    Elimina del fragmento la parte que ya está cubierta por los elegidos.
+
+    Args:
+        fragmento: Fragmento candidato
+        elegidos: Fragmentos ya incluidos en el contexto
+
+    Returns:
+        Fragmento sin el prefijo solapado, o cadena vacía si está contenido
+        por completo en alguno de los elegidos
+    """
+    for elegido in elegidos:
+        if fragmento in elegido:
+            return ""
+        sonda = fragmento[:_SONDA]
+        if len(sonda) < _SONDA:
+            continue
+        pos = elegido.find(sonda)
+        # El final del elegido coincide con el principio del fragmento
+        if pos >= 0 and fragmento.startswith(elegido[pos:]):
+            fragmento = fragmento[len(elegido) - pos:]
+    return fragmento.strip()
+
+
+def pack_context(fragmentos: List[str], presupuesto: int) -> List[Tuple[int, str]]:
+    """
+    Selecciona fragmentos en orden de relevancia hasta llenar el presupuesto.
+
+    Los fragmentos que no entran se saltan para dar lugar a otros más cortos.
+    Si ni el primero entra, se incluye recortado para no dejar el contexto vacío.
+
+    Args:
+        fragmentos: Fragmentos ordenados de más a menos relevante
+        presupuesto: Máximo de tokens disponibles para el contexto
+
+    Returns:
+        Lista de tuplas (índice original, texto a incluir)
+    """
+    elegidos: List[Tuple[int, str]] = []
+    vistos = set()
+    restante = presupuesto
+    for i, fragmento in enumerate(fragmentos):
+        normalizado = ' '.join(fragmento.split()).lower()
+        if not normalizado or normalizado in vistos:
+            continue
+        vistos.add(normalizado)
+        texto = _sin_solapamiento(fragmento, [t for _, t in elegidos])
+        if not texto:
+            continue
+        tokens = estimate_tokens(texto)
+        if tokens <= restante:
+            elegidos.append((i, texto))
+            restante -= tokens
+    if not elegidos and fragmentos and presupuesto > 0:
+        recortado = _recortar_a_tokens(fragmentos[0], presupuesto)
+        if recortado:
+            elegidos.append((0, recortado))
+    return elegidos
+
+
+def trim_history(mensajes: List[Dict[str, str]], presupuesto: int) -> List[Dict[str, str]]:
+    """
+    Conserva los mensajes más recientes del historial que entran en el presupuesto.
+
+    Args:
+        mensajes: Mensajes en orden cronológico con 'sender' y 'content'
+        presupuesto: Máximo de tokens para el historial
+
+    Returns:
+        Sufijo del historial que entra en el presupuesto, en orden cronológico
+    """
+    conservados: List[Dict[str, str]] = []
+    restante = presupuesto
+    for mensaje in reversed(mensajes):
+        tokens = estimate_tokens(f"{mensaje['sender']}: {mensaje['content']}")
+        if tokens > restante:
+            break
+        conservados.append(mensaje)
+        restante -= tokens
+    conservados.reverse()
+    return conservados
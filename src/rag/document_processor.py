@@ -1,63 +1,222 @@
 """
 Procesador de documentos para extraer texto de diferentes tipos de archivos.
+
+Las bibliotecas de extracción (PyPDF2, python-pptx, python-docx, pytesseract
+y PIL) se importan recién al procesar el primer documento de cada tipo; al
+crear el procesador solo se comprueba que estén instaladas.
+
+Los documentos Word y PowerPoint se leen directamente del zip con
+``rag.ooxml``; python-docx y python-pptx quedan como alternativa si esa
+lectura falla. Las páginas de un PDF sin capa de texto (escaneos) se
+reconocen con OCR por página (ver ``rag.ocr``). El resultado se puede
+guardar en disco por hash del contenido (ver ``rag.extraction_cache``).
+
+El extractor se elige por el formato que indican los primeros bytes del
+contenido (``core.sniffing``) y no solo por el tipo MIME recibido, que
+Moodle a veces informa mal.
+
+Cada extractor entrega el texto por partes (página, párrafo o
+diapositiva): ``iter_document`` lo pasa a la indexación sin armar el
+documento completo y ``process_document`` lo devuelve unido.
 """
-import os
-import tempfile
-from typing import Dict, Any, Tuple, TYPE_CHECKING
+import codecs
+import hashlib
+import importlib
+import importlib.util
+import io
+import zipfile
+from functools import lru_cache
+from typing import Dict, Any, Iterator, Optional, Tuple
+from xml.etree import ElementTree
 from core.utils import configurar_logging
 from core.errors import ErrorProcesamientoDocumento
+from core.sniffing import DOCX, PDF, PPTX, SNIFF_BYTES, charset, con_charset, tipo_contenido
+from rag.extraction_cache import ExtractionCache
+from rag.ocr import PageOCR
+from rag.ooxml import iter_docx, iter_pptx
+
+# Cambia cuando cambia el texto que produce algún extractor: invalida la caché de extracción
+VERSION_EXTRACTORES = '2'
+
+# Páginas de un PDF que se extraen (y pasan por OCR) juntas
+PAGINAS_POR_TRAMO = 32
+
+# Caracteres de un archivo de texto entregados por vez
+CARACTERES_POR_PARTE = 64 * 1024
 
-if TYPE_CHECKING:
-    import PyPDF2
-    import pptx
-    import docx
-    import pytesseract
-    from PIL import Image
-else:
-    try:
-        import PyPDF2
-    except ImportError:
-        PyPDF2 = None
-    try:
-        import pptx
-    except ImportError:
-        pptx = None
-    try:
-        import docx
-    except ImportError:
-        docx = None
-    try:
-        import pytesseract
-        from PIL import Image
-    except ImportError:
-        pytesseract = None
-        Image = None
+
+def _disponible(*modulos: str) -> bool:
+    """
+    Comprueba si los módulos están instalados sin importarlos.
+    
+    Args:
+        *modulos: Nombres de los módulos
+        
+    Returns:
+        True si todos pueden importarse
+    """
+    return all(importlib.util.find_spec(m) is not None for m in modulos)
+
+
+@lru_cache(maxsize=None)
+def _modulo(nombre: str):
+    """
+    Importa un módulo la primera vez que se necesita.
+    
+    Args:
+        nombre: Nombre del módulo
+        
+    Returns:
+        Módulo importado
+    """
+    return importlib.import_module(nombre)
+
+
+def _binario(content: Any):
+    """
+    Devuelve el contenido como archivo binario posicionado al principio.
+    
+    Args:
+        content: bytes, str o archivo binario abierto
+        
+    Returns:
+        Archivo binario legible
+    """
+    if isinstance(content, str):
+        return io.BytesIO(content.encode('utf-8'))
+    if isinstance(content, (bytes, bytearray)):
+        return io.BytesIO(content)
+    content.seek(0)
+    return content
+
+
+def _sha256(content: Any) -> str:
+    """
+    Calcula el hash del contenido sin cargarlo entero en memoria.
+    
+    Args:
+        content: bytes, str o archivo binario abierto
+        
+    Returns:
+        Hash SHA-256 en hexadecimal
+    """
+    digest = hashlib.sha256()
+    archivo = _binario(content)
+    for bloque in iter(lambda: archivo.read(1024 * 1024), b''):
+        digest.update(bloque)
+    archivo.seek(0)
+    return digest.hexdigest()
+
+
+def _texto(content: Any, codificacion: Optional[str] = None) -> Iterator[str]:
+    """
+    Entrega el contenido como texto, por partes.
+    
+    Args:
+        content: bytes, str o archivo binario abierto
+        codificacion: Codificación del contenido; None para UTF-8
+        
+    Yields:
+        Texto decodificado (los bytes inválidos se reemplazan)
+    """
+    if isinstance(content, str):
+        yield content
+        return
+    archivo = _binario(content)
+    decodificador = codecs.getincrementaldecoder(codificacion or 'utf-8')(errors='replace')
+    for bloque in iter(lambda: archivo.read(CARACTERES_POR_PARTE), b''):
+        texto = decodificador.decode(bloque)
+        if texto:
+            yield texto
+    texto = decodificador.decode(b'', final=True)
+    if texto:
+        yield texto
 
 class DocumentProcessor:
     """
     Procesador de documentos para extraer texto de diferentes tipos de archivos
     """
-    def __init__(self):
+    def __init__(self, ocr: Optional[PageOCR] = None, fast_ooxml: bool = True,
+                 cache: Optional[ExtractionCache] = None):
         """
         Inicializa el procesador de documentos y verifica las dependencias disponibles.
+        
+        Args:
+            ocr: OCR por página para PDF escaneados e imágenes; None para
+                reconocer solo imágenes, sin caché ni pool
+            fast_ooxml: Leer Word y PowerPoint directamente del zip (``rag.ooxml``)
+                en lugar de usar python-docx y python-pptx
+            cache: Caché del texto extraído por hash del contenido; None para
+                extraer siempre
         """
         self.logger = configurar_logging("document_processor")
-        if PyPDF2 is None:
+        self.pdf_disponible = _disponible("PyPDF2")
+        self.pptx_disponible = _disponible("pptx")
+        self.docx_disponible = _disponible("docx")
+        self.ocr_disponible = _disponible("pytesseract", "PIL")
+        if not self.pdf_disponible:
             self.logger.warning("PyPDF2 no está instalado. El procesamiento de PDF no estará disponible.")
-        if pptx is None:
+        if not self.pptx_disponible:
             self.logger.warning("python-pptx no está instalado. El procesamiento de PowerPoint no estará disponible.")
-        if docx is None:
+        if not self.docx_disponible:
             self.logger.warning("python-docx no está instalado. El procesamiento de Word no estará disponible.")
-        if pytesseract is None or Image is None:
+        if not self.ocr_disponible:
             self.logger.warning("pytesseract o PIL no están instalados. El OCR no estará disponible.")
+        self.ocr = ocr if self.ocr_disponible else None
+        self.fast_ooxml = fast_ooxml
+        self.cache = cache
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "DocumentProcessor":
+        """
+        Crea un procesador a partir de las secciones ``ocr`` y ``extraction`` de la configuración.
+        
+        Args:
+            config: Configuración del sistema
+            
+        Returns:
+            Instancia de DocumentProcessor
+        """
+        ocr = config.get('ocr') or {}
+        extraction = config.get('extraction') or {}
+        return cls(
+            ocr=PageOCR.from_config(config) if ocr.get('enabled', True) else None,
+            fast_ooxml=extraction.get('fast_ooxml', True),
+            cache=ExtractionCache.from_config(config)
+        )
+
+    def _clave_cache(self, content: Any, content_type: str) -> str:
+        """
+        Calcula la clave de la caché de extracción de un documento.
+        
+        Incluye la versión de los extractores y todo lo que cambia su
+        resultado (bibliotecas disponibles, lectura directa de OOXML y
+        parámetros del OCR), para no reutilizar un texto extraído de otra forma.
+        
+        Args:
+            content: Contenido del archivo
+            content_type: Tipo MIME del archivo (con su ``charset``, que cambia el texto)
+            
+        Returns:
+            Hash SHA-256 en hexadecimal
+        """
+        firma = "|".join([
+            VERSION_EXTRACTORES, content_type, _sha256(content),
+            f"pdf={self.pdf_disponible},pptx={self.pptx_disponible},docx={self.docx_disponible}",
+            f"ooxml={self.fast_ooxml}",
+            f"ocr={self.ocr.firma() if self.ocr is not None else self.ocr_disponible}",
+        ])
+        return hashlib.sha256(firma.encode('utf-8')).hexdigest()
 
     def process_document(self, content: Any, content_type: str, filename: str) -> Tuple[str, Dict[str, Any]]:
         """
         Procesa un documento y extrae el texto según su tipo.
         
         Args:
-            content: Contenido del archivo (bytes o str)
-            content_type: Tipo MIME del archivo
+            content: Contenido del archivo (bytes, str o archivo binario abierto,
+                por ejemplo el de ``moodle.downloader.DownloadedFile``)
+            content_type: Tipo MIME informado (se corrige si los primeros bytes
+                indican otro formato)
             filename: Nombre del archivo
             
         Returns:
@@ -66,167 +225,274 @@ class DocumentProcessor:
         Raises:
             ErrorProcesamientoDocumento: Si ocurre un error al procesar el documento
         """
+        partes, metadata = self.iter_document(content, content_type, filename)
+        return "".join(partes), metadata
+
+    def iter_document(self, content: Any, content_type: str, filename: str) -> Tuple[Iterator[str], Dict[str, Any]]:
+        """
+        Extrae el texto de un documento por partes, a medida que se consume.
+        
+        Unidas, las partes son el texto de ``process_document``. Los
+        metadatos propios del contenido (páginas, diapositivas, páginas con
+        OCR) se agregan al diccionario devuelto cuando se agota el iterador.
+        El contenido debe seguir abierto mientras se recorre.
+        
+        Args:
+            content: Contenido del archivo (bytes, str o archivo binario abierto)
+            content_type: Tipo MIME informado (se corrige si los primeros bytes
+                indican otro formato); el parámetro ``charset`` decide cómo se
+                decodifica el texto (UTF-8 si falta y el archivo no declara otro)
+            filename: Nombre del archivo
+            
+        Returns:
+            Tupla con (iterador de partes del texto, metadatos)
+            
+        Raises:
+            ErrorFormatoNoSoportado: Si el tipo informado es binario y el contenido es texto
+            ErrorProcesamientoDocumento: Al recorrer el iterador, si ocurre un
+                error al procesar el documento
+        """
+        extraccion = content_type
+        if not isinstance(content, str):
+            content = _binario(content)
+            cabecera = content.read(SNIFF_BYTES)
+            detectado = tipo_contenido(cabecera, filename, content_type)
+            content.seek(0)
+            if detectado != content_type.split(';')[0].strip().lower():
+                self.logger.debug(f"{filename}: tipo informado {content_type}, detectado {detectado}")
+            extraccion = detectado
+            if detectado.startswith("text/"):
+                # El texto se decodifica con el charset declarado (o el que declara el archivo)
+                extraccion = con_charset(detectado, charset(content_type, cabecera))
+            content_type = detectado
         metadata = {"filename": filename, "content_type": content_type}
+        return self._extraer(content, extraccion, metadata), metadata
+
+    def _extraer(self, content: Any, content_type: str, metadata: Dict[str, Any]) -> Iterator[str]:
+        """
+        Entrega las partes del texto desde la caché o desde el extractor.
+        
+        Args:
+            content: Contenido del archivo
+            content_type: Tipo MIME detectado (con ``charset`` si es texto y se conoce)
+            metadata: Metadatos del documento; al terminar se les agregan los
+                propios del contenido
+            
+        Yields:
+            Partes del texto
+        """
+        # El nombre y el tipo son del archivo, no del contenido: la caché guarda solo estos
+        propios: Dict[str, Any] = {}
+        if self.cache is None:
+            yield from self._partes(content, content_type, propios)
+        else:
+            clave = self._clave_cache(content, content_type)
+            partes = self.cache.get(clave, propios)
+            if partes is None:
+                partes = self.cache.put(clave, self._partes(content, content_type, propios), propios)
+            yield from partes
+        metadata.update(propios)
+
+    def _partes(self, content: Any, content_type: str, metadata: Dict[str, Any]) -> Iterator[str]:
+        """
+        Extrae el texto con el procesador que corresponde al tipo del documento.
+        
+        Args:
+            content: Contenido del archivo
+            content_type: Tipo MIME del archivo (el ``charset`` de un texto decide su decodificación)
+            metadata: Metadatos del documento
+            
+        Yields:
+            Partes del texto
+            
+        Raises:
+            ErrorProcesamientoDocumento: Si ocurre un error al procesar el documento
+        """
         try:
-            if content_type == "application/pdf" and PyPDF2:
-                return self._process_pdf(content, metadata)
-            elif content_type in ["application/vnd.openxmlformats-officedocument.presentationml.presentation", "application/vnd.ms-powerpoint"] and pptx:
-                return self._process_pptx(content, metadata)
-            elif content_type in ["application/vnd.openxmlformats-officedocument.wordprocessingml.document", "application/msword"] and docx:
-                return self._process_docx(content, metadata)
-            elif content_type.startswith("image/") and pytesseract and Image:
-                return self._process_image(content, metadata)
+            # Los .doc y .ppt binarios (OLE2) no tienen extractor: python-docx y
+            # python-pptx solo leen OOXML
+            if content_type == PDF and self.pdf_disponible:
+                yield from self._process_pdf(content, metadata)
+            elif content_type == PPTX and (self.fast_ooxml or self.pptx_disponible):
+                yield from self._process_pptx(content, metadata)
+            elif content_type == DOCX and (self.fast_ooxml or self.docx_disponible):
+                yield from self._process_docx(content, metadata)
+            elif content_type.startswith("image/") and self.ocr_disponible:
+                yield from self._process_image(content, metadata)
             elif content_type.startswith("text/"):
-                return str(content), metadata
+                yield from _texto(content, charset(content_type))
             else:
                 self.logger.warning(f"Tipo de archivo no soportado: {content_type}")
-                return "", metadata
         except Exception as e:
             self.logger.error(f"Error al procesar documento: {e}")
             raise ErrorProcesamientoDocumento(str(e))
 
-    def _process_pdf(self, content: bytes, metadata: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    def _process_pdf(self, content: Any, metadata: Dict[str, Any]) -> Iterator[str]:
         """
-        Extrae texto de un archivo PDF
+        Extrae texto de un archivo PDF, página por página
+        
+        Las páginas se extraen por tramos de ``PAGINAS_POR_TRAMO``; las de
+        cada tramo que no tienen capa de texto pasan juntas por OCR. Al
+        terminar cada tramo se vacía la caché de objetos de PdfReader: si no,
+        conserva los flujos de contenido e imágenes de todas las páginas ya
+        leídas y la memoria crece con el documento.
         
         Args:
-            content: Contenido binario del PDF
+            content: Contenido binario del PDF (bytes o archivo)
             metadata: Metadatos del documento
             
-        Returns:
-            Tupla con (texto extraído, metadatos actualizados)
+        Yields:
+            Texto de cada página, seguido de una línea en blanco
             
         Raises:
             ErrorProcesamientoDocumento: Si ocurre un error al procesar el PDF
         """
         try:
-            # Guardar el contenido en un archivo temporal
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                temp_file.write(content)
-                temp_path = temp_file.name
-
-            # Extraer texto
-            text = ""
-            with open(temp_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                metadata['page_count'] = len(reader.pages)
-
-                for page_num in range(len(reader.pages)):
-                    page = reader.pages[page_num]
-                    text += page.extract_text() + "\n\n"
+            # Extraer texto leyendo directamente el contenido (sin copia temporal)
+            archivo = _binario(content)
+            reader = _modulo("PyPDF2").PdfReader(archivo)
+            total = len(reader.pages)
+            metadata['page_count'] = total
+            tramo = max(PAGINAS_POR_TRAMO, 2 * self.ocr.workers) if self.ocr is not None else 1
+            paginas_ocr = 0
 
-            # Limpiar archivo temporal
-            os.unlink(temp_path)
+            for inicio in range(0, total, tramo):
+                numeros = range(inicio, min(inicio + tramo, total))
+                textos = {n: reader.pages[n].extract_text() or "" for n in numeros}
+                # Solo las páginas sin capa de texto pasan por OCR
+                if self.ocr is not None:
+                    reconocidas = self.ocr.ocr_pages(reader, archivo, textos)
+                    textos.update(reconocidas)
+                    paginas_ocr += len(reconocidas)
+                # Los objetos se vuelven a leer del archivo si otra página los usa
+                reader.resolved_objects.clear()
+                for n in numeros:
+                    yield textos[n] + "\n\n"
 
-            return text, metadata
+            if paginas_ocr:
+                metadata['ocr_pages'] = paginas_ocr
+                self.logger.info(f"OCR aplicado a {paginas_ocr} de {total} páginas")
 
         except Exception as e:
             self.logger.error(f"Error al procesar PDF: {e}")
             raise ErrorProcesamientoDocumento(str(e))
 
-    def _process_pptx(self, content: bytes, metadata: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    def _process_pptx(self, content: Any, metadata: Dict[str, Any]) -> Iterator[str]:
         """
-        Extrae texto de una presentación PowerPoint
+        Extrae texto de una presentación PowerPoint, diapositiva por diapositiva
+        
+        Si la lectura directa del zip falla antes de entregar texto, se usa
+        python-pptx.
         
         Args:
-            content: Contenido binario de la presentación
+            content: Contenido binario de la presentación (bytes o archivo)
             metadata: Metadatos del documento
             
-        Returns:
-            Tupla con (texto extraído, metadatos actualizados)
+        Yields:
+            Texto de cada diapositiva
             
         Raises:
             ErrorProcesamientoDocumento: Si ocurre un error al procesar la presentación
         """
-        try:
-            # Guardar el contenido en un archivo temporal
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pptx') as temp_file:
-                temp_file.write(content)
-                temp_path = temp_file.name
+        archivo = _binario(content)
+        if self.fast_ooxml:
+            entregadas = 0
+            try:
+                for numero, texto in iter_pptx(archivo):
+                    entregadas += 1
+                    yield f"Slide {numero}:\n" + (texto + "\n" if texto else "") + "\n"
+                metadata['slide_count'] = entregadas
+                return
+            except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+                # Las diapositivas ya entregadas no se pueden repetir con la otra biblioteca
+                if entregadas or not self.pptx_disponible:
+                    self.logger.error(f"Error al procesar PowerPoint: {e}")
+                    raise ErrorProcesamientoDocumento(str(e))
+                self.logger.warning(f"No se pudo leer la presentación directamente ({e}); se usa python-pptx")
+                archivo.seek(0)
 
+        try:
             # Extraer texto
-            text = ""
-            presentation = pptx.Presentation(temp_path)
+            presentation = _modulo("pptx").Presentation(archivo)
             metadata['slide_count'] = len(presentation.slides)
 
             for i, slide in enumerate(presentation.slides):
-                text += f"Slide {i+1}:\n"
+                text = f"Slide {i+1}:\n"
                 for shape in slide.shapes:
                     if hasattr(shape, "text") and shape.text:
                         text += shape.text + "\n"
-                text += "\n"
-
-            # Limpiar archivo temporal
-            os.unlink(temp_path)
-
-            return text, metadata
+                yield text + "\n"
 
         except Exception as e:
             self.logger.error(f"Error al procesar PowerPoint: {e}")
             raise ErrorProcesamientoDocumento(str(e))
 
-    def _process_docx(self, content: bytes, metadata: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    def _process_docx(self, content: Any, metadata: Dict[str, Any]) -> Iterator[str]:
         """
-        Extrae texto de un documento Word
+        Extrae texto de un documento Word, párrafo por párrafo
+        
+        Si la lectura directa del zip falla antes de entregar texto, se usa
+        python-docx.
         
         Args:
-            content: Contenido binario del documento
+            content: Contenido binario del documento (bytes o archivo)
             metadata: Metadatos del documento
             
-        Returns:
-            Tupla con (texto extraído, metadatos actualizados)
+        Yields:
+            Texto de cada párrafo, separado del anterior por un salto de línea
             
         Raises:
             ErrorProcesamientoDocumento: Si ocurre un error al procesar el documento
         """
-        try:
-            # Guardar el contenido en un archivo temporal
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as temp_file:
-                temp_file.write(content)
-                temp_path = temp_file.name
+        archivo = _binario(content)
+        if self.fast_ooxml:
+            entregados = 0
+            try:
+                for parrafo in iter_docx(archivo):
+                    yield ("\n" if entregados else "") + parrafo
+                    entregados += 1
+                return
+            except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+                # Los párrafos ya entregados no se pueden repetir con la otra biblioteca
+                if entregados or not self.docx_disponible:
+                    self.logger.error(f"Error al procesar Word: {e}")
+                    raise ErrorProcesamientoDocumento(str(e))
+                self.logger.warning(f"No se pudo leer el documento directamente ({e}); se usa python-docx")
+                archivo.seek(0)
 
+        try:
             # Extraer texto
-            doc = docx.Document(temp_path)
-            text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-
-            # Limpiar archivo temporal
-            os.unlink(temp_path)
-
-            return text, metadata
+            doc = _modulo("docx").Document(archivo)
+            for i, paragraph in enumerate(doc.paragraphs):
+                yield ("\n" if i else "") + paragraph.text
 
         except Exception as e:
             self.logger.error(f"Error al procesar Word: {e}")
             raise ErrorProcesamientoDocumento(str(e))
 
-    def _process_image(self, content: bytes, metadata: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    def _process_image(self, content: Any, metadata: Dict[str, Any]) -> Iterator[str]:
         """
         Extrae texto de una imagen usando OCR
         
         Args:
-            content: Contenido binario de la imagen
+            content: Contenido binario de la imagen (bytes o archivo)
             metadata: Metadatos del documento
             
-        Returns:
-            Tupla con (texto extraído, metadatos actualizados)
+        Yields:
+            Texto reconocido
             
         Raises:
             ErrorProcesamientoDocumento: Si ocurre un error al procesar la imagen
         """
         try:
-            # Guardar el contenido en un archivo temporal
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
-                temp_file.write(content)
-                temp_path = temp_file.name
-
             # Extraer texto con OCR
-            image = Image.open(temp_path)
-            text = pytesseract.image_to_string(image)
-
-            # Limpiar archivo temporal
-            os.unlink(temp_path)
-
-            return text, metadata
+            if self.ocr is not None:
+                text = self.ocr.ocr_image(_binario(content).read())
+            else:
+                image = _modulo("PIL.Image").open(_binario(content))
+                text = _modulo("pytesseract").image_to_string(image)
 
         except Exception as e:
             self.logger.error(f"Error al procesar imagen con OCR: {e}")
-            raise ErrorProcesamientoDocumento(str(e))
\ No newline at end of file
+            raise ErrorProcesamientoDocumento(str(e))
+        yield text
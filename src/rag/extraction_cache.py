@@ -0,0 +1,138 @@
+"""
+Caché persistente del texto extraído de los documentos.
+
+Extraer el texto (PDF, OCR, Word, PowerPoint) es la parte más lenta de la
+indexación, y no cambia al cambiar el chunker o el modelo de embeddings.
+El resultado de ``DocumentProcessor.process_document`` se guarda
+comprimido en disco, identificado por el hash del contenido junto con la
+versión de los extractores y su configuración: reindexar para probar otro
+modelo solo paga los embeddings.
+
+Cada entrada es una secuencia comprimida de líneas JSON (una por parte del
+texto y una final con los metadatos) que se escribe y se lee a medida que
+el texto pasa hacia la indexación, sin armar el documento completo.
+"""
+import json
+import zlib
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional
+
+from core import metrics
+from core.blobstore import BlobStore
+from core.utils import configurar_logging
+
+EXTRACTION_CACHE_LOOKUPS = metrics.counter(
+    'rag_extraction_cache_lookups_total', 'Búsquedas en la caché de texto extraído', ['result'])
+EXTRACTION_CACHE_BYTES = metrics.gauge(
+    'rag_extraction_cache_bytes', 'Bytes ocupados por la caché de texto extraído')
+
+# Bytes comprimidos leídos por vez
+BLOQUE = 64 * 1024
+
+
+class ExtractionCache:
+    """
+    Texto y metadatos extraídos de cada documento, comprimidos en disco por hash
+    """
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        """
+        Abre (o crea) la caché.
+
+        Args:
+            directory: Directorio donde guardar los resultados
+            max_bytes: Tamaño máximo de la caché; None para no limitarlo
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.logger = configurar_logging("extraction_cache")
+        self._blobs = BlobStore(directory, suffix='.json.z', max_bytes=max_bytes,
+                                descripcion='Caché de extracción')
+        EXTRACTION_CACHE_BYTES.set_function(lambda: self._blobs.total)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["ExtractionCache"]:
+        """
+        Crea la caché a partir de la sección ``extraction`` de la configuración.
+
+        Args:
+            config: Configuración del sistema
+
+        Returns:
+            Instancia de ExtractionCache, o None si ``extraction.cache_dir`` está vacío
+        """
+        extraction = config.get('extraction') or {}
+        directorio = extraction.get('cache_dir')
+        if not directorio:
+            return None
+        max_mb = extraction.get('cache_max_mb', 1024)
+        return cls(directorio, max_bytes=int(float(max_mb) * 1024 * 1024) if max_mb else None)
+
+    def get(self, clave: str, metadata: Dict[str, Any]) -> Optional[Iterator[str]]:
+        """
+        Busca el resultado de la extracción de un documento.
+
+        Args:
+            clave: Hash del contenido, la versión de los extractores y su configuración
+            metadata: Diccionario que recibe los metadatos guardados al terminar de
+                recorrer el texto
+
+        Returns:
+            Iterador de las partes del texto, o None si no está en la caché.
+            Si la entrada resulta ilegible se descarta y el iterador lanza
+            ``ValueError``; la próxima extracción vuelve a guardarla.
+        """
+        archivo = self._blobs.abrir(clave)
+        if archivo is None:
+            EXTRACTION_CACHE_LOOKUPS.labels(result='miss').inc()
+            return None
+        EXTRACTION_CACHE_LOOKUPS.labels(result='hit').inc()
+        return self._leer(clave, archivo, metadata)
+
+    def _leer(self, clave: str, archivo: BinaryIO, metadata: Dict[str, Any]) -> Iterator[str]:
+        """Descomprime una entrada por bloques y entrega sus partes de texto."""
+        with archivo:
+            try:
+                descompresor = zlib.decompressobj()
+                resto = b''
+                completa = False
+                for bloque in iter(lambda: archivo.read(BLOQUE), b''):
+                    resto += descompresor.decompress(bloque)
+                    *lineas, resto = resto.split(b'\n')
+                    for linea in lineas:
+                        registro = json.loads(linea)
+                        if isinstance(registro, str):
+                            yield registro
+                        else:
+                            metadata.update(registro['metadata'])
+                            completa = True
+                if not completa:
+                    raise ValueError("entrada incompleta")
+            except (OSError, ValueError, KeyError, TypeError, zlib.error) as e:
+                self.logger.warning(f"Entrada de la caché de extracción ilegible, se descarta: {e}")
+                self._blobs.descartar(clave)
+                raise ValueError(f"Entrada de la caché de extracción ilegible: {e}")
+
+    def put(self, clave: str, textos: Iterable[str], metadata: Dict[str, Any]) -> Iterator[str]:
+        """
+        Guarda el resultado de la extracción de un documento mientras se consume.
+
+        La entrada se escribe en un archivo temporal a medida que pasan las
+        partes del texto y se publica recién al agotarlas; si la extracción
+        falla o se abandona, no queda nada en la caché.
+
+        Args:
+            clave: Hash del contenido, la versión de los extractores y su configuración
+            textos: Partes del texto extraído
+            metadata: Metadatos propios del contenido (páginas, diapositivas, OCR);
+                se guardan tal como quedan al agotar ``textos``
+
+        Yields:
+            Las mismas partes de ``textos``
+        """
+        with self._blobs.escribir(clave) as tmp:
+            compresor = zlib.compressobj()
+            for texto in textos:
+                tmp.write(compresor.compress(json.dumps(texto, ensure_ascii=False).encode('utf-8') + b'\n'))
+                yield texto
+            tmp.write(compresor.compress(json.dumps({'metadata': metadata}, ensure_ascii=False,
+                                                    default=str).encode('utf-8') + b'\n'))
+            tmp.write(compresor.flush())
@@ -0,0 +1,323 @@
+"""
+Indexación de cursos de Moodle en el almacén de vectores.
+
+Varios cursos se indexan en paralelo. Todos comparten los mismos cupos de
+descargas (``FileDownloader``), de embeddings y de upserts en Qdrant
+(``VectorStore.set_concurrency_limits``), de modo que indexar 100 cursos
+no multiplica la carga sobre Moodle, Ollama ni Qdrant. El avance se
+informa por curso.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Set, Union
+from uuid import uuid4
+
+from core import metrics
+from core.errors import ErrorArchivoDemasiadoGrande, ErrorFormatoNoSoportado, ErrorMoodle
+from core.utils import configurar_logging
+
+INDEX_DOCUMENTS = metrics.counter(
+    'rag_index_documents_total', 'Documentos procesados en la indexación', ['outcome'])
+INDEX_COURSE_FILES = metrics.gauge(
+    'rag_index_course_files', 'Archivos de cada curso en la indexación en curso', ['course', 'state'])
+INDEX_COURSE_SECONDS = metrics.gauge(
+    'rag_index_course_seconds', 'Duración de la última indexación de cada curso', ['course'])
+
+# Resultados posibles de un archivo
+RESULTADOS = ('indexed', 'empty', 'too_large', 'unsupported', 'failed')
+
+
+def seleccionar_cursos(
+    moodle_client,
+    shortnames: Optional[Iterable[str]] = None,
+    category: Optional[int] = None,
+    all_visible: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Obtiene los cursos a indexar.
+
+    Usa ``core_course_get_courses_by_field`` para pedir solo los cursos
+    necesarios en lugar de recorrer la lista completa.
+
+    Args:
+        moodle_client: Cliente de Moodle
+        shortnames: Nombres cortos de los cursos
+        category: ID de una categoría (se indexan sus cursos visibles)
+        all_visible: Indexar todos los cursos visibles
+
+    Returns:
+        Lista de cursos (sin duplicados, en el orden pedido)
+
+    Raises:
+        ErrorMoodle: Si algún nombre corto no existe
+    """
+    cursos: List[Dict[str, Any]] = []
+    if all_visible:
+        cursos.extend(moodle_client.get_courses_by_field())
+    if category is not None:
+        cursos.extend(moodle_client.get_courses_by_field('category', category))
+    faltantes = []
+    for shortname in shortnames or []:
+        encontrados = moodle_client.get_courses_by_field('shortname', shortname)
+        if not encontrados:
+            faltantes.append(shortname)
+        cursos.extend(encontrados)
+    if faltantes:
+        raise ErrorMoodle(f"No se encontraron los cursos: {', '.join(faltantes)}")
+
+    explicitos = set(shortnames or [])
+    vistos = set()
+    seleccion = []
+    for curso in cursos:
+        # El curso 'site' (portada) no tiene material de cursado
+        if curso['id'] in vistos or curso.get('format') == 'site':
+            continue
+        # Los cursos ocultos solo se indexan si se piden por nombre
+        if not curso.get('visible', 1) and curso.get('shortname') not in explicitos:
+            continue
+        vistos.add(curso['id'])
+        seleccion.append(curso)
+    return seleccion
+
+
+class CourseIndexer:
+    """
+    Indexa cursos de Moodle en paralelo con límites compartidos
+    """
+    def __init__(self, moodle_client, downloader, doc_processor, vector_store, course_concurrency: int = 2):
+        """
+        Inicializa el indexador.
+
+        Args:
+            moodle_client: Cliente de Moodle
+            downloader: FileDownloader compartido por todos los cursos
+            doc_processor: Procesador de documentos
+            vector_store: Almacén de vectores (con sus cupos ya configurados)
+            course_concurrency: Cursos indexados a la vez
+        """
+        self.moodle_client = moodle_client
+        self.downloader = downloader
+        self.doc_processor = doc_processor
+        self.vector_store = vector_store
+        self.course_concurrency = max(1, course_concurrency)
+        self.logger = configurar_logging("indexer")
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], moodle_client, vector_store) -> "CourseIndexer":
+        """
+        Crea el indexador a partir de las secciones ``indexing`` y ``downloads``.
+
+        Args:
+            config: Configuración del sistema
+            moodle_client: Cliente de Moodle
+            vector_store: Almacén de vectores
+
+        Returns:
+            Instancia de CourseIndexer
+        """
+        from moodle.downloader import FileDownloader
+        from rag.document_processor import DocumentProcessor
+
+        indexing = config.get('indexing') or {}
+        vector_store.set_concurrency_limits(
+            embeddings=int(indexing.get('embed_concurrency', 4)),
+            upserts=int(indexing.get('upsert_concurrency', 2))
+        )
+        return cls(
+            moodle_client,
+            FileDownloader.from_config(moodle_client, config),
+            DocumentProcessor.from_config(config),
+            vector_store,
+            course_concurrency=int(indexing.get('course_concurrency', 2))
+        )
+
+    def course_files(self, curso: Dict[str, Any],
+                     secciones: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        Reúne los archivos de cada sección y módulo de un curso.
+
+        Args:
+            curso: Curso de Moodle
+            secciones: Resultado de ``get_course_contents`` si ya se obtuvo
+
+        Returns:
+            Entradas de ``contents`` con los datos del curso, la sección y el módulo
+        """
+        if secciones is None:
+            secciones = self.moodle_client.get_course_contents(curso['id'])
+        archivos = []
+        for seccion in secciones:
+            for modulo in seccion.get('modules', []):
+                for contenido in modulo.get('contents', []):
+                    if 'fileurl' in contenido:
+                        archivos.append({
+                            **contenido,
+                            'course': curso.get('fullname'),
+                            'course_id': curso['id'],
+                            'module_id': modulo.get('id'),
+                            'section': seccion.get('name'),
+                            'module': modulo.get('name'),
+                            'module_type': modulo.get('modname')
+                        })
+        return archivos
+
+    def index_file(self, contenido: Union[bytes, str, BinaryIO], tipo_contenido: str,
+                   archivo: Dict[str, Any], documentos: Optional[Set[str]] = None) -> str:
+        """
+        Extrae el texto de un archivo y lo indexa con los metadatos de su módulo.
+
+        El archivo se indexa con un ``document_id`` nuevo y recién cuando la
+        indexación termina se borran los puntos que ya tenía (mismo
+        ``fileurl``, otro ``document_id``): si falla, el archivo conserva su
+        versión anterior en el índice. El texto pasa del extractor a los embeddings por partes
+        (``iter_document`` y ``index_stream``), sin armar el documento
+        completo: la memoria usada no depende de su tamaño.
+
+        Args:
+            contenido: Contenido del archivo (bytes, str o archivo binario abierto)
+            tipo_contenido: Tipo MIME del archivo
+            archivo: Entrada del archivo con 'filename', 'course', 'section',
+                'module' y 'module_type'
+            documentos: Conjunto que recibe el ``document_id`` del archivo si
+                se indexó o resultó sin texto
+
+        Returns:
+            Resultado: 'indexed', 'empty', 'unsupported' o 'failed'
+        """
+        nombre_archivo = archivo.get('filename')
+        try:
+            partes, metadata = self.doc_processor.iter_document(
+                contenido, tipo_contenido, nombre_archivo
+            )
+            metadata.update({
+                'course': archivo.get('course'),
+                'course_id': archivo.get('course_id'),
+                'module_id': archivo.get('module_id'),
+                'file_url': archivo.get('fileurl'),
+                'timemodified': archivo.get('timemodified'),
+                'section': archivo.get('section'),
+                'module': archivo.get('module'),
+                'module_type': archivo.get('module_type')
+            })
+            self.logger.info(f"Indexando documento: {nombre_archivo}")
+            documento = uuid4().hex
+            if self.vector_store.index_stream(partes, metadata, document_id=documento):
+                resultado = 'indexed'
+            else:
+                self.logger.warning(f"No se pudo extraer texto de {nombre_archivo}")
+                resultado = 'empty'
+            if documentos is not None:
+                documentos.add(documento)
+            if archivo.get('fileurl'):
+                # Reindexar un archivo reemplaza sus puntos en lugar de duplicarlos
+                self.vector_store.delete_points(file_url=archivo['fileurl'], excluir={'document_id': documento})
+        except ErrorFormatoNoSoportado as e:
+            self.logger.warning(f"Se omite {nombre_archivo}: {e}")
+            resultado = 'unsupported'
+        except Exception as e:
+            self.logger.error(f"Error al procesar {nombre_archivo}: {e}")
+            resultado = 'failed'
+        INDEX_DOCUMENTS.labels(outcome=resultado).inc()
+        return resultado
+
+    def index_course(self, curso: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Descarga e indexa los archivos de un curso.
+
+        Args:
+            curso: Curso de Moodle
+
+        Returns:
+            Resumen con 'course', 'files', 'seconds', un contador por resultado
+            y 'error' si no se pudo leer el contenido del curso
+        """
+        nombre = curso.get('shortname') or str(curso['id'])
+        inicio = time.perf_counter()
+        resumen: Dict[str, Any] = {'course': nombre, 'files': 0, **{r: 0 for r in RESULTADOS}}
+        try:
+            archivos = self.course_files(curso)
+        except ErrorMoodle as e:
+            self.logger.error(f"[{nombre}] No se pudo obtener el contenido: {e}")
+            resumen['error'] = str(e)
+            return resumen
+
+        self.logger.info(f"[{nombre}] {curso.get('fullname')}: {len(archivos)} archivos")
+        self.index_files(nombre, archivos, resumen)
+        resumen['seconds'] = round(time.perf_counter() - inicio, 1)
+        INDEX_COURSE_SECONDS.labels(course=nombre).set(resumen['seconds'])
+        return resumen
+
+    def index_files(self, nombre: str, archivos: List[Dict[str, Any]],
+                    resumen: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Descarga e indexa una lista de archivos informando el avance.
+
+        Args:
+            nombre: Nombre con el que se informa el avance (el curso)
+            archivos: Entradas de archivos (ver ``course_files``)
+            resumen: Resumen a actualizar; None para crear uno nuevo
+
+        Returns:
+            Resumen con 'files', un contador por resultado, 'failed_modules'
+            (módulos con algún archivo que no se pudo descargar o procesar) y
+            'document_ids' (documentos indexados, para borrar después los
+            puntos que reemplazan)
+        """
+        if resumen is None:
+            resumen = {'course': nombre, 'files': 0, **{r: 0 for r in RESULTADOS}}
+        resumen.setdefault('failed_modules', set())
+        resumen.setdefault('document_ids', set())
+        resumen['files'] += len(archivos)
+        INDEX_COURSE_FILES.labels(course=nombre, state='total').set(len(archivos))
+        INDEX_COURSE_FILES.labels(course=nombre, state='done').set(0)
+
+        hechos = 0
+        for archivo, descargado, error in self.downloader.download_all(archivos):
+            if error is not None:
+                if isinstance(error, ErrorArchivoDemasiadoGrande):
+                    resultado = 'too_large'
+                elif isinstance(error, ErrorFormatoNoSoportado):
+                    resultado = 'unsupported'
+                else:
+                    resultado = 'failed'
+                INDEX_DOCUMENTS.labels(outcome=resultado).inc()
+                self.logger.warning(f"[{nombre}] Se omite {archivo.get('filename')}: {error}")
+            else:
+                with descargado:
+                    resultado = self.index_file(descargado.content, descargado.content_type, archivo,
+                                                resumen['document_ids'])
+            resumen[resultado] += 1
+            if resultado == 'failed':
+                resumen['failed_modules'].add(archivo.get('module_id'))
+            hechos += 1
+            INDEX_COURSE_FILES.labels(course=nombre, state='done').set(hechos)
+            self.logger.info(f"[{nombre}] {hechos}/{len(archivos)} archivos "
+                             f"({resumen['indexed']} indexados, {resumen['failed']} fallidos)")
+        return resumen
+
+    def index_courses(self, cursos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Indexa varios cursos en paralelo.
+
+        Args:
+            cursos: Cursos de Moodle
+
+        Returns:
+            Resumen de cada curso, en el orden en que terminaron
+        """
+        self.logger.info(f"Indexando {len(cursos)} cursos ({self.course_concurrency} a la vez)")
+        resumenes = []
+        with ThreadPoolExecutor(max_workers=self.course_concurrency,
+                                thread_name_prefix='index-course') as executor:
+            futuros = {executor.submit(self.index_course, curso): curso for curso in cursos}
+            for i, futuro in enumerate(as_completed(futuros), 1):
+                resumen = futuro.result()
+                resumenes.append(resumen)
+                self.logger.info(
+                    f"Curso {resumen['course']} terminado ({i}/{len(cursos)}): "
+                    f"{resumen['indexed']} indexados, {resumen['empty']} sin texto, "
+                    f"{resumen['too_large']} omitidos por tamaño, "
+                    f"{resumen['unsupported']} por formato, {resumen['failed']} fallidos"
+                    + (f", error: {resumen['error']}" if 'error' in resumen else '')
+                )
+        return resumenes
@@ -0,0 +1,374 @@
+"""
+OCR por página para PDF escaneados.
+
+Los apuntes escaneados no tienen capa de texto: PyPDF2 devuelve cadenas
+vacías y el archivo se descartaba. Aquí se detectan las páginas sin texto
+extraíble y solo esas pasan por OCR, en paralelo. Cada página se
+rasteriza con ``pdf2image`` (poppler) si está instalado; si no, se leen
+las imágenes que la página incrusta, que en un escaneo son la hoja
+completa.
+
+El OCR es el paso más caro de la indexación, así que su resultado se
+guarda en disco por el hash de la página (contenido y flujos de sus
+imágenes): una reindexación no vuelve a reconocer páginas que ya procesó,
+aunque el PDF se haya modificado en otras páginas.
+"""
+import hashlib
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core import metrics
+from core.blobstore import BlobStore
+from core.utils import configurar_logging
+
+OCR_PAGES = metrics.counter(
+    'rag_ocr_pages_total', 'Páginas o imágenes procesadas con OCR', ['result'])
+OCR_SECONDS = metrics.histogram(
+    'rag_ocr_seconds', 'Duración del OCR de una página o imagen')
+
+# Cambia si cambia la forma de producir el texto, para no reutilizar resultados viejos
+VERSION_OCR = '1'
+
+
+class OCRCache:
+    """
+    Textos reconocidos por OCR guardados en disco por hash
+    """
+    def __init__(self, directory: str):
+        """
+        Abre (o crea) la caché.
+
+        Args:
+            directory: Directorio donde guardar los textos
+        """
+        self.directory = directory
+        self._blobs = BlobStore(directory, suffix='.txt', descripcion='Caché de OCR')
+
+    def get(self, clave: str) -> Optional[str]:
+        """
+        Busca el texto de una página.
+
+        Args:
+            clave: Hash de la página
+
+        Returns:
+            Texto reconocido, o None si no está en la caché
+        """
+        archivo = self._blobs.abrir(clave)
+        if archivo is None:
+            return None
+        with archivo:
+            return archivo.read().decode('utf-8')
+
+    def put(self, clave: str, texto: str):
+        """
+        Guarda el texto de una página.
+
+        Args:
+            clave: Hash de la página
+            texto: Texto reconocido
+        """
+        self._blobs.guardar(clave, texto.encode('utf-8'))
+
+
+class PageOCR:
+    """
+    OCR en paralelo de las páginas sin capa de texto, con caché por página
+    """
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        lang: str = 'eng',
+        dpi: int = 200,
+        min_chars: int = 20,
+        cache: Optional[OCRCache] = None
+    ):
+        """
+        Inicializa el OCR.
+
+        Args:
+            workers: Páginas reconocidas a la vez; None para usar los núcleos disponibles
+            lang: Idiomas de tesseract (por ejemplo 'spa+eng')
+            dpi: Resolución con la que se rasterizan las páginas
+            min_chars: Caracteres extraídos por debajo de los cuales la página se
+                considera sin capa de texto
+            cache: Caché de textos reconocidos; None para reconocer siempre
+        """
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.lang = lang
+        self.dpi = dpi
+        self.min_chars = min_chars
+        self.cache = cache
+        self.logger = configurar_logging("ocr")
+        # pytesseract lanza un proceso de tesseract por página: los hilos
+        # solo esperan, así que alcanza con un pool de hilos
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._rasterizar = self._pdf2image_disponible()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "PageOCR":
+        """
+        Crea el OCR a partir de la sección ``ocr`` de la configuración.
+
+        Args:
+            config: Configuración del sistema
+
+        Returns:
+            Instancia de PageOCR
+        """
+        ocr = config.get('ocr') or {}
+        directorio = ocr.get('cache_dir')
+        return cls(
+            workers=int(ocr.get('workers', 0)) or None,
+            lang=str(ocr.get('lang', 'eng')),
+            dpi=int(ocr.get('dpi', 200)),
+            min_chars=int(ocr.get('min_chars', 20)),
+            cache=OCRCache(directorio) if directorio else None
+        )
+
+    @staticmethod
+    def _pdf2image_disponible() -> bool:
+        """Indica si se pueden rasterizar páginas con pdf2image."""
+        return importlib.util.find_spec('pdf2image') is not None
+
+    def necesita_ocr(self, texto: str) -> bool:
+        """
+        Indica si el texto extraído de una página es demasiado corto para ser su capa de texto.
+
+        Args:
+            texto: Texto extraído por PyPDF2
+
+        Returns:
+            True si la página debe pasar por OCR
+        """
+        return len((texto or '').strip()) < self.min_chars
+
+    def firma(self) -> str:
+        """
+        Describe los parámetros que cambian el resultado del OCR.
+
+        Returns:
+            Versión, idiomas y resolución (o 'img' si se leen las imágenes incrustadas)
+        """
+        return f"{VERSION_OCR}|{self.lang}|{self.dpi if self._rasterizar else 'img'}"
+
+    def _clave(self, *partes: bytes) -> str:
+        """Hash de una página junto con los parámetros que cambian el resultado del OCR."""
+        digest = hashlib.sha256()
+        digest.update(self.firma().encode())
+        for parte in partes:
+            digest.update(hashlib.sha256(parte).digest())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _flujos_imagen(page) -> List[bytes]:
+        """
+        Lee los flujos sin decodificar de las imágenes que usa una página.
+
+        Recorre los XObject de sus recursos, incluidas las imágenes dentro de
+        formularios (Form XObject). No decodifica nada, así que también
+        identifica imágenes que ``page.images`` no sabe abrir (JBIG2, o sin Pillow).
+
+        Args:
+            page: Página de PyPDF2
+
+        Returns:
+            Flujos de las imágenes, en el orden en que aparecen en los recursos
+        """
+        flujos: List[bytes] = []
+        vistos = set()
+        pendientes = [page.get('/Resources')]
+        while pendientes:
+            recursos = pendientes.pop()
+            try:
+                xobjects = recursos.get_object().get('/XObject') if recursos is not None else None
+                if xobjects is None:
+                    continue
+                for nombre, ref in sorted(xobjects.get_object().items()):
+                    if hasattr(ref, 'idnum'):
+                        if (ref.idnum, ref.generation) in vistos:
+                            continue
+                        vistos.add((ref.idnum, ref.generation))
+                    xobject = ref.get_object()
+                    if xobject.get('/Subtype') == '/Image':
+                        flujos.append(xobject._data)
+                    elif xobject.get('/Subtype') == '/Form':
+                        pendientes.append(xobject.get('/Resources'))
+            except Exception:
+                continue
+        return flujos
+
+    def _pool(self) -> ThreadPoolExecutor:
+        """Devuelve el pool de OCR, creándolo con el primer documento escaneado."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ocr')
+        return self._executor
+
+    def _reconocer(self, clave: Optional[str], cargar: Callable[[], List[Any]]) -> str:
+        """
+        Reconoce el texto de las imágenes de una página y lo guarda en la caché.
+
+        Args:
+            clave: Hash de la página; None para no guardar el resultado
+            cargar: Función que devuelve las imágenes PIL de la página
+
+        Returns:
+            Texto reconocido
+        """
+        import pytesseract
+
+        inicio = time.perf_counter()
+        textos = [pytesseract.image_to_string(imagen, lang=self.lang) for imagen in cargar()]
+        texto = "\n".join(t.strip() for t in textos if t.strip())
+        OCR_SECONDS.observe(time.perf_counter() - inicio)
+        if self.cache is not None and clave is not None:
+            self.cache.put(clave, texto)
+        return texto
+
+    def ocr_image(self, data: bytes) -> str:
+        """
+        Reconoce el texto de una imagen, usando la caché.
+
+        Args:
+            data: Contenido de la imagen
+
+        Returns:
+            Texto reconocido
+        """
+        from PIL import Image
+
+        clave = self._clave(b'image', data)
+        if self.cache is not None:
+            texto = self.cache.get(clave)
+            if texto is not None:
+                OCR_PAGES.labels(result='cached').inc()
+                return texto
+        texto = self._reconocer(clave, lambda: [Image.open(io.BytesIO(data))])
+        OCR_PAGES.labels(result='ocr').inc()
+        return texto
+
+    def ocr_pages(self, reader, content: Any, textos: Dict[int, str]) -> Dict[int, str]:
+        """
+        Reconoce en paralelo las páginas de un PDF que no tienen capa de texto.
+
+        El PDF no se lee en memoria: para rasterizar se usa el archivo en
+        disco o, si ``content`` no es uno, una copia temporal que se escribe
+        una sola vez.
+
+        Args:
+            reader: ``PyPDF2.PdfReader`` del documento
+            content: Archivo binario del PDF (para rasterizar las páginas)
+            textos: Texto extraído por PyPDF2, por índice de página (todas las
+                páginas o un tramo del documento)
+
+        Returns:
+            Texto reconocido de cada página procesada, por índice de página
+        """
+        ruta_pdf: Optional[str] = None
+        temporal = False
+        resultados: Dict[int, str] = {}
+        pendientes: Dict[Future, int] = {}
+        ventana = self.workers * 2
+
+        def recoger():
+            hechos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                numero = pendientes.pop(futuro)
+                try:
+                    resultados[numero] = futuro.result()
+                    OCR_PAGES.labels(result='ocr').inc()
+                except Exception as e:
+                    OCR_PAGES.labels(result='failed').inc()
+                    self.logger.warning(f"No se pudo aplicar OCR a la página {numero + 1}: {e}")
+
+        try:
+            for numero, texto in textos.items():
+                if not self.necesita_ocr(texto):
+                    continue
+                page = reader.pages[numero]
+                # Las imágenes se leen en este hilo: PdfReader no admite lecturas concurrentes
+                try:
+                    imagenes = [imagen.data for imagen in page.images]
+                except Exception:
+                    imagenes = []
+                if not imagenes and not self._rasterizar:
+                    continue
+                # La clave usa los flujos crudos de las imágenes: las decodificadas
+                # pueden faltar y dos páginas con el mismo contenido se confundirían
+                flujos = self._flujos_imagen(page)
+                clave: Optional[str] = None
+                if flujos:
+                    contenido = page.get_contents()
+                    clave = self._clave(contenido.get_data() if contenido is not None else b'', *flujos)
+                if self.cache is not None and clave is not None:
+                    guardado = self.cache.get(clave)
+                    if guardado is not None:
+                        resultados[numero] = guardado
+                        OCR_PAGES.labels(result='cached').inc()
+                        continue
+
+                if self._rasterizar:
+                    if ruta_pdf is None:
+                        ruta_pdf, temporal = self._ruta_pdf(content)
+                    cargar = self._rasterizador(ruta_pdf, numero)
+                else:
+                    cargar = self._incrustadas(imagenes)
+                pendientes[self._pool().submit(self._reconocer, clave, cargar)] = numero
+                while len(pendientes) >= ventana:
+                    recoger()
+            while pendientes:
+                recoger()
+        finally:
+            # La copia temporal se borra cuando ninguna página la está leyendo
+            if pendientes:
+                wait(pendientes)
+            if temporal:
+                os.remove(ruta_pdf)
+        return resultados
+
+    @staticmethod
+    def _ruta_pdf(content: Any) -> Tuple[str, bool]:
+        """
+        Devuelve una ruta en disco con el PDF para rasterizarlo.
+
+        Args:
+            content: Archivo binario del PDF
+
+        Returns:
+            Ruta del PDF e indicación de si es una copia temporal que hay que borrar
+        """
+        nombre = getattr(content, 'name', None)
+        modo = getattr(content, 'mode', '')
+        if isinstance(nombre, str) and os.path.isfile(nombre) and modo == 'rb':
+            return nombre, False
+        content.seek(0)
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+            shutil.copyfileobj(content, tmp)
+        return tmp.name, True
+
+    def _rasterizador(self, ruta_pdf: str, numero: int) -> Callable[[], List[Any]]:
+        """Devuelve una función que rasteriza una página con pdf2image."""
+        def cargar():
+            from pdf2image import convert_from_path
+            return convert_from_path(ruta_pdf, dpi=self.dpi, first_page=numero + 1, last_page=numero + 1)
+        return cargar
+
+    @staticmethod
+    def _incrustadas(imagenes: List[bytes]) -> Callable[[], List[Any]]:
+        """Devuelve una función que abre las imágenes incrustadas de una página."""
+        def cargar():
+            from PIL import Image
+            return [Image.open(io.BytesIO(data)) for data in imagenes]
+        return cargar
+
+    def close(self):
+        """Detiene el pool de OCR."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
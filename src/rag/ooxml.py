@@ -0,0 +1,220 @@
+"""
+Extracción rápida de texto de documentos Word y PowerPoint (OOXML).
+
+python-docx y python-pptx construyen el modelo de objetos completo del
+documento solo para leer su texto: en presentaciones grandes es lento y
+ocupa mucha memoria. Aquí se lee el zip directamente y cada parte XML se
+recorre con ``iterparse``, liberando los elementos ya procesados, y el
+texto se entrega por párrafo (Word) o por diapositiva (PowerPoint).
+
+Además del texto de los párrafos se extraen las tablas (una línea por
+fila, con las celdas separadas por `` | ``), las formas agrupadas y las
+notas del orador, que python-docx y python-pptx no devolvían.
+"""
+import posixpath
+import zipfile
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+from xml.etree import ElementTree
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+P = '{http://schemas.openxmlformats.org/presentationml/2006/main}'
+R = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+
+TIPO_NOTAS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide'
+
+# Separador de las celdas de una fila de tabla
+SEPARADOR_CELDAS = ' | '
+
+
+def _parrafos(parte: BinaryIO, ns: str, raiz: str) -> Iterator[str]:
+    """
+    Recorre una parte XML y entrega el texto de cada párrafo y de cada fila de tabla.
+
+    Sirve para Word (``w:``) y para las formas y tablas de PowerPoint
+    (``a:``), que usan los mismos nombres locales: ``p``, ``t``, ``tab``,
+    ``br``, ``tbl``, ``tr`` y ``tc``. Los párrafos de un cuadro de texto
+    dentro de otro párrafo se entregan por separado; el contenido
+    alternativo (``mc:Fallback``) se ignora para no duplicarlo.
+
+    Args:
+        parte: Parte XML abierta desde el zip
+        ns: Espacio de nombres de los párrafos
+        raiz: Etiqueta cuyos hijos se liberan al terminar de procesarlos
+
+    Yields:
+        Texto no vacío de cada párrafo o fila, en orden de aparición
+    """
+    p, t, tab, br, cr = ns + 'p', ns + 't', ns + 'tab', ns + 'br', ns + 'cr'
+    tr, tc = ns + 'tr', ns + 'tc'
+    parrafos: List[List[str]] = []   # párrafos abiertos (anidados en cuadros de texto)
+    celdas: List[List[str]] = []     # párrafos de cada celda abierta
+    filas: List[List[str]] = []      # celdas de cada fila abierta
+    fallback = 0
+    contenedor = None
+
+    for evento, elem in ElementTree.iterparse(parte, events=('start', 'end')):
+        tag = elem.tag
+        if evento == 'start':
+            if tag == p:
+                parrafos.append([])
+            elif tag == tc:
+                celdas.append([])
+            elif tag == tr:
+                filas.append([])
+            elif tag == MC_FALLBACK:
+                fallback += 1
+            elif tag == raiz:
+                contenedor = elem
+            continue
+
+        if tag == MC_FALLBACK:
+            fallback -= 1
+        elif parrafos and not fallback:
+            if tag == t:
+                parrafos[-1].append(elem.text or '')
+            elif tag == tab:
+                parrafos[-1].append('\t')
+            elif tag in (br, cr):
+                parrafos[-1].append('\n')
+
+        if tag == p:
+            texto = ''.join(parrafos.pop()).strip()
+            if texto and not fallback:
+                if celdas:
+                    celdas[-1].append(texto)
+                else:
+                    yield texto
+        elif tag == tc:
+            filas[-1].append('\n'.join(celdas.pop()))
+        elif tag == tr:
+            fila = SEPARADOR_CELDAS.join(c for c in filas.pop() if c)
+            if fila:
+                if celdas:
+                    # Tabla anidada: la fila forma parte de la celda exterior
+                    celdas[-1].append(fila)
+                else:
+                    yield fila
+        else:
+            continue
+
+        # Liberar lo ya procesado para que la memoria no crezca con el documento
+        elem.clear()
+        if contenedor is not None and not parrafos and not celdas and not filas:
+            contenedor.clear()
+
+
+def iter_docx(content: BinaryIO) -> Iterator[str]:
+    """
+    Entrega el texto de un documento Word párrafo por párrafo.
+
+    Incluye el texto de las tablas (una línea por fila) en el orden del documento.
+
+    Args:
+        content: Archivo binario del .docx
+
+    Yields:
+        Texto de cada párrafo o fila de tabla
+
+    Raises:
+        zipfile.BadZipFile: Si el contenido no es un zip
+        KeyError: Si falta ``word/document.xml``
+        ElementTree.ParseError: Si el XML es inválido
+    """
+    with zipfile.ZipFile(content) as zf, zf.open('word/document.xml') as parte:
+        yield from _parrafos(parte, W, W + 'body')
+
+
+def _relaciones(zf: zipfile.ZipFile, parte: str) -> Dict[str, Tuple[str, str]]:
+    """
+    Lee las relaciones de una parte del paquete.
+
+    Args:
+        zf: Paquete OOXML abierto
+        parte: Ruta de la parte (por ejemplo ``ppt/slides/slide1.xml``)
+
+    Returns:
+        Diccionario r:id -> (tipo, ruta de destino dentro del zip)
+    """
+    carpeta, nombre = posixpath.split(parte)
+    ruta = posixpath.join(carpeta, '_rels', nombre + '.rels')
+    try:
+        raiz = ElementTree.fromstring(zf.read(ruta))
+    except KeyError:
+        return {}
+    relaciones = {}
+    for rel in raiz.iter(REL + 'Relationship'):
+        if rel.get('TargetMode') == 'External':
+            continue
+        destino = posixpath.normpath(posixpath.join(carpeta, rel.get('Target', '')))
+        relaciones[rel.get('Id')] = (rel.get('Type', ''), destino)
+    return relaciones
+
+
+def _notas(zf: zipfile.ZipFile, ruta: str) -> List[str]:
+    """
+    Lee las notas del orador de una diapositiva.
+
+    Solo se toma el marcador de posición del cuerpo: la miniatura de la
+    diapositiva y el número de página de la página de notas no son notas.
+
+    Args:
+        zf: Paquete OOXML abierto
+        ruta: Ruta de la página de notas dentro del zip
+
+    Returns:
+        Párrafos de las notas
+    """
+    raiz = ElementTree.fromstring(zf.read(ruta))
+    parrafos = []
+    for forma in raiz.iter(P + 'sp'):
+        marcador = forma.find(f'{P}nvSpPr/{P}nvPr/{P}ph')
+        if marcador is None or marcador.get('type') != 'body':
+            continue
+        for parrafo in forma.iter(A + 'p'):
+            texto = ''.join(t.text or '' for t in parrafo.iter(A + 't')).strip()
+            if texto:
+                parrafos.append(texto)
+    return parrafos
+
+
+def iter_pptx(content: BinaryIO, notas: bool = True) -> Iterator[Tuple[int, str]]:
+    """
+    Entrega el texto de una presentación diapositiva por diapositiva.
+
+    Incluye las formas agrupadas, las tablas (una línea por fila) y, si se
+    pide, las notas del orador. Las diapositivas se recorren en el orden de
+    la presentación, no en el de los archivos del zip.
+
+    Args:
+        content: Archivo binario del .pptx
+        notas: Agregar las notas del orador al final de cada diapositiva
+
+    Yields:
+        Tuplas (número de diapositiva desde 1, texto de la diapositiva)
+
+    Raises:
+        zipfile.BadZipFile: Si el contenido no es un zip
+        KeyError: Si falta ``ppt/presentation.xml``
+        ElementTree.ParseError: Si el XML es inválido
+    """
+    with zipfile.ZipFile(content) as zf:
+        presentacion = 'ppt/presentation.xml'
+        relaciones = _relaciones(zf, presentacion)
+        raiz = ElementTree.fromstring(zf.read(presentacion))
+        diapositivas = [relaciones[s.get(R + 'id')][1] for s in raiz.iter(P + 'sldId')
+                        if s.get(R + 'id') in relaciones]
+
+        for numero, ruta in enumerate(diapositivas, 1):
+            with zf.open(ruta) as parte:
+                lineas = list(_parrafos(parte, A, P + 'spTree'))
+            if notas:
+                for tipo, destino in _relaciones(zf, ruta).values():
+                    if tipo == TIPO_NOTAS and destino in zf.NameToInfo:
+                        texto_notas = _notas(zf, destino)
+                        if texto_notas:
+                            lineas.append("Notas:")
+                            lineas.extend(texto_notas)
+            yield numero, "\n".join(lineas)
@@ -0,0 +1,162 @@
+"""
+Recolección de puntos huérfanos en Qdrant.
+
+Cuando un docente borra o reemplaza un archivo en Moodle, sus fragmentos
+siguen apareciendo en las búsquedas y la colección crece sin límite. La
+reconciliación compara los archivos que hoy tiene cada curso en Moodle con
+el ``file_url`` y el ``timemodified`` guardados en el payload y borra con
+filtros los puntos de los archivos que ya no existen (por curso y lote de
+URLs) y los de versiones anteriores de un archivo reemplazado en la misma
+URL (por URL y fecha de modificación).
+"""
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from core import metrics
+from core.errors import ErrorMoodle
+from core.utils import configurar_logging
+
+GC_ORPHAN_POINTS = metrics.gauge(
+    'rag_gc_orphan_points', 'Puntos huérfanos encontrados en la última reconciliación')
+GC_RECLAIMED_BYTES = metrics.gauge(
+    'rag_gc_reclaimed_bytes', 'Bytes estimados liberados en la última reconciliación')
+
+# URLs por borrado filtrado
+LOTE_URLS = 256
+
+logger = configurar_logging("reconcile")
+
+
+def archivos_vigentes(moodle_client, curso: Dict[str, Any]) -> Dict[str, Optional[int]]:
+    """
+    Obtiene los archivos que hoy tiene un curso en Moodle.
+
+    Args:
+        moodle_client: Cliente de Moodle
+        curso: Curso de Moodle
+
+    Returns:
+        Diccionario URL del archivo -> fecha de modificación (None si Moodle no la informa)
+    """
+    urls: Dict[str, Optional[int]] = {}
+    for seccion in moodle_client.get_course_contents(curso['id']):
+        for modulo in seccion.get('modules', []):
+            for contenido in modulo.get('contents', []):
+                if 'fileurl' in contenido:
+                    urls[contenido['fileurl']] = contenido.get('timemodified')
+    return urls
+
+
+def reconciliar(vector_store, moodle_client, cursos: List[Dict[str, Any]],
+                dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Borra los puntos de archivos que ya no existen en Moodle o que fueron reemplazados.
+
+    Un archivo reemplazado conserva su URL: sus puntos viejos se reconocen
+    porque su ``timemodified`` no coincide con el que informa Moodle. Un
+    curso cuyo contenido no se pudo leer se omite: un error de Moodle
+    nunca se interpreta como "el curso no tiene archivos".
+
+    Args:
+        vector_store: Almacén de vectores
+        moodle_client: Cliente de Moodle
+        cursos: Cursos a reconciliar
+        dry_run: Solo informar, sin borrar
+
+    Returns:
+        Informe con 'courses', 'skipped_courses', 'points_before', 'points_after',
+        'orphan_files', 'stale_files', 'orphan_points', 'deleted_points',
+        'legacy_points', 'bytes_per_point' y 'reclaimed_bytes'
+    """
+    vigentes: Dict[int, Dict[str, Optional[int]]] = {}
+    omitidos = []
+    for curso in cursos:
+        try:
+            vigentes[curso['id']] = archivos_vigentes(moodle_client, curso)
+        except ErrorMoodle as e:
+            logger.error(f"[{curso.get('shortname')}] Se omite: no se pudo leer el contenido ({e})")
+            omitidos.append(curso.get('shortname'))
+
+    antes = vector_store.count_points()
+    bytes_por_punto = vector_store.estimate_point_bytes()
+
+    # Puntos por archivo huérfano y por versión reemplazada, recorriendo solo los cursos reconciliados
+    huerfanos: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    obsoletos: Dict[int, Dict[Tuple[str, int], int]] = defaultdict(lambda: defaultdict(int))
+    if vigentes:
+        campos = ['course_id', 'file_url', 'timemodified']
+        for payload in vector_store.iter_payloads(campos, course_id=list(vigentes)):
+            url = payload.get('file_url')
+            if not url:
+                continue
+            archivos = vigentes[payload['course_id']]
+            if url not in archivos:
+                huerfanos[payload['course_id']][url] += 1
+                continue
+            guardado, actual = payload.get('timemodified'), archivos[url]
+            if guardado is not None and actual is not None and guardado != actual:
+                obsoletos[payload['course_id']][(url, guardado)] += 1
+    puntos_huerfanos = (sum(sum(urls.values()) for urls in huerfanos.values())
+                        + sum(sum(versiones.values()) for versiones in obsoletos.values()))
+
+    borrados = 0
+    if not dry_run:
+        for course_id, urls in huerfanos.items():
+            lista = sorted(urls)
+            for i in range(0, len(lista), LOTE_URLS):
+                borrados += vector_store.delete_points(course_id=course_id, file_url=lista[i:i + LOTE_URLS])
+        for course_id, versiones in obsoletos.items():
+            for url, timemodified in sorted(versiones):
+                borrados += vector_store.delete_points(course_id=course_id, file_url=url,
+                                                       timemodified=timemodified)
+
+    informe = {
+        'courses': len(vigentes),
+        'skipped_courses': omitidos,
+        'points_before': antes,
+        'points_after': antes - borrados,
+        'orphan_files': sum(len(urls) for urls in huerfanos.values()),
+        'stale_files': len({(course_id, url) for course_id, versiones in obsoletos.items()
+                            for url, _ in versiones}),
+        'orphan_points': puntos_huerfanos,
+        'deleted_points': borrados,
+        # Puntos sin file_url (indexados antes de guardarlo): no se pueden reconciliar
+        'legacy_points': vector_store.count_points_without('file_url'),
+        'bytes_per_point': bytes_por_punto,
+        'reclaimed_bytes': borrados * bytes_por_punto,
+    }
+    GC_ORPHAN_POINTS.set(puntos_huerfanos)
+    GC_RECLAIMED_BYTES.set(informe['reclaimed_bytes'])
+    return informe
+
+
+def formatear_informe(informe: Dict[str, Any], dry_run: bool = False) -> List[str]:
+    """
+    Formatea el informe de la reconciliación para la consola.
+
+    Args:
+        informe: Resultado de ``reconciliar``
+        dry_run: Si fue una simulación
+
+    Returns:
+        Líneas de texto
+    """
+    mb = informe['reclaimed_bytes'] / 1024 / 1024
+    lineas = [
+        f"Cursos reconciliados: {informe['courses']}",
+        f"Archivos huérfanos: {informe['orphan_files']}, reemplazados en Moodle: {informe['stale_files']} "
+        f"({informe['orphan_points']} puntos)",
+    ]
+    if informe['skipped_courses']:
+        lineas.append(f"Cursos omitidos por error: {', '.join(map(str, informe['skipped_courses']))}")
+    if dry_run:
+        estimado = informe['orphan_points'] * informe['bytes_per_point'] / 1024 / 1024
+        lineas.append(f"Simulación: se borrarían {informe['orphan_points']} puntos (~{estimado:.1f} MB)")
+    else:
+        lineas.append(f"Puntos: {informe['points_before']} -> {informe['points_after']} "
+                      f"({informe['deleted_points']} borrados, ~{mb:.1f} MB liberados "
+                      f"a ~{informe['bytes_per_point']} bytes por punto)")
+    if informe['legacy_points']:
+        lineas.append(f"Puntos sin file_url (indexados por versiones anteriores): {informe['legacy_points']}; "
+                      "no se pueden reconciliar; para quitarlos hay que reindexar en una colección nueva")
+    return lineas
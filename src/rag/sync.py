@@ -0,0 +1,344 @@
+"""
+Sincronización continua de los cursos de Moodle con el índice vectorial.
+
+En lugar de reindexar todo con ``--index``, el demonio consulta
+periódicamente los cambios desde la última marca de agua de cada curso
+(``core_course_get_updates_since``) y reindexa solo los módulos afectados.
+Si un curso no tiene cambios, la consulta cuesta una sola petición a Moodle.
+
+Moodle no informa los módulos eliminados, así que cada
+``full_check_every`` consultas se compara el contenido completo de cada
+curso con el estado guardado (archivos y ``timemodified`` por módulo):
+los módulos nuevos o modificados se reindexan y los puntos de los
+eliminados se borran de Qdrant. Esa comparación también se usa siempre si
+``use_updates_since`` está deshabilitado (por ejemplo, si el token no tiene
+permiso para esa función).
+
+El estado (marca de agua y archivos por módulo) se guarda en un archivo
+JSON, de modo que el demonio retoma donde quedó tras un reinicio.
+"""
+import gc
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from core import metrics
+from core.errors import ErrorMoodle, ErrorVectorDB
+from core.utils import configurar_logging
+from rag.indexer import seleccionar_cursos
+
+SYNC_POLLS = metrics.counter(
+    'rag_sync_polls_total', 'Consultas de cambios del demonio de sincronización', ['outcome'])
+SYNC_MODULES = metrics.counter(
+    'rag_sync_modules_total', 'Módulos procesados por la sincronización', ['action'])
+SYNC_POLL_SECONDS = metrics.gauge(
+    'rag_sync_last_poll_seconds', 'Duración de la última consulta de cambios')
+SYNC_LAST_POLL = metrics.gauge(
+    'rag_sync_last_poll_timestamp_seconds', 'Momento en que terminó la última consulta de cambios')
+
+
+def _leer_estado(ruta: str) -> Dict[str, Any]:
+    """
+    Lee el estado de la sincronización.
+
+    Args:
+        ruta: Archivo JSON del estado
+
+    Returns:
+        Estado con 'courses': {id del curso: {'watermark', 'modules'}}
+    """
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'courses': {}}
+
+
+def _guardar_estado(ruta: str, estado: Dict[str, Any]):
+    """
+    Guarda el estado de forma atómica (un corte no deja el archivo a medias).
+
+    Args:
+        ruta: Archivo JSON del estado
+        estado: Estado a guardar
+    """
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(directorio, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=directorio, delete=False, suffix='.tmp',
+                                     encoding='utf-8') as tmp:
+        json.dump(estado, tmp)
+    os.replace(tmp.name, ruta)
+
+
+def _firmas(archivos: List[Dict[str, Any]]) -> Dict[str, Dict[str, List[int]]]:
+    """
+    Resume los archivos de un curso por módulo.
+
+    Args:
+        archivos: Entradas de ``CourseIndexer.course_files``
+
+    Returns:
+        Diccionario id del módulo -> {URL del archivo: [timemodified, filesize]}
+    """
+    modulos: Dict[str, Dict[str, List[int]]] = {}
+    for archivo in archivos:
+        modulos.setdefault(str(archivo.get('module_id')), {})[archivo['fileurl']] = [
+            archivo.get('timemodified') or 0, archivo.get('filesize') or 0
+        ]
+    return modulos
+
+
+def _ids_modulos(modulos: Set[str]) -> List[int]:
+    """
+    Convierte las claves de módulo del estado en los ``module_id`` del payload.
+
+    Args:
+        modulos: Ids de módulo como texto
+
+    Returns:
+        Ids numéricos, ordenados (se omiten las claves que no son números)
+    """
+    return sorted(int(m) for m in modulos if m.lstrip('-').isdigit())
+
+
+class SyncDaemon:
+    """
+    Demonio que mantiene el índice al día con los cambios de Moodle
+    """
+    def __init__(
+        self,
+        indexer,
+        state_path: str,
+        shortnames: Optional[List[str]] = None,
+        category: Optional[int] = None,
+        all_visible: bool = False,
+        interval_seconds: float = 300.0,
+        full_check_every: int = 12,
+        use_updates_since: bool = True,
+        clock_skew_seconds: int = 60
+    ):
+        """
+        Inicializa el demonio.
+
+        Args:
+            indexer: CourseIndexer usado para reindexar los módulos
+            state_path: Archivo JSON donde persistir el estado
+            shortnames: Nombres cortos de los cursos a sincronizar
+            category: ID de una categoría cuyos cursos visibles se sincronizan
+            all_visible: Sincronizar todos los cursos visibles
+            interval_seconds: Espera entre consultas
+            full_check_every: Cada cuántas consultas comparar el contenido completo
+            use_updates_since: Usar ``core_course_get_updates_since`` entre comparaciones
+            clock_skew_seconds: Margen restado a la marca de agua por diferencias de reloj
+        """
+        self.indexer = indexer
+        self.moodle_client = indexer.moodle_client
+        self.vector_store = indexer.vector_store
+        self.state_path = state_path
+        self.seleccion = {'shortnames': shortnames, 'category': category, 'all_visible': all_visible}
+        self.interval_seconds = interval_seconds
+        self.full_check_every = max(1, full_check_every)
+        self.use_updates_since = use_updates_since
+        self.clock_skew_seconds = clock_skew_seconds
+        self.logger = configurar_logging("sync")
+        self.estado = _leer_estado(state_path)
+        self._consultas = 0
+        self._cursos: Optional[List[Dict[str, Any]]] = None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], indexer, shortnames: Optional[List[str]] = None,
+                    category: Optional[int] = None, all_visible: bool = False) -> "SyncDaemon":
+        """
+        Crea el demonio a partir de la sección ``sync`` de la configuración.
+
+        Args:
+            config: Configuración del sistema
+            indexer: CourseIndexer usado para reindexar los módulos
+            shortnames: Nombres cortos de los cursos a sincronizar
+            category: ID de una categoría cuyos cursos visibles se sincronizan
+            all_visible: Sincronizar todos los cursos visibles
+
+        Returns:
+            Instancia de SyncDaemon
+        """
+        sync = config.get('sync') or {}
+        return cls(
+            indexer,
+            state_path=sync.get('state_file', './cache/sync_state.json'),
+            shortnames=shortnames,
+            category=category,
+            all_visible=all_visible,
+            interval_seconds=float(sync.get('interval_seconds', 300)),
+            full_check_every=int(sync.get('full_check_every', 12)),
+            use_updates_since=bool(sync.get('use_updates_since', True)),
+            clock_skew_seconds=int(sync.get('clock_skew_seconds', 60))
+        )
+
+    def run(self, stop: threading.Event):
+        """
+        Consulta cambios hasta que se active ``stop``.
+
+        Entre consultas el hilo queda bloqueado en ``stop.wait``, sin uso de CPU.
+
+        Args:
+            stop: Evento que detiene el demonio (por ejemplo, desde SIGTERM)
+        """
+        self.logger.info(f"Sincronización iniciada: cada {self.interval_seconds:.0f}s, "
+                         f"comparación completa cada {self.full_check_every} consultas")
+        while not stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                SYNC_POLLS.labels(outcome='error').inc()
+                self.logger.error(f"Error en la sincronización: {e}")
+            # Liberar lo reservado durante la consulta antes de quedar en espera
+            gc.collect()
+            stop.wait(self.interval_seconds)
+        self.logger.info("Sincronización detenida")
+
+    def poll_once(self) -> Dict[str, int]:
+        """
+        Consulta los cambios de todos los cursos y actualiza el índice.
+
+        Returns:
+            Resumen con 'courses', 'reindexed', 'removed', 'deleted_points' y 'errors'
+        """
+        inicio = time.perf_counter()
+        completa = self._consultas % self.full_check_every == 0 or not self.use_updates_since
+        self._consultas += 1
+        if completa or self._cursos is None:
+            self._cursos = seleccionar_cursos(self.moodle_client, **self.seleccion)
+
+        resumen = {'courses': len(self._cursos), 'reindexed': 0, 'removed': 0,
+                   'deleted_points': 0, 'errors': 0}
+        for curso in self._cursos:
+            try:
+                self._sync_course(curso, completa, resumen)
+            except (ErrorMoodle, ErrorVectorDB) as e:
+                resumen['errors'] += 1
+                self.logger.error(f"[{curso.get('shortname')}] No se pudo sincronizar: {e}")
+        if completa:
+            self._remove_unselected_courses(resumen)
+        _guardar_estado(self.state_path, self.estado)
+
+        duracion = time.perf_counter() - inicio
+        SYNC_POLLS.labels(outcome='full' if completa else 'incremental').inc()
+        SYNC_POLL_SECONDS.set(duracion)
+        SYNC_LAST_POLL.set(time.time())
+        if resumen['reindexed'] or resumen['removed'] or resumen['errors'] or completa:
+            self.logger.info(
+                f"Sincronización {'completa' if completa else 'incremental'} en {duracion:.1f}s: "
+                f"{resumen['reindexed']} módulos reindexados, {resumen['removed']} eliminados, "
+                f"{resumen['deleted_points']} puntos borrados, {resumen['errors']} cursos con error"
+            )
+        return resumen
+
+    def _sync_course(self, curso: Dict[str, Any], completa: bool, resumen: Dict[str, int]):
+        """
+        Sincroniza un curso: reindexa sus módulos modificados y borra los eliminados.
+
+        Args:
+            curso: Curso de Moodle
+            completa: Comparar el contenido completo aunque no haya cambios informados
+            resumen: Resumen de la consulta a actualizar
+        """
+        clave = str(curso['id'])
+        nombre = curso.get('shortname') or clave
+        inicio = int(time.time()) - self.clock_skew_seconds
+        estado = self.estado['courses'].get(clave)
+
+        informados: Set[str] = set()
+        if estado is not None and not completa and self.use_updates_since:
+            try:
+                instancias = self.moodle_client.get_updates_since(curso['id'], estado['watermark'])
+            except ErrorMoodle as e:
+                # Sin permiso para la función: comparar siempre el contenido completo
+                self.logger.warning(f"core_course_get_updates_since no disponible ({e}); "
+                                    "se compara el contenido completo en cada consulta")
+                self.use_updates_since = False
+                instancias = None
+            if instancias is not None:
+                informados = {str(i['id']) for i in instancias if i.get('contextlevel') == 'module'}
+                if not informados:
+                    estado['watermark'] = inicio
+                    return
+
+        secciones = self.moodle_client.get_course_contents(curso['id'])
+        archivos = self.indexer.course_files(curso, secciones)
+        actuales = _firmas(archivos)
+
+        if estado is None:
+            cambiados = set(actuales)
+            eliminados: Set[str] = set()
+            anteriores: Dict[str, Any] = {}
+        else:
+            anteriores = estado['modules']
+            cambiados = {m for m, firma in actuales.items() if firma != anteriores.get(m)}
+            cambiados |= informados & set(actuales)
+            eliminados = set(anteriores) - set(actuales)
+
+        if eliminados:
+            resumen['deleted_points'] += self.vector_store.delete_points(
+                course_id=curso['id'], module_id=_ids_modulos(eliminados)
+            )
+
+        fallidos: Set[str] = set()
+        nuevos: Set[str] = set()
+        if cambiados:
+            self.logger.info(f"[{nombre}] {len(cambiados)} módulos modificados, {len(eliminados)} eliminados")
+            indexado = self.indexer.index_files(
+                nombre, [a for a in archivos if str(a.get('module_id')) in cambiados]
+            )
+            fallidos = {str(m) for m in indexado['failed_modules']}
+            nuevos = indexado['document_ids']
+        elif eliminados:
+            self.logger.info(f"[{nombre}] {len(eliminados)} módulos eliminados")
+
+        # Los puntos anteriores se borran recién con los módulos ya reindexados; los
+        # módulos fallidos conservan su versión anterior hasta el próximo intento
+        if estado is None:
+            # Primera sincronización: se reemplazan los puntos de indexaciones anteriores
+            resumen['deleted_points'] += self.vector_store.delete_points(
+                course_id=curso['id'],
+                excluir={'document_id': sorted(nuevos), 'module_id': _ids_modulos(fallidos)}
+            )
+        elif cambiados - fallidos:
+            resumen['deleted_points'] += self.vector_store.delete_points(
+                course_id=curso['id'], module_id=_ids_modulos(cambiados - fallidos),
+                excluir={'document_id': sorted(nuevos)}
+            )
+
+        SYNC_MODULES.labels(action='reindexed').inc(len(cambiados))
+        SYNC_MODULES.labels(action='removed').inc(len(eliminados))
+        resumen['reindexed'] += len(cambiados)
+        resumen['removed'] += len(eliminados)
+
+        # Los módulos con archivos fallidos conservan su firma anterior (vacía si son
+        # nuevos) y se reintentan; si desaparecen, se borran sus puntos
+        modulos_estado = {m: f for m, f in actuales.items() if m not in fallidos}
+        modulos_estado.update({m: anteriores.get(m, {}) for m in fallidos})
+        self.estado['courses'][clave] = {'watermark': inicio, 'modules': modulos_estado}
+
+    def _remove_unselected_courses(self, resumen: Dict[str, int]):
+        """
+        Borra los puntos de los cursos que ya no se sincronizan (eliminados u ocultos).
+
+        Args:
+            resumen: Resumen de la consulta a actualizar
+        """
+        seleccionados = {str(c['id']) for c in self._cursos or []}
+        if not seleccionados:
+            # Una respuesta vacía de Moodle no debe vaciar la colección
+            self.logger.warning("Moodle no devolvió cursos; no se borran puntos")
+            return
+        for clave in list(self.estado['courses']):
+            if clave in seleccionados:
+                continue
+            borrados = self.vector_store.delete_points(course_id=int(clave))
+            resumen['deleted_points'] += borrados
+            resumen['removed'] += len(self.estado['courses'][clave]['modules'])
+            del self.estado['courses'][clave]
+            self.logger.info(f"Curso {clave} fuera de la sincronización: {borrados} puntos borrados")
@@ -1,12 +1,23 @@
 """
 Wrapper para interactuar con Qdrant y generar embeddings con Ollama o OpenAI.
+
+La indexación consume el texto a medida que se extrae (``index_stream``):
+los fragmentos se arman, se convierten en embeddings y se envían a Qdrant
+en lotes acotados, de modo que la memoria usada no depende del tamaño del
+documento.
 """
+import contextlib
+import json
 import os
+import threading
+import time
 import requests
-from typing import Dict, List, Any, Literal, cast
+from typing import Dict, Iterable, Iterator, List, Any, Literal, Optional, cast
 from uuid import uuid4
-from core.utils import configurar_logging
+from core.utils import configurar_logging, medir_tiempo
 from core.errors import ErrorVectorDB
+from core.fixtures import FixtureArchive
+from core import metrics
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from qdrant_client.models import Distance, VectorParams
@@ -16,6 +27,65 @@ try:
 except ImportError:
     openai = None
 
+# Modelo de embeddings usado con Ollama
+OLLAMA_EMBEDDING_MODEL = "nomic-embed-text"
+
+EMBEDDING_SECONDS = metrics.histogram(
+    'rag_embedding_seconds', 'Duración de la generación de embeddings', ['provider'])
+EMBEDDING_ERRORS = metrics.counter(
+    'rag_embedding_errors_total', 'Errores al generar embeddings', ['provider'])
+QDRANT_SECONDS = metrics.histogram(
+    'rag_qdrant_request_seconds', 'Duración de las operaciones en Qdrant', ['operation'])
+QDRANT_ERRORS = metrics.counter(
+    'rag_qdrant_errors_total', 'Errores en operaciones de Qdrant', ['operation'])
+CHUNKS_INDEXED = metrics.counter(
+    'rag_chunks_indexed_total', 'Fragmentos indexados en Qdrant')
+CHUNKS_DELETED = metrics.counter(
+    'rag_chunks_deleted_total', 'Fragmentos borrados de Qdrant')
+
+# Caracteres por fragmento indexado
+CHUNK_SIZE = 512
+
+# Bytes aproximados de los enlaces HNSW de un punto (m=16: 32 vecinos de 4 bytes en la capa 0)
+BYTES_ENLACES_HNSW = 128
+
+# Campos del payload indexados para borrar y filtrar por curso, módulo o archivo
+PAYLOAD_INDEXES = {
+    'course_id': models.PayloadSchemaType.INTEGER,
+    'module_id': models.PayloadSchemaType.INTEGER,
+    'file_url': models.PayloadSchemaType.KEYWORD,
+    'document_id': models.PayloadSchemaType.KEYWORD,
+}
+
+
+def iter_chunks(textos: Iterable[str], size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Divide en fragmentos de ``size`` caracteres un texto que llega por partes.
+    
+    Los fragmentos son los mismos que al cortar el texto completo cada
+    ``size`` caracteres, pero solo se retiene la parte que todavía no
+    completó un fragmento.
+    
+    Args:
+        textos: Partes del texto en orden (páginas, párrafos, diapositivas)
+        size: Caracteres por fragmento
+        
+    Yields:
+        Fragmentos de ``size`` caracteres (el último puede ser más corto)
+    """
+    pendiente = ''
+    for texto in textos:
+        if not texto:
+            continue
+        pendiente += texto
+        inicio = 0
+        while len(pendiente) - inicio >= size:
+            yield pendiente[inicio:inicio + size]
+            inicio += size
+        pendiente = pendiente[inicio:]
+    if pendiente:
+        yield pendiente
+
 class VectorStore:
     """
     Wrapper para interactuar con Qdrant y generar embeddings con Ollama o OpenAI
@@ -28,7 +98,12 @@ class VectorStore:
         ollama_url: str = "",
         embedding_provider: Literal["ollama", "openai"] = "ollama",
         openai_api_key: str = "",
-        openai_model: str = "text-embedding-3-small"
+        openai_model: str = "text-embedding-3-small",
+        keep_alive: str = "30m",
+        http_pool_size: int = 32,
+        fixtures: Optional[FixtureArchive] = None,
+        upsert_batch_size: int = 64,
+        client: Optional[QdrantClient] = None
     ):
         """
         Inicializa el almacén de vectores.
@@ -41,21 +116,41 @@ class VectorStore:
             embedding_provider: Proveedor de embeddings ('ollama' o 'openai')
             openai_api_key: Clave API de OpenAI (requerida si embedding_provider='openai')
             openai_model: Modelo de embeddings de OpenAI
+            keep_alive: Tiempo que Ollama mantiene cargado el modelo de embeddings
+            http_pool_size: Conexiones HTTP reutilizables hacia Ollama
+            fixtures: Archivo para grabar o reproducir las llamadas de embeddings;
+                None para usar la red
+            upsert_batch_size: Puntos enviados a Qdrant en cada upsert durante la
+                indexación (los únicos que se retienen en memoria)
+            client: Cliente de Qdrant ya creado (por ejemplo ``QdrantClient(':memory:')``);
+                None para conectar con ``host`` y ``port``
             
         Raises:
             ValueError: Si faltan parámetros requeridos según el proveedor
         """
-        self.client = QdrantClient(host=host, port=port)
+        self.client = client if client is not None else QdrantClient(host=host, port=port)
         self.collection_name = collection_name
         self.embedding_provider = embedding_provider
         self.logger = configurar_logging("vector_store")
         self.vector_size = 768  # Tamaño típico para nomic-embed-text
+        self.keep_alive = keep_alive
+        self.upsert_batch_size = max(1, upsert_batch_size)
+        self._cupos_embedding: Any = contextlib.nullcontext()
+        self._cupos_upsert: Any = contextlib.nullcontext()
+        # Sesión con keep-alive: evita abrir una conexión TCP por embedding
+        self._http = requests.Session()
+        if fixtures is not None:
+            adapter = fixtures.requests_adapter(pool_connections=1, pool_maxsize=http_pool_size)
+        else:
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=http_pool_size)
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
         
         if embedding_provider == "ollama":
             if not ollama_url:
                 raise ValueError("Se requiere ollama_url cuando embedding_provider='ollama'")
             self.ollama_url = ollama_url
-            self.ollama_model = "nomic-embed-text"
+            self.ollama_model = OLLAMA_EMBEDDING_MODEL
         elif embedding_provider == "openai":
             if not openai_api_key and not os.environ.get("OPENAI_API_KEY"):
                 raise ValueError("Se requiere openai_api_key cuando embedding_provider='openai'")
@@ -63,11 +158,73 @@ class VectorStore:
             self.openai_model = openai_model
             if openai:
                 openai.api_key = self.openai_api_key
+                if fixtures is not None:
+                    openai.http_client = fixtures.httpx_client()
         else:
             raise ValueError("embedding_provider debe ser 'ollama' o 'openai'")
         
         # Verificar si la colección existe y crearla si no
         self._create_collection_if_not_exists()
+        self._create_payload_indexes()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "VectorStore":
+        """
+        Crea un almacén de vectores a partir de la configuración del sistema.
+        
+        Args:
+            config: Configuración del sistema
+            
+        Returns:
+            Instancia de VectorStore
+            
+        Raises:
+            ValueError: Si el proveedor de embeddings no está soportado
+        """
+        embedding_provider = config['embeddings']['provider']
+        if embedding_provider == 'ollama':
+            return cls(
+                host=config['qdrant']['host'],
+                port=config['qdrant']['port'],
+                collection_name=config['qdrant']['collection_name'],
+                embedding_provider='ollama',
+                ollama_url=config['ollama']['url'],
+                keep_alive=str(config['ollama'].get('keep_alive', '30m')),
+                http_pool_size=int((config.get('web') or {}).get('threads', 32)),
+                fixtures=FixtureArchive.from_config(config),
+                upsert_batch_size=int((config.get('indexing') or {}).get('upsert_batch_size', 64))
+            )
+        elif embedding_provider == 'openai':
+            return cls(
+                host=config['qdrant']['host'],
+                port=config['qdrant']['port'],
+                collection_name=config['qdrant']['collection_name'],
+                embedding_provider='openai',
+                openai_api_key=config['embeddings']['openai_api_key'],
+                openai_model=config['embeddings']['openai_model'],
+                fixtures=FixtureArchive.from_config(config),
+                upsert_batch_size=int((config.get('indexing') or {}).get('upsert_batch_size', 64))
+            )
+        raise ValueError(f"Proveedor de embeddings no soportado: {embedding_provider}")
+
+    def close(self):
+        """Cierra la sesión HTTP de embeddings y el cliente de Qdrant."""
+        self._http.close()
+        self.client.close()
+
+    def set_concurrency_limits(self, embeddings: Optional[int] = None, upserts: Optional[int] = None):
+        """
+        Limita las llamadas simultáneas al proveedor de embeddings y a Qdrant.
+        
+        Lo usa la indexación de varios cursos en paralelo para que todos
+        compartan los mismos cupos.
+        
+        Args:
+            embeddings: Embeddings simultáneos; None para no limitarlos
+            upserts: Upserts simultáneos en Qdrant; None para no limitarlos
+        """
+        self._cupos_embedding = threading.BoundedSemaphore(embeddings) if embeddings else contextlib.nullcontext()
+        self._cupos_upsert = threading.BoundedSemaphore(upserts) if upserts else contextlib.nullcontext()
 
     def _create_collection_if_not_exists(self):
         """
@@ -99,9 +256,179 @@ class VectorStore:
             
             return True
         except Exception as e:
+            QDRANT_ERRORS.labels(operation='collection').inc()
             self.logger.error(f"Error al crear colección en Qdrant: {e}")
             raise ErrorVectorDB(f"Error al crear colección: {str(e)}")
 
+    def _create_payload_indexes(self):
+        """
+        Crea los índices de payload usados por los borrados filtrados.
+        
+        Sin ellos, borrar los puntos de un módulo obliga a Qdrant a recorrer
+        toda la colección. Crear un índice que ya existe no tiene efecto.
+        """
+        for campo, tipo in PAYLOAD_INDEXES.items():
+            try:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=campo,
+                    field_schema=tipo
+                )
+            except Exception as e:
+                QDRANT_ERRORS.labels(operation='payload_index').inc()
+                self.logger.warning(f"No se pudo crear el índice de payload {campo}: {e}")
+
+    def delete_points(self, *, excluir: Optional[Dict[str, Any]] = None, **campos: Any) -> int:
+        """
+        Borra los puntos cuyo payload coincide con todos los campos dados.
+        
+        Un valor lista coincide con cualquiera de sus elementos. Por ejemplo,
+        ``delete_points(course_id=3, module_id=[10, 11])``. ``excluir`` conserva
+        los puntos que coinciden con alguno de sus campos: reemplazar un
+        archivo borra sus puntos viejos recién después de indexar los nuevos
+        con ``delete_points(file_url=url, excluir={'document_id': nuevo})``.
+        
+        Args:
+            excluir: Campos del payload y valores (o listas de valores) de los
+                puntos que no se borran
+            **campos: Campo del payload y valor (o lista de valores) a borrar
+            
+        Returns:
+            Cantidad de puntos borrados
+            
+        Raises:
+            ErrorVectorDB: Si ocurre un error al borrar
+        """
+        if not campos:
+            raise ValueError("delete_points requiere al menos un campo para no borrar toda la colección")
+        if any(isinstance(v, (list, tuple, set)) and not v for v in campos.values()):
+            return 0
+        filtro = self._filtro(campos, excluir)
+        inicio = time.perf_counter()
+        try:
+            with self._cupos_upsert:
+                cantidad = self.client.count(
+                    collection_name=self.collection_name, count_filter=filtro, exact=True
+                ).count
+                if cantidad:
+                    self.client.delete(
+                        collection_name=self.collection_name,
+                        points_selector=models.FilterSelector(filter=filtro),
+                        wait=True
+                    )
+        except Exception as e:
+            QDRANT_ERRORS.labels(operation='delete').inc()
+            self.logger.error(f"Error al borrar puntos en Qdrant: {e}")
+            raise ErrorVectorDB(str(e))
+        QDRANT_SECONDS.labels(operation='delete').observe(time.perf_counter() - inicio)
+        CHUNKS_DELETED.inc(cantidad)
+        return cantidad
+
+    @staticmethod
+    def _filtro(campos: Dict[str, Any], excluir: Optional[Dict[str, Any]] = None) -> Optional[models.Filter]:
+        """
+        Arma un filtro de Qdrant que exige todos los campos dados.
+        
+        Args:
+            campos: Campo del payload y valor (o lista de valores aceptados)
+            excluir: Campo del payload y valor (o lista de valores) que descartan
+                un punto; las listas vacías no descartan nada
+            
+        Returns:
+            Filtro, o None si no hay campos
+        """
+        def condiciones(valores: Dict[str, Any]) -> List[models.FieldCondition]:
+            resultado = []
+            for campo, valor in valores.items():
+                if isinstance(valor, (list, tuple, set)):
+                    match: Any = models.MatchAny(any=list(valor))
+                else:
+                    match = models.MatchValue(value=valor)
+                resultado.append(models.FieldCondition(key=campo, match=match))
+            return resultado
+
+        if not campos:
+            return None
+        excluidos = {c: v for c, v in (excluir or {}).items()
+                     if not (isinstance(v, (list, tuple, set)) and not v)}
+        return models.Filter(must=condiciones(campos), must_not=condiciones(excluidos) or None)
+
+    def count_points(self, **campos: Any) -> int:
+        """
+        Cuenta los puntos cuyo payload coincide con los campos dados.
+        
+        Args:
+            **campos: Campo del payload y valor (o lista de valores); sin campos, toda la colección
+            
+        Returns:
+            Cantidad exacta de puntos
+        """
+        return self.client.count(
+            collection_name=self.collection_name, count_filter=self._filtro(campos), exact=True
+        ).count
+
+    def count_points_without(self, campo: str) -> int:
+        """
+        Cuenta los puntos sin un campo en el payload (por ejemplo, indexados por versiones anteriores).
+        
+        Args:
+            campo: Campo del payload
+            
+        Returns:
+            Cantidad exacta de puntos
+        """
+        filtro = models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key=campo))])
+        return self.client.count(
+            collection_name=self.collection_name, count_filter=filtro, exact=True
+        ).count
+
+    def iter_payloads(self, fields: List[str], batch_size: int = 1024, **campos: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre el payload de los puntos sin traer los vectores.
+        
+        Args:
+            fields: Campos del payload a traer
+            batch_size: Puntos por página del scroll
+            **campos: Filtro opcional (campo y valor o lista de valores)
+            
+        Yields:
+            Payload de cada punto (solo los campos pedidos)
+        """
+        offset = None
+        while True:
+            puntos, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=self._filtro(campos),
+                limit=batch_size,
+                offset=offset,
+                with_payload=models.PayloadSelectorInclude(include=fields),
+                with_vectors=False
+            )
+            for punto in puntos:
+                yield punto.payload or {}
+            if offset is None:
+                return
+
+    def estimate_point_bytes(self, sample: int = 64) -> int:
+        """
+        Estima cuánto ocupa un punto: vector, payload y enlaces del grafo HNSW.
+        
+        Args:
+            sample: Puntos usados para promediar el tamaño del payload
+            
+        Returns:
+            Bytes aproximados por punto
+        """
+        puntos, _ = self.client.scroll(
+            collection_name=self.collection_name, limit=sample,
+            with_payload=True, with_vectors=False
+        )
+        payload = 0
+        if puntos:
+            payload = sum(len(json.dumps(p.payload or {}, ensure_ascii=False).encode('utf-8'))
+                          for p in puntos) // len(puntos)
+        return self.vector_size * 4 + BYTES_ENLACES_HNSW + payload
+
     def _generate_embedding(self, texto: str) -> List[float]:
         """
         Genera un embedding para el texto dado.
@@ -115,28 +442,71 @@ class VectorStore:
         Raises:
             ErrorVectorDB: Si ocurre un error al generar el embedding
         """
+        with self._cupos_embedding:
+            return self._request_embedding(texto)
+
+    def _request_embedding(self, texto: str) -> List[float]:
+        """
+        Pide el embedding al proveedor configurado (sin aplicar los cupos).
+        
+        Args:
+            texto: Texto para generar el embedding
+            
+        Returns:
+            Lista de valores float que representan el embedding
+            
+        Raises:
+            ErrorVectorDB: Si ocurre un error al generar el embedding
+        """
+        inicio = time.perf_counter()
         try:
             if self.embedding_provider == "ollama":
-                response = requests.post(
+                response = self._http.post(
                     f"{self.ollama_url}/api/embeddings",
-                    json={"model": self.ollama_model, "prompt": texto},
+                    json={"model": self.ollama_model, "prompt": texto, "keep_alive": self.keep_alive},
                     timeout=10
                 )
                 response.raise_for_status()
                 data = response.json()
-                return data["embedding"]
+                embedding = data["embedding"]
             elif self.embedding_provider == "openai" and openai:
                 response = openai.embeddings.create(
                     input=texto,
                     model=self.openai_model
                 )
-                return response.data[0].embedding
+                embedding = response.data[0].embedding
             else:
                 self.logger.error("Proveedor de embeddings no soportado o no inicializado")
                 raise ErrorVectorDB("Proveedor de embeddings no soportado")
         except Exception as e:
+            EMBEDDING_ERRORS.labels(provider=self.embedding_provider).inc()
             self.logger.error(f"Error al generar embedding: {e}")
             raise ErrorVectorDB(str(e))
+        EMBEDDING_SECONDS.labels(provider=self.embedding_provider).observe(time.perf_counter() - inicio)
+        return embedding
+
+    def warm_up(self, queries: List[str], limit: int = 5) -> Dict[str, float]:
+        """
+        Precalienta el almacén: carga el modelo de embeddings y ejecuta búsquedas representativas.
+        
+        La primera llamada a Ollama carga el modelo (puede tardar decenas de
+        segundos); las búsquedas abren las conexiones y traen a memoria las
+        páginas del índice de Qdrant que usarán las consultas reales.
+        
+        Args:
+            queries: Consultas representativas
+            limit: Resultados por búsqueda
+            
+        Returns:
+            Diccionario con la duración de cada paso en milisegundos
+        """
+        tiempos: Dict[str, float] = {}
+        with medir_tiempo(tiempos, 'embedding_model_ms'):
+            self._generate_embedding("precalentamiento")
+        with medir_tiempo(tiempos, 'searches_ms'):
+            for query in queries:
+                self.search(query, limit=limit)
+        return tiempos
 
     def index_document(self, texto: str, metadata: Dict[str, Any]) -> bool:
         """
@@ -152,47 +522,123 @@ class VectorStore:
         Raises:
             ErrorVectorDB: Si ocurre un error al indexar el documento
         """
+        self.index_stream([texto], metadata)
+        return True
+
+    def index_stream(self, textos: Iterable[str], metadata: Dict[str, Any],
+                     document_id: Optional[str] = None) -> int:
+        """
+        Indexa un documento a medida que se extrae su texto.
+        
+        Cada fragmento se convierte en embedding apenas se completa y los
+        puntos se envían a Qdrant en lotes de ``upsert_batch_size``: en
+        memoria solo quedan el fragmento en curso y un lote. Como la
+        cantidad de fragmentos se conoce al final, ``total_chunks`` (y los
+        metadatos que el extractor completa al terminar, como
+        ``slide_count``) se agregan a todos los puntos del documento con un
+        ``set_payload`` filtrado por ``document_id``. Si la indexación
+        falla a mitad de camino, se borran los puntos ya enviados.
+        
+        Args:
+            textos: Partes del texto del documento, en orden
+            metadata: Metadatos del documento; se leen otra vez al terminar,
+                así que pueden completarse mientras se consume ``textos``
+            document_id: Identificador del documento en el payload; None para
+                generar uno nuevo
+            
+        Returns:
+            Cantidad de fragmentos indexados (0 si el documento no tenía texto)
+            
+        Raises:
+            ErrorVectorDB: Si ocurre un error al indexar el documento
+        """
+        documento = document_id or uuid4().hex
+        total = 0
         try:
             # Verificar si la colección existe, y crearla si no
             if not self._create_collection_if_not_exists():
                 raise ErrorVectorDB("No se pudo crear o verificar la colección en Qdrant")
-                
-            # Dividir el texto en chunks para evitar límites de tamaño
-            chunks = [texto[i:i+512] for i in range(0, len(texto), 512)]
-            for i, chunk in enumerate(chunks):
+
+            lote: List[models.PointStruct] = []
+            for i, chunk in enumerate(iter_chunks(textos)):
                 embedding = self._generate_embedding(chunk)
-                point_id = str(uuid4())
                 chunk_metadata = dict(metadata)
                 chunk_metadata.update({
+                    "document_id": documento,
                     "chunk": i,
-                    "total_chunks": len(chunks),
-                    "chunk_text": chunk[:200] + "..." if len(chunk) > 200 else chunk
+                    "chunk_text": chunk
                 })
-                self.client.upsert(
-                    collection_name=self.collection_name,
-                    points=[
-                        models.PointStruct(
-                            id=point_id,
-                            vector=embedding,
-                            payload=chunk_metadata
-                        )
-                    ]
-                )
-            return True
+                lote.append(models.PointStruct(id=str(uuid4()), vector=embedding, payload=chunk_metadata))
+                if len(lote) >= self.upsert_batch_size:
+                    self._upsert(lote)
+                    total += len(lote)
+                    lote = []
+            if lote:
+                self._upsert(lote)
+                total += len(lote)
+
+            if total:
+                self._set_payload({**metadata, "total_chunks": total}, document_id=documento)
+            return total
         except Exception as e:
             self.logger.error(f"Error al indexar documento en Qdrant: {e}")
+            if total:
+                try:
+                    self.delete_points(document_id=documento)
+                except ErrorVectorDB:
+                    self.logger.warning(f"No se pudieron borrar los {total} fragmentos del documento incompleto")
             raise ErrorVectorDB(str(e))
 
-    def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+    def _upsert(self, puntos: List[models.PointStruct]):
+        """
+        Envía un lote de puntos a Qdrant respetando el cupo de upserts.
+        
+        Args:
+            puntos: Puntos a insertar
+        """
+        inicio = time.perf_counter()
+        try:
+            with self._cupos_upsert:
+                self.client.upsert(collection_name=self.collection_name, points=puntos)
+        except Exception:
+            QDRANT_ERRORS.labels(operation='upsert').inc()
+            raise
+        QDRANT_SECONDS.labels(operation='upsert').observe(time.perf_counter() - inicio)
+        CHUNKS_INDEXED.inc(len(puntos))
+
+    def _set_payload(self, payload: Dict[str, Any], **campos: Any):
+        """
+        Agrega campos al payload de los puntos que coinciden con el filtro.
+        
+        Args:
+            payload: Campos a agregar (reemplazan a los que ya existan)
+            **campos: Filtro (campo y valor o lista de valores)
+        """
+        inicio = time.perf_counter()
+        try:
+            with self._cupos_upsert:
+                self.client.set_payload(
+                    collection_name=self.collection_name,
+                    payload=payload,
+                    points=models.FilterSelector(filter=self._filtro(campos)),
+                    wait=True
+                )
+        except Exception:
+            QDRANT_ERRORS.labels(operation='set_payload').inc()
+            raise
+        QDRANT_SECONDS.labels(operation='set_payload').observe(time.perf_counter() - inicio)
+
+    def search(self, query: str, limit: int = 5, timings: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
         """
         Busca documentos similares a la consulta.
         
         Args:
             query: Consulta de búsqueda
             limit: Número máximo de resultados
+            timings: Diccionario opcional donde acumular 'embed_ms' y 'search_ms'
             
         Returns:
-            Lista de documentos similares con sus metadatos y puntuación
+            Lista de documentos similares con sus metadatos, puntuación e ID del punto
             
         Raises:
             ErrorVectorDB: Si ocurre un error al buscar
@@ -202,24 +648,32 @@ class VectorStore:
             self.logger.error("No se pudo crear o verificar la colección en Qdrant")
             return []
             
-        query_embedding = self._generate_embedding(query)
+        if timings is None:
+            timings = {}
+        with medir_tiempo(timings, 'embed_ms'):
+            query_embedding = self._generate_embedding(query)
         if not query_embedding:
             self.logger.error("No se pudo generar el embedding para la consulta")
             return []
         try:
-            search_result = self.client.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding,
-                limit=limit
-            )
+            antes = timings.get('search_ms', 0.0)
+            with medir_tiempo(timings, 'search_ms'):
+                search_result = self.client.search(
+                    collection_name=self.collection_name,
+                    query_vector=query_embedding,
+                    limit=limit
+                )
+            QDRANT_SECONDS.labels(operation='search').observe((timings['search_ms'] - antes) / 1000)
             results = []
             for point in search_result:
                 if point.payload:
                     results.append({
                         'score': point.score,
+                        'point_id': str(point.id),
                         **cast(Dict[str, Any], point.payload),
                     })
             return results
         except Exception as e:
+            QDRANT_ERRORS.labels(operation='search').inc()
             self.logger.error(f"Error al buscar en Qdrant: {e}")
             raise ErrorVectorDB(str(e))
\ No newline at end of file
@@ -1,11 +1,15 @@
 """
 Aplicación web Flask para el sistema RAG.
 """
+import hashlib
 import logging
+import math
 import os
 import sys
+import threading
+import time
 from flask import (
-    Flask, render_template, request, jsonify, 
+    Flask, Response, g, render_template, request, jsonify, 
     session, redirect, url_for
 )
 from pathlib import Path
@@ -13,10 +17,128 @@ from core.utils import configurar_logging
 from core.config import load_config
 from rag.vector_store import VectorStore
 from chat.manager import ChatManager
+from chat.admission import AdmissionController
+from chat.warmup import precalentar
+from web.health import HealthChecker
+from core.errors import ErrorSobrecarga
+from core import metrics
 
 # Configurar logging
 logger = configurar_logging("web_app")
 
+HTTP_REQUESTS = metrics.counter(
+    'rag_http_requests_total', 'Peticiones HTTP atendidas', ['endpoint', 'method', 'status'])
+HTTP_SECONDS = metrics.histogram(
+    'rag_http_request_seconds', 'Duración de las peticiones HTTP', ['endpoint'])
+
+# Tamaño de página por defecto y máximo para sesiones y mensajes
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Rutas que responden aunque la aplicación todavía se esté inicializando
+OPEN_ENDPOINTS = {'healthz', 'readyz', 'metrics_endpoint', 'static'}
+
+# Opciones de la línea de comandos que heredan los procesos worker de uvicorn,
+# que crean la aplicación por su cuenta
+ENV_CONFIG_PATH = 'RAG_CONFIG_PATH'
+ENV_FIXTURES_MODE = 'RAG_FIXTURES_MODE'
+
+
+def _page_limit():
+    """
+    Obtiene el tamaño de página pedido en ``?limit=``, acotado a MAX_PAGE_SIZE.
+    
+    Returns:
+        Tamaño de página a utilizar
+    """
+    limit = request.args.get('limit', PAGE_SIZE, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def overload_response(error: ErrorSobrecarga):
+    """
+    Arma el cuerpo y los encabezados de una respuesta 429 por sobrecarga.
+    
+    Args:
+        error: Error de sobrecarga con el tiempo sugerido de reintento
+        
+    Returns:
+        Tupla con (cuerpo JSON, encabezados)
+    """
+    retry_after = max(1, math.ceil(error.retry_after))
+    return {'error': str(error), 'retry_after': retry_after}, {'Retry-After': str(retry_after)}
+
+def messages_etag(session_id, version):
+    """
+    Calcula el ETag de una respuesta de ``/messages``.
+    
+    Combina la versión de la sesión (updated_at) con los parámetros de la
+    consulta, ya que distintas páginas de la misma versión tienen cuerpos distintos.
+    
+    Args:
+        session_id: ID de la sesión de chat
+        version: Fecha de la última modificación de la sesión
+        
+    Returns:
+        Valor del ETag (sin comillas)
+    """
+    clave = f"{session_id}|{version.isoformat()}|{request.query_string.decode('latin-1')}"
+    return hashlib.sha1(clave.encode('utf-8')).hexdigest()[:20]
+
+def _cerrar_servicios(vector_store, chat_manager):
+    """
+    Cierra los servicios creados por un intento de inicialización fallido.
+    
+    Args:
+        vector_store: Almacén de vectores creado, o None
+        chat_manager: Gestor de chat creado, o None
+    """
+    for servicio in (chat_manager, vector_store):
+        if servicio is None:
+            continue
+        try:
+            servicio.close()
+        except Exception as e:
+            logger.warning(f"No se pudo cerrar {type(servicio).__name__}: {e}")
+
+
+def initialize_services(app, config, health):
+    """
+    Inicializa VectorStore y ChatManager, reintentando mientras las dependencias no respondan.
+    
+    Se ejecuta en un hilo aparte para que la aplicación pueda responder a
+    las sondas de salud desde el arranque; el tráfico se admite recién
+    cuando termina, incluido el precalentamiento de modelos y conexiones.
+    
+    Args:
+        app: Aplicación Flask donde registrar el gestor de chat
+        config: Configuración del sistema
+        health: Verificador de salud a marcar como listo
+    """
+    reintento = float((config.get('health') or {}).get('init_retry_seconds', 5))
+    while True:
+        vector_store = chat_manager = None
+        try:
+            vector_store = VectorStore.from_config(config)
+            chat_manager = ChatManager.from_config(config, vector_store)
+            precalentar(chat_manager, config, logger)
+            app.extensions['chat_manager'] = chat_manager
+            health.mark_ready()
+            logger.info("Servicios inicializados, la aplicación acepta tráfico")
+            return
+        except ValueError as e:
+            # Error de configuración: reintentar no lo resuelve
+            _cerrar_servicios(vector_store, chat_manager)
+            logger.error(str(e))
+            health.mark_failed(str(e))
+            return
+        except Exception as e:
+            # Cada intento crea sus propias conexiones: las del fallido se cierran
+            _cerrar_servicios(vector_store, chat_manager)
+            health.mark_failed(str(e))
+            logger.warning(f"No se pudieron inicializar los servicios ({e}), reintentando en {reintento}s")
+            time.sleep(reintento)
+
 def create_templates():
     """
     Crea plantillas básicas para la aplicación web.
@@ -103,6 +225,10 @@ def create_templates():
     <div class="col-md-12">
         <h1 class="mb-4">Chat con Asistente de Documentos Moodle</h1>
 
+        <button class="btn btn-outline-secondary btn-sm mb-2 d-none" id="load-older">
+            Cargar mensajes anteriores
+        </button>
+
         <div id="chat-container" class="chat-container">
             <!-- Los mensajes del chat se cargarán aquí -->
         </div>
@@ -122,10 +248,27 @@ document.addEventListener('DOMContentLoaded', function() {
     const chatContainer = document.getElementById('chat-container');
     const userInput = document.getElementById('user-input');
     const sendButton = document.getElementById('send-button');
+    const loadOlder = document.getElementById('load-older');
+    let olderCursor = null;
+    let latestCursor = null;
+    let pending = 0;
+    let socket = null;
+    let questionId = 0;
+    const questions = {};
 
     // Cargar mensajes existentes
     loadMessages();
 
+    // Canal WebSocket (modo async); si no está disponible se usa POST /chat
+    connectSocket();
+
+    // Buscar mensajes nuevos (por ejemplo, de otra pestaña) mientras la página está visible
+    setInterval(function() {
+        if (!document.hidden && !pending) {
+            syncMessages();
+        }
+    }, 10000);
+
     // Enviar mensaje
     sendButton.addEventListener('click', sendMessage);
     userInput.addEventListener('keypress', function(e) {
@@ -138,9 +281,11 @@ document.addEventListener('DOMContentLoaded', function() {
         const query = userInput.value.trim();
         if (!query) return;
 
-        // Añadir mensaje del usuario a la UI
-        addMessageToUI('user', query);
+        // Añadir mensaje del usuario a la UI hasta que llegue el guardado
+        const userMessage = addMessageToUI('user', query);
+        userMessage.classList.add('pending');
         userInput.value = '';
+        pending++;
 
         // Mostrar indicador de carga
         const loadingDiv = document.createElement('div');
@@ -150,6 +295,79 @@ document.addEventListener('DOMContentLoaded', function() {
         chatContainer.appendChild(loadingDiv);
         chatContainer.scrollTop = chatContainer.scrollHeight;
 
+        if (socket && socket.readyState === WebSocket.OPEN) {
+            sendOverSocket(query, userMessage, loadingDiv);
+        } else {
+            sendOverHttp(query, userMessage);
+        }
+    }
+
+    function connectSocket() {
+        if (!('WebSocket' in window)) return;
+        const protocol = location.protocol === 'https:' ? 'wss' : 'ws';
+        const ws = new WebSocket(`${protocol}://${location.host}/ws`);
+        ws.onopen = function() {
+            socket = ws;
+        };
+        ws.onmessage = function(event) {
+            handleSocketEvent(JSON.parse(event.data));
+        };
+        ws.onclose = function() {
+            const wasOpen = socket === ws;
+            socket = null;
+            // Las preguntas en curso se completan con lo que haya quedado guardado
+            Object.keys(questions).forEach(id => finishQuestion(id));
+            // Sin servidor async nunca llega a abrirse: se queda en POST /chat
+            if (wasOpen) {
+                setTimeout(connectSocket, 3000);
+            }
+        };
+    }
+
+    function sendOverSocket(query, userMessage, answerDiv) {
+        const id = String(++questionId);
+        answerDiv.removeAttribute('id');
+        questions[id] = { userMessage: userMessage, answerDiv: answerDiv, text: '' };
+        socket.send(JSON.stringify({ type: 'question', id: id, query: query }));
+    }
+
+    function handleSocketEvent(event) {
+        const question = questions[event.id];
+        if (!question) {
+            if (event.type === 'error') console.error('Error:', event.error);
+            return;
+        }
+        if (event.type === 'ack') {
+            question.answerDiv.textContent = 'Generando respuesta...';
+        } else if (event.type === 'token') {
+            question.text += event.text;
+            question.answerDiv.innerHTML = question.text.replace(/\\n/g, '<br>');
+            chatContainer.scrollTop = chatContainer.scrollHeight;
+        } else if (event.type === 'done') {
+            question.answerDiv.innerHTML = event.response.replace(/\\n/g, '<br>');
+            finishQuestion(event.id);
+        } else if (event.type === 'error') {
+            finishQuestion(event.id, event.error);
+        }
+    }
+
+    function finishQuestion(id, error) {
+        const question = questions[id];
+        delete questions[id];
+        pending--;
+        if (error) {
+            // Aviso de sobrecarga: la pregunta no se guardó
+            question.answerDiv.remove();
+            question.userMessage.classList.remove('pending');
+            addMessageToUI('assistant', error);
+        } else {
+            // La respuesta mostrada se reemplaza por la transcripción guardada
+            question.answerDiv.classList.add('pending');
+            syncMessages();
+        }
+    }
+
+    function sendOverHttp(query, userMessage) {
         // Enviar solicitud al servidor
         fetch('/chat', {
             method: 'POST',
@@ -160,16 +378,25 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .then(response => response.json())
         .then(data => {
+            pending--;
             // Eliminar indicador de carga
             const loadingMessage = document.getElementById('loading-message');
             if (loadingMessage) {
                 loadingMessage.remove();
             }
 
-            // Mostrar respuesta
-            addMessageToUI('assistant', data.response);
+            if (data.response) {
+                // Traer solo los mensajes nuevos ya guardados (pregunta y respuesta)
+                syncMessages();
+            } else {
+                // Aviso de sobrecarga: la pregunta no se guardó
+                userMessage.classList.remove('pending');
+                addMessageToUI('assistant', data.error);
+            }
         })
         .catch(error => {
+            pending--;
+            userMessage.classList.remove('pending');
             console.error('Error:', error);
 
             // Eliminar indicador de carga
@@ -186,16 +413,27 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    function addMessageToUI(role, content) {
+    function renderMessage(role, content) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${role}-message`;
 
         // Formatear contenido con saltos de línea
         const formattedContent = content.replace(/\\n/g, '<br>');
         messageDiv.innerHTML = formattedContent;
+        return messageDiv;
+    }
 
+    function addMessageToUI(role, content) {
+        const messageDiv = renderMessage(role, content);
         chatContainer.appendChild(messageDiv);
         chatContainer.scrollTop = chatContainer.scrollHeight;
+        return messageDiv;
+    }
+
+    function updateOlderButton(cursor) {
+        olderCursor = cursor;
+        loadOlder.classList.toggle('d-none', !cursor);
+        loadOlder.disabled = false;
     }
 
     function loadMessages() {
@@ -207,12 +445,61 @@ document.addEventListener('DOMContentLoaded', function() {
                     data.messages.forEach(message => {
                         addMessageToUI(message.role, message.content);
                     });
+                    updateOlderButton(data.next_cursor);
+                    latestCursor = data.latest_cursor;
                 }
             })
             .catch(error => {
                 console.error('Error al cargar mensajes:', error);
             });
     }
+
+    function syncMessages() {
+        // El navegador revalida con If-None-Match: sin cambios, el servidor responde 304
+        fetch(`/messages?since=${encodeURIComponent(latestCursor || '')}`)
+            .then(response => response.json())
+            .then(data => {
+                if (!data.messages) return;
+                if (data.messages.length) {
+                    // Si la pregunta no se guardó (turno fallido), se conserva la local
+                    const saved = data.messages.some(m => m.role === 'user');
+                    chatContainer.querySelectorAll('.pending').forEach(el => {
+                        saved ? el.remove() : el.classList.remove('pending');
+                    });
+                    data.messages.forEach(message => {
+                        addMessageToUI(message.role, message.content);
+                    });
+                }
+                latestCursor = data.latest_cursor || latestCursor;
+                if (data.has_more) {
+                    syncMessages();
+                }
+            })
+            .catch(error => {
+                console.error('Error al buscar mensajes nuevos:', error);
+            });
+    }
+
+    // Cargar páginas anteriores bajo demanda
+    loadOlder.addEventListener('click', function() {
+        if (!olderCursor) return;
+        loadOlder.disabled = true;
+        fetch(`/messages?cursor=${encodeURIComponent(olderCursor)}`)
+            .then(response => response.json())
+            .then(data => {
+                const first = chatContainer.firstChild;
+                (data.messages || []).forEach(message => {
+                    chatContainer.insertBefore(
+                        renderMessage(message.role, message.content), first
+                    );
+                });
+                updateOlderButton(data.next_cursor);
+            })
+            .catch(error => {
+                console.error('Error al cargar mensajes:', error);
+                loadOlder.disabled = false;
+            });
+    });
 });
 </script>
 {% endblock %}""")
@@ -230,30 +517,113 @@ document.addEventListener('DOMContentLoaded', function() {
 
         <a href="/new_session" class="btn btn-primary mb-3">Nueva Sesión</a>
 
-        <div class="list-group">
+        <div class="list-group" id="sessions-list">
             {% if sessions %}
                 {% for s in sessions %}
-                <a href="/session/{{ s.id }}" 
+                <a href="/session/{{ s.id }}"
                    class="list-group-item list-group-item-action">
                     <div class="d-flex w-100 justify-content-between">
-                        <h5 class="mb-1">Sesión #{{ loop.index }}</h5>
+                        <h5 class="mb-1">
+                            Sesión #{{ (s.id|string)[:8] }}
+                            <span class="badge bg-secondary">{{ s.message_count }}</span>
+                        </h5>
                         <small>
-                            Actualizado: 
+                            Actualizado:
                             {{ s.updated_at.strftime('%d/%m/%Y %H:%M') }}
                         </small>
                     </div>
                     <p class="mb-1">
                         Creado: {{ s.created_at.strftime('%d/%m/%Y %H:%M') }}
                     </p>
+                    {% if s.last_message %}
+                    <small class="text-muted">{{ s.last_message }}</small>
+                    {% endif %}
                 </a>
                 {% endfor %}
             {% else %}
                 <div class="alert alert-info">No hay sesiones disponibles.</div>
             {% endif %}
         </div>
+
+        {% if next_cursor %}
+        <button class="btn btn-outline-secondary mt-3" id="load-more"
+                data-cursor="{{ next_cursor }}">Cargar más</button>
+        {% endif %}
     </div>
 </div>
-{% endblock %}""")
+{% endblock %}
+
+{% block scripts %}
+<script>
+document.addEventListener('DOMContentLoaded', function() {
+    const list = document.getElementById('sessions-list');
+    const loadMore = document.getElementById('load-more');
+    if (!loadMore) return;
+
+    function formatDate(iso) {
+        const d = new Date(iso);
+        const pad = n => String(n).padStart(2, '0');
+        return `${pad(d.getDate())}/${pad(d.getMonth() + 1)}/${d.getFullYear()} ` +
+               `${pad(d.getHours())}:${pad(d.getMinutes())}`;
+    }
+
+    function addSession(s) {
+        const item = document.createElement('a');
+        item.href = `/session/${s.id}`;
+        item.className = 'list-group-item list-group-item-action';
+
+        const header = document.createElement('div');
+        header.className = 'd-flex w-100 justify-content-between';
+        const title = document.createElement('h5');
+        title.className = 'mb-1';
+        title.textContent = `Sesión #${s.id.substring(0, 8)} `;
+        const badge = document.createElement('span');
+        badge.className = 'badge bg-secondary';
+        badge.textContent = s.message_count;
+        title.appendChild(badge);
+        const updated = document.createElement('small');
+        updated.textContent = `Actualizado: ${formatDate(s.updated_at)}`;
+        header.appendChild(title);
+        header.appendChild(updated);
+
+        const created = document.createElement('p');
+        created.className = 'mb-1';
+        created.textContent = `Creado: ${formatDate(s.created_at)}`;
+
+        item.appendChild(header);
+        item.appendChild(created);
+        if (s.last_message) {
+            const preview = document.createElement('small');
+            preview.className = 'text-muted';
+            preview.textContent = s.last_message;
+            item.appendChild(preview);
+        }
+        list.appendChild(item);
+    }
+
+    // Cargar la página siguiente bajo demanda
+    loadMore.addEventListener('click', function() {
+        loadMore.disabled = true;
+        fetch(`/api/sessions?cursor=${encodeURIComponent(loadMore.dataset.cursor)}`)
+            .then(response => response.json())
+            .then(data => {
+                (data.sessions || []).forEach(addSession);
+                if (data.next_cursor) {
+                    loadMore.dataset.cursor = data.next_cursor;
+                    loadMore.disabled = false;
+                } else {
+                    loadMore.remove();
+                }
+            })
+            .catch(error => {
+                console.error('Error al cargar sesiones:', error);
+                loadMore.disabled = false;
+            });
+    });
+});
+</script>
+{% endblock %}
+""")
 
     # Plantilla para ver una sesión específica
     with open(os.path.join(templates_dir, 'session.html'), 'w') as f:
@@ -269,7 +639,12 @@ document.addEventListener('DOMContentLoaded', function() {
         <a href="/" class="btn btn-primary mb-3">Continuar esta conversación</a>
         <a href="/sessions" class="btn btn-secondary mb-3 ms-2">Volver a la lista</a>
 
-        <div class="chat-container">
+        {% if next_cursor %}
+        <button class="btn btn-outline-secondary btn-sm mb-2 d-block" id="load-older"
+                data-cursor="{{ next_cursor }}">Cargar mensajes anteriores</button>
+        {% endif %}
+
+        <div class="chat-container" id="chat-container">
             {% if messages %}
                 {% for message in messages %}
                 <div class="message {{ message.role }}-message">
@@ -282,15 +657,55 @@ document.addEventListener('DOMContentLoaded', function() {
         </div>
     </div>
 </div>
-{% endblock %}""")
+{% endblock %}
 
+{% block scripts %}
+<script>
+document.addEventListener('DOMContentLoaded', function() {
+    const chatContainer = document.getElementById('chat-container');
+    const loadOlder = document.getElementById('load-older');
+    if (!loadOlder) return;
+
+    // Cargar páginas anteriores bajo demanda
+    loadOlder.addEventListener('click', function() {
+        loadOlder.disabled = true;
+        fetch(`/messages?cursor=${encodeURIComponent(loadOlder.dataset.cursor)}`)
+            .then(response => response.json())
+            .then(data => {
+                const first = chatContainer.firstChild;
+                (data.messages || []).forEach(message => {
+                    const messageDiv = document.createElement('div');
+                    messageDiv.className = `message ${message.role}-message`;
+                    messageDiv.innerHTML = message.content.replace(/\\n/g, '<br>');
+                    chatContainer.insertBefore(messageDiv, first);
+                });
+                if (data.next_cursor) {
+                    loadOlder.dataset.cursor = data.next_cursor;
+                    loadOlder.disabled = false;
+                } else {
+                    loadOlder.remove();
+                }
+            })
+            .catch(error => {
+                console.error('Error al cargar mensajes:', error);
+                loadOlder.disabled = false;
+            });
+    });
+});
+</script>
+{% endblock %}
+""")
 
-def create_app(config_path=None):
+
+def create_app(config_path=None, fixtures=None):
     """
     Crea y configura la aplicación Flask.
     
     Args:
-        config_path: Ruta al archivo de configuración
+        config_path: Ruta al archivo de configuración; None para usar
+            ``RAG_CONFIG_PATH`` o el config.yaml del proyecto
+        fixtures: Modo de grabación o reproducción que reemplaza a
+            ``fixtures.mode``; None para usar ``RAG_FIXTURES_MODE`` o la configuración
         
     Returns:
         Aplicación Flask configurada
@@ -300,59 +715,61 @@ def create_app(config_path=None):
     
     # Cargar configuración
     if config_path is None:
-        config_path = Path(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config.yaml'))
+        config_path = os.environ.get(ENV_CONFIG_PATH) or Path(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config.yaml'))
     
     config = load_config(config_path)
+    fixtures = fixtures or os.environ.get(ENV_FIXTURES_MODE)
+    if fixtures:
+        config.setdefault('fixtures', {})['mode'] = fixtures
     
-    # Inicializar componentes
-    # Configurar VectorStore con el proveedor de embeddings adecuado
-    embedding_provider = config['embeddings']['provider']
-    
-    if embedding_provider == 'ollama':
-        vector_store = VectorStore(
-            host=config['qdrant']['host'],
-            port=config['qdrant']['port'],
-            collection_name=config['qdrant']['collection_name'],
-            embedding_provider='ollama',
-            ollama_url=config['ollama']['url']
-        )
-    elif embedding_provider == 'openai':
-        vector_store = VectorStore(
-            host=config['qdrant']['host'],
-            port=config['qdrant']['port'],
-            collection_name=config['qdrant']['collection_name'],
-            embedding_provider='openai',
-            openai_api_key=config['embeddings']['openai_api_key'],
-            openai_model=config['embeddings']['openai_model']
-        )
-    else:
-        logger.error(f"Proveedor de embeddings no soportado: {embedding_provider}")
-        raise ValueError(f"Proveedor de embeddings no soportado: {embedding_provider}")
-    
-    # Selección de modelo de chat
-    chat_model = config['ollama']['model_name']
-    chat_url = config['ollama']['url']
-    if 'bitnet' in config and config['bitnet'].get('model_name'):
-        chat_model = config['bitnet']['model_name']
-        chat_url = ""
-    
-    chat_manager = ChatManager(
-        qdrant_client=vector_store,
-        db_connection=config['postgres']['connection_string'],
-        ollama_url=chat_url,
-        model_name=chat_model
-    )
+    # Inicializar componentes en segundo plano: Qdrant o Postgres lentos no
+    # bloquean el arranque y las sondas de salud responden desde el inicio
+    app.config['RAG_CONFIG'] = config
+    app.extensions['chat_manager'] = None
+    admission = AdmissionController.from_config(config)
+    app.extensions['admission'] = admission
+    health = HealthChecker.from_config(config)
+    app.extensions['health'] = health
+    threading.Thread(
+        target=initialize_services, args=(app, config, health),
+        name='rag-init', daemon=True
+    ).start()
+    
+    def get_chat_manager():
+        """Gestor de chat inicializado (las rutas solo se atienden cuando está listo)"""
+        return app.extensions['chat_manager']
     
     # Crear plantillas si no existen
     create_templates()
     
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+    
+    @app.before_request
+    def require_ready():
+        if request.endpoint in OPEN_ENDPOINTS or health.ready.is_set():
+            return None
+        return jsonify({'error': 'El servicio se está iniciando'}), 503, {'Retry-After': '5'}
+    
+    @app.after_request
+    def observe_request(response):
+        # La regla de la ruta (no la URL) mantiene acotadas las etiquetas
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUESTS.labels(endpoint=endpoint, method=request.method,
+                             status=response.status_code).inc()
+        if 'request_start' in g:
+            HTTP_SECONDS.labels(endpoint=endpoint).observe(time.perf_counter() - g.request_start)
+        return response
+    
     # Rutas
     @app.route('/')
     def index():
         """Página principal"""
         # Si no hay una sesión de chat activa, crear una
         if 'chat_session_id' not in session:
-            chat_session_id = chat_manager.create_session()
+            chat_session_id = get_chat_manager().create_session()
             if chat_session_id:
                 session['chat_session_id'] = chat_session_id
             else:
@@ -373,21 +790,73 @@ def create_app(config_path=None):
     
         query = data['query']
     
-        # Generar respuesta
-        response = chat_manager.generate_response(
-            session['chat_session_id'], 
-            query
-        )
+        # Generar respuesta (con control de admisión)
+        try:
+            with admission.admit(session['chat_session_id']):
+                response = get_chat_manager().generate_response(
+                    session['chat_session_id'], 
+                    query
+                )
+        except ErrorSobrecarga as e:
+            body, headers = overload_response(e)
+            return jsonify(body), 429, headers
     
         return jsonify({
             'response': response
         })
     
+    @app.route('/healthz')
+    def healthz():
+        """Liveness: el proceso está en marcha"""
+        return jsonify(health.liveness())
+    
+    @app.route('/readyz')
+    def readyz():
+        """Readiness: inicialización completa y dependencias con su latencia"""
+        ready, body = health.readiness()
+        return jsonify(body), 200 if ready else 503
+    
+    @app.route('/status/admission')
+    def admission_status():
+        """Estado de la cola de admisión del chat (profundidad, esperas, rechazos)"""
+        return jsonify(admission.snapshot())
+    
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Métricas del proceso en formato de texto de Prometheus"""
+        return Response(metrics.REGISTRY.exposition(), mimetype=metrics.CONTENT_TYPE)
+    
     @app.route('/sessions')
     def list_sessions():
-        """Listar sesiones de chat"""
-        sessions = chat_manager.get_sessions()
-        return render_template('sessions.html', sessions=sessions)
+        """Listar sesiones de chat (primera página)"""
+        page = get_chat_manager().get_sessions_page(limit=_page_limit())
+        return render_template(
+            'sessions.html',
+            sessions=page['sessions'],
+            next_cursor=page['next_cursor']
+        )
+    
+    @app.route('/api/sessions')
+    def api_sessions():
+        """Página siguiente de sesiones en JSON (para AJAX)"""
+        try:
+            page = get_chat_manager().get_sessions_page(
+                limit=_page_limit(),
+                cursor=request.args.get('cursor')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        sessions = [
+            {
+                'id': str(s['id']),
+                'created_at': s['created_at'].isoformat(),
+                'updated_at': s['updated_at'].isoformat(),
+                'message_count': s['message_count'],
+                'last_message': s['last_message'],
+            }
+            for s in page['sessions']
+        ]
+        return jsonify({'sessions': sessions, 'next_cursor': page['next_cursor']})
     
     @app.route('/session/<session_id>')
     def view_session(session_id):
@@ -395,19 +864,20 @@ def create_app(config_path=None):
         # Establecer la sesión activa
         session['chat_session_id'] = session_id
     
-        # Obtener mensajes
-        messages = chat_manager.get_session_messages(session_id)
+        # Obtener la página de mensajes más recientes
+        page = get_chat_manager().get_messages_page(session_id, limit=_page_limit())
     
         return render_template(
             'session.html', 
-            messages=messages, 
+            messages=page['messages'], 
+            next_cursor=page['next_cursor'],
             session_id=session_id
         )
     
     @app.route('/new_session')
     def new_session():
         """Crear una nueva sesión"""
-        chat_session_id = chat_manager.create_session()
+        chat_session_id = get_chat_manager().create_session()
         if chat_session_id:
             session['chat_session_id'] = chat_session_id
             return redirect(url_for('index'))
@@ -416,27 +886,68 @@ def create_app(config_path=None):
     
     @app.route('/messages')
     def get_messages():
-        """Obtener mensajes de la sesión actual (para AJAX)"""
+        """Obtener mensajes de la sesión actual (para AJAX)
+        
+        ``?since=<cursor>`` devuelve solo los mensajes posteriores al cursor;
+        ``?cursor=<cursor>`` devuelve la página de mensajes anteriores.
+        """
         if 'chat_session_id' not in session:
             return jsonify({'error': 'No hay sesión de chat activa'}), 400
+        chat_session_id = session['chat_session_id']
     
-        messages = chat_manager.get_session_messages(session['chat_session_id'])
-        return jsonify({'messages': messages})
+        # La versión se lee antes que los mensajes: si cambia en medio, el
+        # próximo pedido con este ETag no coincidirá y se vuelve a consultar
+        version = get_chat_manager().get_session_version(chat_session_id)
+        etag = messages_etag(chat_session_id, version) if version else None
+        if etag and request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            try:
+                if 'since' in request.args:
+                    page = get_chat_manager().get_messages_since(
+                        chat_session_id,
+                        since=request.args.get('since'),
+                        limit=_page_limit()
+                    )
+                else:
+                    page = get_chat_manager().get_messages_page(
+                        chat_session_id,
+                        limit=_page_limit(),
+                        cursor=request.args.get('cursor')
+                    )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            response = jsonify(page)
+        if etag:
+            response.set_etag(etag)
+        # El navegador debe revalidar siempre; la respuesta depende de la cookie de sesión
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+        return response
     
     return app
 
 
-def run_app(host='0.0.0.0', port=5000, debug=True):
+def run_app(host='0.0.0.0', port=5000, debug=True, server='flask', workers=1,
+            config_path=None, fixtures=None):
     """
     Ejecuta la aplicación web.
     
     Args:
         host: Host donde escuchar
         port: Puerto donde escuchar
-        debug: Modo debug
+        debug: Modo debug (solo para el servidor de desarrollo de Flask)
+        server: 'flask' (servidor de desarrollo) o 'async' (ASGI con uvicorn)
+        workers: Cantidad de procesos worker en modo 'async'
+        config_path: Ruta al archivo de configuración
+        fixtures: Modo de grabación o reproducción (``--fixtures``)
     """
-    app = create_app()
-    app.run(host=host, port=port, debug=debug)
+    if server == 'async':
+        from web.asgi import run_async_app
+        run_async_app(host=host, port=port, workers=workers, config_path=config_path, fixtures=fixtures)
+        return
+    app = create_app(config_path, fixtures=fixtures)
+    app.run(host=host, port=port, debug=debug, threaded=True)
 
 
 if __name__ == '__main__':
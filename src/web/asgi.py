@@ -0,0 +1,205 @@
+"""
+Modo de servicio asíncrono (ASGI) para la aplicación web.
+
+Los endpoints de chat se atienden en un event loop: la llamada al LLM es
+asíncrona y las etapas bloqueantes cortas usan un pool de hilos acotado, por
+lo que un proceso puede mantener cientos de turnos en vuelo. El resto de las
+rutas (páginas, sesiones, mensajes) las sigue atendiendo la aplicación Flask
+montada como WSGI.
+
+``/ws`` ofrece además un canal WebSocket persistente por sesión de chat que
+transporta las preguntas, la respuesta token a token y los acuses de recibo.
+"""
+import asyncio
+import contextlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.requests import HTTPConnection, Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from core.utils import configurar_logging
+from core.errors import ErrorSobrecarga
+from core import metrics
+from web.app import (
+    ENV_CONFIG_PATH, ENV_FIXTURES_MODE, HTTP_REQUESTS, HTTP_SECONDS, create_app, overload_response
+)
+
+logger = configurar_logging("web_asgi")
+
+WS_CONNECTIONS = metrics.gauge(
+    'rag_websocket_connections', 'Conexiones WebSocket de chat abiertas')
+
+
+def _chat_session_id(flask_app, request: HTTPConnection):
+    """
+    Lee el ID de sesión de chat desde la cookie de sesión firmada por Flask.
+
+    Args:
+        flask_app: Aplicación Flask que firmó la cookie
+        request: Petición o conexión WebSocket ASGI
+
+    Returns:
+        ID de la sesión de chat o None si no hay sesión válida
+    """
+    cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not cookie:
+        return None
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if serializer is None:
+        return None
+    try:
+        max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        return serializer.loads(cookie, max_age=max_age).get('chat_session_id')
+    except Exception:
+        return None
+
+
+def create_asgi_app(config_path=None, fixtures=None):
+    """
+    Crea la aplicación ASGI con los endpoints de chat asíncronos.
+
+    Args:
+        config_path: Ruta al archivo de configuración (ver ``create_app``)
+        fixtures: Modo de grabación o reproducción (ver ``create_app``)
+
+    Returns:
+        Aplicación Starlette lista para servir con uvicorn
+    """
+    flask_app = create_app(config_path, fixtures=fixtures)
+    admission = flask_app.extensions['admission']
+    health = flask_app.extensions['health']
+    web_config = flask_app.config['RAG_CONFIG'].get('web') or {}
+    threads = int(web_config.get('threads', 32))
+
+    async def chat(request: Request):
+        """Endpoint asíncrono para el chat"""
+        inicio = time.perf_counter()
+        response = await _chat(request)
+        HTTP_REQUESTS.labels(endpoint='/chat', method='POST', status=response.status_code).inc()
+        HTTP_SECONDS.labels(endpoint='/chat').observe(time.perf_counter() - inicio)
+        return response
+
+    async def _chat(request: Request):
+        if not health.ready.is_set():
+            return JSONResponse({'error': 'El servicio se está iniciando'}, status_code=503,
+                                headers={'Retry-After': '5'})
+        chat_manager = flask_app.extensions['chat_manager']
+        session_id = _chat_session_id(flask_app, request)
+        if not session_id:
+            return JSONResponse({'error': 'No hay sesión de chat activa'}, status_code=400)
+
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not data or 'query' not in data:
+            return JSONResponse({'error': 'Se requiere una consulta'}, status_code=400)
+
+        try:
+            async with admission.aadmit(session_id):
+                response = await chat_manager.agenerate_response(session_id, data['query'])
+        except ErrorSobrecarga as e:
+            body, headers = overload_response(e)
+            return JSONResponse(body, status_code=429, headers=headers)
+        return JSONResponse({'response': response})
+
+    async def chat_ws(websocket: WebSocket):
+        """Canal WebSocket de chat: preguntas, tokens de la respuesta y acuses"""
+        if not health.ready.is_set():
+            # 1013: "Try Again Later"
+            await websocket.close(code=1013, reason='El servicio se está iniciando')
+            return
+        session_id = _chat_session_id(flask_app, websocket)
+        if not session_id:
+            await websocket.close(code=4400, reason='No hay sesión de chat activa')
+            return
+        await websocket.accept()
+        WS_CONNECTIONS.inc()
+        try:
+            # Una conexión inactiva solo ocupa esta corrutina esperando el próximo mensaje
+            while True:
+                try:
+                    data = await websocket.receive_json()
+                except ValueError:
+                    await websocket.send_json({'type': 'error', 'error': 'Mensaje inválido'})
+                    continue
+                await _answer_ws(websocket, session_id, data)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            WS_CONNECTIONS.dec()
+
+    async def _answer_ws(websocket: WebSocket, session_id, data):
+        """Atiende una pregunta recibida por el canal WebSocket"""
+        message_id = data.get('id') if isinstance(data, dict) else None
+        if not isinstance(data, dict) or data.get('type') != 'question' or not data.get('query'):
+            await websocket.send_json({'type': 'error', 'id': message_id, 'error': 'Se requiere una consulta'})
+            return
+        try:
+            async with admission.aadmit(session_id):
+                await websocket.send_json({'type': 'ack', 'id': message_id})
+                chat_manager = flask_app.extensions['chat_manager']
+                # Si el cliente se desconecta, aclosing cierra ya el stream del LLM y el turno
+                async with contextlib.aclosing(
+                        chat_manager.astream_response(session_id, data['query'])) as eventos:
+                    async for event in eventos:
+                        await websocket.send_json({**event, 'id': message_id})
+        except ErrorSobrecarga as e:
+            body, _ = overload_response(e)
+            await websocket.send_json({'type': 'error', 'id': message_id, **body})
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        # Las etapas bloqueantes del turno usan el executor por defecto del loop
+        executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='chat')
+        asyncio.get_running_loop().set_default_executor(executor)
+        logger.info(f"Servicio asíncrono iniciado con {threads} hilos para etapas bloqueantes")
+        yield
+        executor.shutdown(wait=False)
+
+    return Starlette(
+        routes=[
+            Route('/chat', chat, methods=['POST']),
+            WebSocketRoute('/ws', chat_ws),
+            Mount('/', app=WSGIMiddleware(flask_app, workers=threads)),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def run_async_app(host='0.0.0.0', port=5000, workers=1, config_path=None, fixtures=None):
+    """
+    Ejecuta la aplicación en modo asíncrono con uvicorn.
+
+    Con un solo worker la aplicación se crea en este proceso. Con varios,
+    uvicorn la crea en cada worker a partir de la fábrica, que recibe la
+    ruta de la configuración y el modo de fixtures por variables de entorno.
+
+    Args:
+        host: Host donde escuchar
+        port: Puerto donde escuchar
+        workers: Cantidad de procesos worker
+        config_path: Ruta al archivo de configuración
+        fixtures: Modo de grabación o reproducción (``--fixtures``)
+    """
+    import uvicorn
+    if workers <= 1:
+        uvicorn.run(create_asgi_app(config_path, fixtures=fixtures), host=host, port=port)
+        return
+    if config_path is not None:
+        os.environ[ENV_CONFIG_PATH] = os.path.abspath(str(config_path))
+    if fixtures:
+        os.environ[ENV_FIXTURES_MODE] = fixtures
+    uvicorn.run(
+        'web.asgi:create_asgi_app',
+        factory=True,
+        host=host,
+        port=port,
+        workers=workers,
+    )
@@ -0,0 +1,243 @@
+"""
+Sondas de salud (liveness) y disponibilidad (readiness) de la aplicación web.
+
+``/healthz`` solo indica que el proceso responde. ``/readyz`` indica si la
+aplicación terminó de inicializarse y si sus dependencias (Qdrant, Postgres,
+el proveedor de embeddings y el LLM) responden, con la latencia de cada una.
+Las sondas tienen un tiempo máximo y su resultado se cachea unos segundos
+para que el balanceador pueda consultarlas seguido sin cargar los servicios.
+
+Con ``fixtures.mode: replay`` las llamadas de embeddings y al LLM las
+responde el archivo de grabación, así que esas sondas no contactan a Ollama
+ni a OpenAI y se informan con la nota 'replay'. Qdrant y Postgres no se
+graban: la aplicación los usa de verdad en todos los modos y sus sondas
+siguen consultándolos.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import psycopg2
+import requests
+
+from core import metrics
+from rag.vector_store import OLLAMA_EMBEDDING_MODEL
+
+DEPENDENCY_UP = metrics.gauge(
+    'rag_dependency_up', 'Resultado de la última sonda de cada dependencia (1 = responde)', ['dependency'])
+DEPENDENCY_LATENCY = metrics.gauge(
+    'rag_dependency_latency_seconds', 'Latencia de la última sonda de cada dependencia', ['dependency'])
+READY = metrics.gauge(
+    'rag_ready', 'La aplicación terminó de inicializarse y acepta tráfico')
+
+
+class HealthChecker:
+    """
+    Estado de inicialización y sondas cacheadas de las dependencias
+    """
+    def __init__(self, config: Dict[str, Any], timeout: float = 2.0, cache_seconds: float = 5.0):
+        """
+        Inicializa el verificador de salud.
+
+        Args:
+            config: Configuración del sistema
+            timeout: Tiempo máximo de cada sonda en segundos
+            cache_seconds: Segundos durante los que se reutiliza el último resultado
+        """
+        self.config = config
+        self.timeout = timeout
+        self.cache_seconds = cache_seconds
+        self.started = time.time()
+        # Embeddings y LLM salen del archivo de grabación: no hay servicio que sondear
+        self.replay = (config.get('fixtures') or {}).get('mode') == 'replay'
+        self.ready = threading.Event()
+        self.startup_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._ultimo: Optional[Tuple[float, Dict[str, Dict[str, Any]]]] = None
+        READY.set_function(lambda: 1 if self.ready.is_set() else 0)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "HealthChecker":
+        """
+        Crea el verificador a partir de la sección ``health`` de la configuración.
+
+        Args:
+            config: Configuración del sistema
+
+        Returns:
+            Instancia de HealthChecker
+        """
+        health = config.get('health') or {}
+        return cls(
+            config,
+            timeout=float(health.get('probe_timeout_seconds', 2)),
+            cache_seconds=float(health.get('cache_seconds', 5))
+        )
+
+    def mark_ready(self):
+        """Marca la inicialización como completa: desde ahora se admite tráfico."""
+        self.startup_error = None
+        self.ready.set()
+
+    def mark_failed(self, error: str):
+        """
+        Registra el último error de inicialización.
+
+        Args:
+            error: Descripción del error
+        """
+        self.startup_error = error
+
+    def liveness(self) -> Dict[str, Any]:
+        """
+        Estado del proceso para ``/healthz``.
+
+        Returns:
+            Diccionario con estado, tiempo en marcha y si ya está listo
+        """
+        return {
+            'status': 'ok',
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'ready': self.ready.is_set(),
+        }
+
+    def readiness(self) -> Tuple[bool, Dict[str, Any]]:
+        """
+        Estado de disponibilidad para ``/readyz``.
+
+        Returns:
+            Tupla con (True si acepta tráfico, cuerpo con el detalle de cada dependencia)
+        """
+        checks = self.check_dependencies()
+        listo = self.ready.is_set() and all(c['ok'] for c in checks.values())
+        if listo:
+            status = 'ready'
+        elif not self.ready.is_set():
+            status = 'starting'
+        else:
+            status = 'degraded'
+        body: Dict[str, Any] = {'status': status, 'checks': checks}
+        if self.startup_error and not self.ready.is_set():
+            body['startup_error'] = self.startup_error
+        return listo, body
+
+    def check_dependencies(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Ejecuta las sondas en paralelo o devuelve el resultado cacheado.
+
+        Returns:
+            Diccionario dependencia -> {'ok', 'latency_ms', 'error'}
+        """
+        with self._lock:
+            if self._ultimo and time.monotonic() - self._ultimo[0] < self.cache_seconds:
+                return self._ultimo[1]
+            sondas: Dict[str, Callable[[], Optional[str]]] = {
+                'qdrant': self._probe_qdrant,
+                'postgres': self._probe_postgres,
+                'embeddings': self._probe_embeddings,
+                'llm': self._probe_llm,
+            }
+            executor = ThreadPoolExecutor(max_workers=len(sondas), thread_name_prefix='health')
+            futuros = {nombre: executor.submit(self._medir, sonda) for nombre, sonda in sondas.items()}
+            # Margen para que una sonda sin timeout propio no retenga la respuesta
+            wait(futuros.values(), timeout=self.timeout + 0.5)
+            executor.shutdown(wait=False)
+            resultados = {}
+            for nombre, futuro in futuros.items():
+                if futuro.done():
+                    resultados[nombre] = futuro.result()
+                else:
+                    resultados[nombre] = {'ok': False, 'latency_ms': None,
+                                          'error': f'Sin respuesta en {self.timeout}s'}
+                DEPENDENCY_UP.labels(dependency=nombre).set(1 if resultados[nombre]['ok'] else 0)
+                if resultados[nombre]['latency_ms'] is not None:
+                    DEPENDENCY_LATENCY.labels(dependency=nombre).set(resultados[nombre]['latency_ms'] / 1000)
+            self._ultimo = (time.monotonic(), resultados)
+            return resultados
+
+    def _medir(self, sonda: Callable[[], Optional[str]]) -> Dict[str, Any]:
+        """
+        Ejecuta una sonda midiendo su latencia.
+
+        Args:
+            sonda: Función que lanza una excepción si la dependencia no responde
+                y puede devolver una nota (por ejemplo, 'skipped')
+
+        Returns:
+            Resultado de la sonda
+        """
+        inicio = time.perf_counter()
+        try:
+            nota = sonda()
+            resultado: Dict[str, Any] = {'ok': True}
+            if nota:
+                resultado['note'] = nota
+        except Exception as e:
+            resultado = {'ok': False, 'error': str(e)}
+        resultado['latency_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+        return resultado
+
+    def _probe_qdrant(self):
+        """Consulta la colección configurada en Qdrant."""
+        qdrant = self.config['qdrant']
+        response = requests.get(
+            f"http://{qdrant['host']}:{qdrant['port']}/collections/{qdrant['collection_name']}",
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+
+    def _probe_postgres(self):
+        """Abre una conexión y ejecuta una consulta trivial."""
+        conn = psycopg2.connect(
+            self.config['postgres']['connection_string'],
+            connect_timeout=max(1, round(self.timeout))
+        )
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET statement_timeout = %s", (int(self.timeout * 1000),))
+                cur.execute("SELECT 1")
+        finally:
+            conn.close()
+
+    def _probe_embeddings(self):
+        """Verifica que el modelo de embeddings esté disponible."""
+        if self.replay:
+            return 'replay'
+        embeddings = self.config['embeddings']
+        if embeddings['provider'] == 'openai':
+            response = requests.get(
+                f"https://api.openai.com/v1/models/{embeddings['openai_model']}",
+                headers={'Authorization': f"Bearer {embeddings['openai_api_key']}"},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            return None
+        self._ollama_model(self.config['ollama']['url'], OLLAMA_EMBEDDING_MODEL)
+        return None
+
+    def _probe_llm(self):
+        """Verifica que el modelo de chat esté disponible en Ollama."""
+        if 'bitnet' in self.config and (self.config['bitnet'] or {}).get('model_name'):
+            return 'skipped'
+        if self.replay:
+            return 'replay'
+        self._ollama_model(self.config['ollama']['url'], self.config['ollama']['model_name'])
+        return None
+
+    def _ollama_model(self, url: str, modelo: str):
+        """
+        Comprueba que Ollama responde y tiene descargado el modelo.
+
+        Args:
+            url: URL de Ollama
+            modelo: Nombre del modelo (con o sin etiqueta)
+
+        Raises:
+            RuntimeError: Si el modelo no está disponible
+        """
+        response = requests.get(f"{url}/api/tags", timeout=self.timeout)
+        response.raise_for_status()
+        nombres = {m.get('name', '') for m in response.json().get('models', [])}
+        if modelo not in nombres and f"{modelo}:latest" not in nombres:
+            raise RuntimeError(f"Modelo {modelo} no disponible en Ollama")